@@ -0,0 +1,257 @@
+"""
+Historical backtest of the market investments against a local price series.
+
+Prices come from a local file of daily or monthly index closes with Date
+and Close columns. Only those two columns are read: Feather/Arrow files
+are memory-mapped, Parquet and CSV files are read column-wise by Arrow.
+Convert a CSV export once with
+
+    python backtest.py convert prices.csv index_prices.feather
+
+and replay a records file against it with
+
+    python backtest.py run finance_data.csv index_prices.feather
+
+Each month's "Expenses market" buys amount / price shares at the month's
+last close (negative months sell that amount, from the lots of lots.py),
+and the holdings are worth shares x the latest close. `rolling_backtest`
+replays the same contribution pattern from every start month the prices
+allow, in one pass over a sliding-window view of the monthly closes.
+Prices are taken to be in the currency of the amounts.
+"""
+import argparse
+import os
+
+import numpy as np
+
+from finance_core import month_label, month_ordinals, month_starts
+
+PRICE_COLUMNS = ["Date", "Close"]
+# datetime64[M] counts months from January 1970
+_EPOCH_ORDINAL = 1970 * 12
+
+
+def load_prices(path):
+    """
+    Read index closes.
+
+    Parameters:
+    path (str): .feather/.arrow, .parquet or .csv file with PRICE_COLUMNS
+
+    Returns:
+    tuple: (dates, closes) as datetime64[ns] and float64 arrays sorted by
+        date, one close per date (the file's last for repeated dates)
+    """
+    import pandas as pd
+    import pyarrow as pa
+
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        if extension in (".feather", ".arrow"):
+            import pyarrow.feather as feather
+
+            table = feather.read_table(path, columns=PRICE_COLUMNS, memory_map=True)
+        elif extension == ".parquet":
+            import pyarrow.parquet as parquet
+
+            table = parquet.read_table(path, columns=PRICE_COLUMNS, memory_map=True)
+        elif extension == ".csv":
+            import pyarrow.csv as csv
+
+            table = csv.read_csv(path, convert_options=csv.ConvertOptions(include_columns=PRICE_COLUMNS))
+        else:
+            raise ValueError(f"Unsupported price file {path}; use .feather, .arrow, .parquet or .csv")
+    except (KeyError, pa.ArrowInvalid) as error:
+        raise ValueError(f"Cannot read {' and '.join(PRICE_COLUMNS)} from {path}: {error}") from error
+
+    dates = pd.to_datetime(table.column("Date").to_pandas()).to_numpy(dtype="datetime64[ns]")
+    closes = table.column("Close").to_numpy().astype(np.float64)
+    if np.isnat(dates).any():
+        raise ValueError(f"{path}: every row needs a Date")
+    if not (np.isfinite(closes) & (closes > 0)).all():
+        raise ValueError(f"{path}: closes must be positive numbers")
+
+    if not len(closes):
+        raise ValueError(f"{path} has no prices")
+
+    order = np.argsort(dates, kind="stable")
+    dates, closes = dates[order], closes[order]
+    last = np.append(dates[1:] != dates[:-1], True)
+    return dates[last], closes[last]
+
+
+def month_closes(dates, closes):
+    """
+    Last close of every month from the first price to the latest.
+
+    Months without a price carry the previous close.
+
+    Returns:
+    tuple: (ordinals, closes) arrays, one entry per month
+    """
+    months = np.arange(dates[0].astype("datetime64[M]"), dates[-1].astype("datetime64[M]") + 1)
+    month_ends = (months + 1).astype("datetime64[ns]")
+    return months.astype(np.int64) + _EPOCH_ORDINAL, closes[np.searchsorted(dates, month_ends) - 1]
+
+
+def _market_flows(df):
+    """Months with a market investment and their amounts, in month order."""
+    amounts = df["Expenses market"].to_numpy(dtype=float)
+    flow_ordinals = month_ordinals(df)
+    traded = np.flatnonzero(np.nan_to_num(amounts) != 0)
+    if not traded.size:
+        raise ValueError("No market investments to replay")
+    order = traded[np.argsort(flow_ordinals[traded], kind="stable")]
+    return flow_ordinals[order], amounts[order]
+
+
+def backtest(df, dates, closes, method="fifo"):
+    """
+    Replay the market investments against the prices.
+
+    Parameters:
+    df (DataFrame): Monthly records; it is not modified
+    dates (ndarray): load_prices dates
+    closes (ndarray): load_prices closes
+    method (str): How withdrawals pick lots, "fifo" or "lifo"
+
+    Returns:
+    dict: "ordinals", "value" and "contributed" (month by month from the
+        first investment to the latest price), "portfolio" (value, cost
+        basis, gains, tax and after-tax value at the latest close) and
+        "realized" (gains and tax of the withdrawals)
+    """
+    from lots import LotBook
+
+    ordinals, monthly = month_closes(dates, closes)
+    flow_ordinals, amounts = _market_flows(df)
+    if flow_ordinals[0] < ordinals[0] or flow_ordinals[-1] > ordinals[-1]:
+        raise ValueError(
+            f"Prices cover {month_label(ordinals[0])} to {month_label(ordinals[-1])}, but market "
+            f"investments run from {month_label(flow_ordinals[0])} to {month_label(flow_ordinals[-1])}"
+        )
+    prices = monthly[flow_ordinals - ordinals[0]]
+
+    bought, sold = amounts > 0, amounts < 0
+    book = LotBook(flow_ordinals[bought], amounts[bought] / prices[bought], prices[bought])
+    # Withdrawals beyond the shares held empty the portfolio
+    sold_shares = book.sell(
+        flow_ordinals[sold], -amounts[sold] / prices[sold], prices[sold], method=method, clip=True
+    )
+    value, basis, gains, tax = (part.sum() for part in book.unrealized(closes[-1]))
+    realized_gains, realized_tax = (part.sum() for part in book.realized())
+
+    # Shares held and cash put in, month by month
+    start = flow_ordinals[0]
+    months = ordinals[-1] - start + 1
+    buys, sells = flow_ordinals[bought] - start, flow_ordinals[sold] - start
+    held = np.cumsum(
+        np.bincount(buys, weights=book.shares, minlength=months)
+        - np.bincount(sells, weights=sold_shares, minlength=months)
+    )
+    contributed = np.cumsum(
+        np.bincount(buys, weights=amounts[bought], minlength=months)
+        - np.bincount(sells, weights=sold_shares * prices[sold], minlength=months)
+    )
+    return {
+        "ordinals": ordinals[start - ordinals[0]:],
+        "value": held * monthly[start - ordinals[0]:],
+        "contributed": contributed,
+        "portfolio": (value, basis, gains, tax, value - tax),
+        "realized": (realized_gains, realized_tax),
+    }
+
+
+def rolling_backtest(df, dates, closes):
+    """
+    The contribution pattern replayed from every possible start month.
+
+    The pattern is each month's "Expenses market" from the first market
+    investment to the last, gaps included. Window w starts it at the w-th
+    priced month and is valued at the close of its last month. Shares for
+    all windows come from one (windows x months) sliding view of the
+    inverse closes; withdrawals larger than a window's holdings are cut
+    down with a running minimum of the shortfall, as in lots.LotBook.
+
+    Parameters:
+    df (DataFrame): Monthly records; it is not modified
+    dates (ndarray): load_prices dates
+    closes (ndarray): load_prices closes
+
+    Returns:
+    DataFrame: "Start", "End" (first days of the months), "Value",
+        "Contributed" and "Gains", one row per window
+    """
+    import pandas as pd
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    ordinals, monthly = month_closes(dates, closes)
+    flow_ordinals, amounts = _market_flows(df)
+    length = flow_ordinals[-1] - flow_ordinals[0] + 1
+    if length > len(monthly):
+        raise ValueError(
+            f"Prices cover {len(monthly)} months, fewer than the {length} months of market investments"
+        )
+    pattern = np.bincount(flow_ordinals - flow_ordinals[0], weights=amounts, minlength=length)
+
+    inverse = sliding_window_view(1.0 / monthly, length)
+    buys = np.maximum(pattern, 0.0)
+    if (pattern < 0).any():
+        bought = np.cumsum(inverse * buys, axis=1)
+        wanted = np.cumsum(inverse * np.maximum(-pattern, 0.0), axis=1)
+        sold = wanted + np.minimum.accumulate(np.minimum(bought - wanted, 0.0), axis=1)
+        shares = bought[:, -1] - sold[:, -1]
+        sold_by_month = np.diff(sold, axis=1, prepend=0.0)
+        contributed = buys.sum() - np.einsum("wm,wm->w", sold_by_month, sliding_window_view(monthly, length))
+    else:
+        shares = inverse @ buys
+        contributed = np.full(len(shares), buys.sum())
+    value = shares * monthly[length - 1:]
+
+    return pd.DataFrame({
+        "Start": month_starts(ordinals[:len(value)]),
+        "End": month_starts(ordinals[length - 1:]),
+        "Value": value,
+        "Contributed": contributed,
+        "Gains": value - contributed,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtests against local index prices")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert_parser = commands.add_parser("convert", help="Write a price file as memory-mappable Feather")
+    convert_parser.add_argument("source", help="Price file with Date and Close columns")
+    convert_parser.add_argument("target", help="Feather file to write")
+    run_parser = commands.add_parser("run", help="Backtest a records file")
+    run_parser.add_argument("records", help="Records file of any storage backend (.csv, .feather or .sqlite)")
+    run_parser.add_argument("prices", help="Price file with Date and Close columns")
+    run_parser.add_argument("--method", choices=["fifo", "lifo"], default="fifo")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        import pyarrow as pa
+        import pyarrow.feather as feather
+
+        dates, closes = load_prices(args.source)
+        table = pa.table({"Date": dates, "Close": closes})
+        # Uncompressed, so reads can map the file instead of decoding it
+        feather.write_feather(table, args.target, compression="uncompressed")
+        print(f"Wrote {len(closes):,} closes to {args.target}")
+    elif args.command == "run":
+        from storage import open_store
+
+        # Through the store, so edits still in its journal are replayed too
+        records = open_store(args.records).data
+        dates, closes = load_prices(args.prices)
+        result = backtest(records, dates, closes, args.method)
+        value, basis, gains, tax, after_tax = result["portfolio"]
+        print(f"value {value:,.2f}  cost basis {basis:,.2f}  gains {gains:,.2f}  after tax {after_tax:,.2f}")
+        rolling = rolling_backtest(records, dates, closes)
+        percentiles = np.percentile(rolling["Value"], [5, 50, 95])
+        print(f"{len(rolling):,} start months: value 5th {percentiles[0]:,.2f}  "
+              f"median {percentiles[1]:,.2f}  95th {percentiles[2]:,.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Memory held by the records frame, before and after the compact schema.
+
+    python benchmarks/bench_memory.py
+    python benchmarks/bench_memory.py --sizes 10000 100000
+
+For each history size this prints the deep memory usage of the records
+as `read_csv` used to return them (object and arrow-backed month strings,
+int64 years, float64 amounts) and of the compact frame in float64 and
+float32 amounts. The store's frame is shared by every session, so this is
+also what each additional session no longer holds.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_suite import synthetic_history  # noqa: E402
+from storage import DTYPES, compact_frame  # noqa: E402
+
+
+def megabytes(df):
+    return df.memory_usage(deep=True).sum() / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # The amount dtype is fixed at import, so each one runs in its own process
+        for rows in args.sizes:
+            print(f"{megabytes(compact_frame(synthetic_history(rows))):.2f}")
+        return
+
+    compact = {}
+    for amount_dtype in ("float64", "float32"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", "--sizes", *map(str, args.sizes)],
+            env={**os.environ, "FINANCE_AMOUNT_DTYPE": amount_dtype},
+            capture_output=True, text=True, check=True
+        ).stdout.split()
+        compact[amount_dtype] = [float(value) for value in output]
+
+    print(f"{'rows':>10}{'object MB':>12}{'arrow MB':>12}{'float64 MB':>12}{'float32 MB':>12}")
+    for position, rows in enumerate(args.sizes):
+        history = synthetic_history(rows).astype(DTYPES)
+        object_frame = history.astype({"Month": object})
+        print(
+            f"{rows:>10,}{megabytes(object_frame):12.2f}{megabytes(history):12.2f}"
+            f"{compact['float64'][position]:12.2f}{compact['float32'][position]:12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
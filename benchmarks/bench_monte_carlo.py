@@ -0,0 +1,45 @@
+"""
+Time the Monte Carlo projection at dashboard scale.
+
+    python benchmarks/bench_monte_carlo.py --paths 100000 --years 30 --workers 4
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from monte_carlo import monte_carlo_projection  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--paths", type=int, default=100_000)
+    parser.add_argument("--years", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        result = monte_carlo_projection(
+            current_portfolio=100_000,
+            monthly_contribution=3_000,
+            years=args.years,
+            yearly_return=7,
+            yearly_volatility=15,
+            paths=args.paths,
+            seed=0,
+            workers=args.workers
+        )
+        timings.append(time.perf_counter() - start)
+
+    print(f"{args.paths:,} paths x {args.years * 12} months, {args.workers} worker(s)")
+    print(f"best {min(timings):.3f}s  mean {sum(timings) / len(timings):.3f}s")
+    print("median final value: " + f"{result['final'][2]:,.2f}")
+
+
+if __name__ == "__main__":
+    main()
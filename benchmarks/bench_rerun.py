@@ -0,0 +1,81 @@
+"""
+Compare full-script reruns with fragment-scoped reruns of the dashboard.
+
+    python benchmarks/bench_rerun.py --months 2400 --repeat 5
+
+A synthetic history is written to a temporary directory and the page is
+driven headlessly with Streamlit's AppTest. "Full rerun" is what every
+projection slider tick cost before the page was split into fragments;
+"fragment rerun" reruns only the summary/projection fragment, as the
+browser now requests. AppTest has no public API for fragment reruns, so
+the runner's RerunData is patched to carry the fragment id.
+"""
+import argparse
+import functools
+import os
+import sys
+import tempfile
+import time
+
+from streamlit.runtime.scriptrunner_utils.script_requests import RerunData
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1 import local_script_runner
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_suite import synthetic_history  # noqa: E402
+from storage import write_snapshot  # noqa: E402
+
+
+def fragment_id(at, name):
+    """Id of the registered fragment wrapping the function called name."""
+    for fragment_id, fragment in at._fragment_storage._fragments.items():
+        if any(getattr(cell.cell_contents, "__name__", None) == name for cell in fragment.__closure__ or ()):
+            return fragment_id
+    raise LookupError(f"No fragment named {name}")
+
+
+def timed(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return min(timings), sum(timings) / len(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--months", type=int, default=2400)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        write_snapshot(synthetic_history(args.months), "finance_data.csv")
+
+        at = AppTest.from_file(os.path.join(ROOT, "personal_finance.py"), default_timeout=600)
+        at.run()
+        years = next(slider for slider in at.slider if slider.label == "Projection Years")
+
+        def full_rerun():
+            years.set_value(years.value % 30 + 1)
+            at.run()
+
+        full = timed(full_rerun, args.repeat)
+
+        valuation_id = fragment_id(at, "render_valuation")
+        local_script_runner.RerunData = functools.partial(RerunData, fragment_id_queue=[valuation_id])
+        try:
+            fragment = timed(full_rerun, args.repeat)
+        finally:
+            local_script_runner.RerunData = RerunData
+
+    print(f"{args.months:,} stored months, best/mean of {args.repeat}")
+    print(f"full rerun      {full[0] * 1000:8.1f} ms  {full[1] * 1000:8.1f} ms")
+    print(f"fragment rerun  {fragment[0] * 1000:8.1f} ms  {fragment[1] * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Cold start of the dashboard: import time, first run and rerun payload.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --months 2400 --repeat 5 --top 15
+
+Each repeat starts a fresh interpreter, so nothing is imported or cached
+yet. The page's modules are imported under `-X importtime`, whose
+cumulative times are reported per top-level module along with the slowest
+modules by their own import time. The page is then run headlessly with
+Streamlit's AppTest in an empty data directory (or one with --months of
+history): "first run" includes its imports and stands in for time to
+first paint, and "payload" is the serialized size of the elements a rerun
+sends to the browser.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# What personal_finance.py imports, in its order
+PAGE_MODULES = [
+    "streamlit", "numpy", "pandas", "backtest", "charts", "finance_core", "fx", "importer",
+    "ledger", "lots", "monte_carlo", "profiler", "storage",
+]
+
+
+def import_times():
+    """
+    Import PAGE_MODULES in a fresh interpreter under -X importtime.
+
+    Returns:
+    list: (module, self seconds, cumulative seconds, depth) per imported module
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(PAGE_MODULES)}"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(own) / 1e6, int(cumulative) / 1e6, (len(name) - len(name.lstrip())) // 2))
+    return rows
+
+
+def payload_bytes(node):
+    """Serialized size of the element protos under an AppTest tree node."""
+    proto = getattr(node, "proto", None)
+    size = proto.ByteSize() if hasattr(proto, "ByteSize") else 0
+    return size + sum(payload_bytes(child) for child in getattr(node, "children", {}).values())
+
+
+def run_page(months):
+    """First run and one rerun of the page in this (fresh) interpreter; printed as JSON."""
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        if months:
+            from bench_suite import synthetic_history
+            from storage import write_snapshot
+
+            write_snapshot(synthetic_history(months), "finance_data.csv")
+        at = AppTest.from_file(os.path.join(ROOT, "personal_finance.py"), default_timeout=600)
+        at.run()
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        at.run()
+        rerun = time.perf_counter() - start
+    print(json.dumps({
+        "first_run": first,
+        "rerun": rerun,
+        "payload": payload_bytes(at._tree),
+        "plotly": "plotly.graph_objs._figure" in sys.modules,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--months", type=int, default=0, help="History length; 0 is the empty-data path")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="Slowest modules listed by own import time")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_page(args.months)
+        return
+
+    imports = [import_times() for _ in range(args.repeat)]
+    best = min(imports, key=lambda rows: sum(cumulative for _, _, cumulative, depth in rows if depth == 0))
+    top_level = [(name, cumulative) for name, _, cumulative, depth in best if depth == 0]
+    print(f"imports, best of {args.repeat}: {sum(cumulative for _, cumulative in top_level) * 1000:.1f} ms")
+    for name, cumulative in sorted(top_level, key=lambda row: -row[1])[:args.top]:
+        print(f"  {name:<40}{cumulative * 1000:10.1f} ms")
+    print("slowest modules by own time:")
+    for name, own, _, _ in sorted(best, key=lambda row: -row[1])[:args.top]:
+        print(f"  {name:<40}{own * 1000:10.1f} ms")
+
+    runs = []
+    for _ in range(args.repeat):
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", "--months", str(args.months)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    print(f"page with {args.months:,} stored months, best of {args.repeat}:")
+    print(f"  first run      {min(run['first_run'] for run in runs) * 1000:10.1f} ms")
+    print(f"  rerun          {min(run['rerun'] for run in runs) * 1000:10.1f} ms")
+    print(f"  payload        {runs[0]['payload']:10,} bytes per rerun")
+    print(f"  plotly figures {'loaded' if runs[0]['plotly'] else 'not loaded'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Time the dashboard's data paths on synthetic households and flag regressions.
+
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --sizes 100 10000 --output results.json
+    python benchmarks/bench_suite.py --update-baseline
+
+Monthly histories of 10^2 to 10^5 rows (finance_data.csv schema) are timed
+through valuation, projection, analytics preparation, CSV load and save,
+and, up to --app-max-rows, a full headless run of the page. Transaction
+exports of 10^4 to 10^6 rows are timed through the importer's aggregation.
+Every month of a history is a distinct (Year, Month), as the stores
+require; histories end December 2024 when years from 1 allow it and
+start January of year 1 otherwise.
+
+Each timing is the best of a few repeats. Results are written as JSON
+(benchmarks/results.json unless --output says otherwise), and
+any timing slower than the stored baseline by more than --threshold (and
+by more than --min-seconds) fails the run with exit status 1.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from finance_core import (  # noqa: E402
+    MONTHS,
+    calculate_future_portfolio,
+    calculate_portfolio_value,
+    summarize_history,
+)
+from importer import aggregate_transactions, read_transactions  # noqa: E402
+from storage import AMOUNT_COLUMNS, COLUMNS, read_snapshot, write_snapshot  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# Latest run, next to the baseline and ignored by git
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.json")
+HISTORY_SIZES = [100, 1_000, 10_000, 100_000]
+TRANSACTION_SIZES = [10_000, 100_000, 1_000_000]
+# Distinct months in years 1 to 9999, the longest possible history
+MAX_HISTORY_MONTHS = 9999 * 12
+AS_OF = datetime(2025, 1, 15)
+PAYEES = np.array([
+    "Salary ACME", "Monthly rent", "Mortgage Leumi", "Car loan", "Income tax",
+    "Interactive Brokers ETF", "Supermarket", "Cafe", "Pharmacy", "Transfer from savings"
+])
+
+
+def synthetic_history(rows, seed=0):
+    """Monthly records of rows consecutive months, in the records schema."""
+    if rows > MAX_HISTORY_MONTHS:
+        raise ValueError(f"Histories have at most {MAX_HISTORY_MONTHS:,} distinct months")
+    rng = np.random.default_rng(seed)
+    # Month ordinal 12 is January of year 1
+    ordinals = max(2025 * 12 - rows, 12) + np.arange(rows)
+    df = pd.DataFrame({column: rng.integers(0, 5_000, rows).astype(float) for column in AMOUNT_COLUMNS})
+    df["Income Salary"] += 20_000
+    df["Monthly left"] = df["Income Salary"] + df["Income plus"] - df[AMOUNT_COLUMNS[2:8]].sum(axis=1)
+    df["Month"] = np.array(MONTHS)[ordinals % 12]
+    df["Year"] = ordinals // 12
+    return df[COLUMNS]
+
+
+def write_transactions(path, rows, seed=0):
+    """A CSV bank export of rows transactions over ten years."""
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp("2015-01-01") + pd.to_timedelta(rng.integers(0, 3650, rows), unit="D")
+    payees = rng.integers(0, len(PAYEES), rows)
+    amounts = np.where(payees == 0, 15_000.0, -rng.integers(10, 2_000, rows).astype(float))
+    pd.DataFrame({
+        "Date": dates.strftime("%Y-%m-%d"),
+        "Description": PAYEES[payees],
+        "Amount": amounts,
+    }).to_csv(path, index=False)
+
+
+def best_time(run, repeat=5, budget=1.0):
+    """Best wall time of up to repeat calls, stopping once budget seconds are spent."""
+    timings = []
+    while len(timings) < repeat and (not timings or sum(timings) < budget):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def app_run_time(directory, history):
+    """Seconds for one cold headless run of the page over history."""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    path = os.path.join(directory, "app_finance_data.csv")
+    history.to_csv(path, index=False)
+    os.environ["FINANCE_DATA_PATH"] = path
+
+    def run():
+        # Cold: nothing cached from an earlier run or size
+        st.cache_data.clear()
+        st.cache_resource.clear()
+        at = AppTest.from_file(os.path.join(ROOT, "personal_finance.py"), default_timeout=600)
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+
+    return best_time(run, repeat=3, budget=30.0)
+
+
+def run_suite(history_sizes, transaction_sizes, app_max_rows):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in history_sizes:
+            history = synthetic_history(rows)
+            path = os.path.join(directory, f"finance_data_{rows}.csv")
+            print(f"history {rows:>9,} rows", flush=True)
+
+            results[f"portfolio_value/{rows}"] = best_time(lambda: calculate_portfolio_value(history, 7, AS_OF))
+            results[f"portfolio_value_scenarios/{rows}"] = best_time(
+                lambda: calculate_portfolio_value(history, np.arange(0, 21), AS_OF)
+            )
+            results[f"analytics/{rows}"] = best_time(lambda: summarize_history(history))
+            results[f"csv_save/{rows}"] = best_time(lambda: write_snapshot(history, path))
+            results[f"csv_load/{rows}"] = best_time(lambda: read_snapshot(path))
+            if rows <= app_max_rows:
+                results[f"app_run/{rows}"] = app_run_time(directory, history)
+
+        # Independent of the history length
+        results["future_portfolio/30y"] = best_time(
+            lambda: calculate_future_portfolio(100_000, 7, np.array([0.0, 3_000.0]), 30, 2.0)
+        )
+
+        for rows in transaction_sizes:
+            path = os.path.join(directory, f"transactions_{rows}.csv")
+            write_transactions(path, rows)
+            print(f"transactions {rows:>9,} rows", flush=True)
+            results[f"import_aggregate/{rows}"] = best_time(
+                lambda: aggregate_transactions(read_transactions(path), date_format="%Y-%m-%d"), repeat=3
+            )
+    return results
+
+
+def regressions(results, baseline, threshold, min_seconds):
+    """(name, baseline, current) for every timing slower than the baseline allows."""
+    slower = []
+    for name, seconds in results.items():
+        reference = baseline.get(name)
+        if reference is not None and seconds > reference * (1 + threshold) and seconds - reference > min_seconds:
+            slower.append((name, reference, seconds))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=HISTORY_SIZES, help="History rows")
+    parser.add_argument("--transactions", type=int, nargs="*", default=TRANSACTION_SIZES, help="Export rows")
+    parser.add_argument("--app-max-rows", type=int, default=10_000, help="Largest history run through AppTest")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=0.5, help="Allowed slowdown, 0.5 = 50%%")
+    parser.add_argument("--min-seconds", type=float, default=0.005, help="Ignore slowdowns smaller than this")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the baseline")
+    args = parser.parse_args()
+
+    results = run_suite(args.sizes, args.transactions, args.app_max_rows)
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    print(f"\n{'benchmark':<36}{'seconds':>12}{'baseline':>12}")
+    for name, seconds in results.items():
+        reference = f"{baseline[name]:12.4f}" if name in baseline else f"{'-':>12}"
+        print(f"{name:<36}{seconds:12.4f}{reference}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    slower = regressions(results, baseline, args.threshold, args.min_seconds)
+    for name, reference, seconds in slower:
+        print(f"REGRESSION {name}: {seconds:.4f}s vs {reference:.4f}s baseline")
+    if slower:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
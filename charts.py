@@ -0,0 +1,570 @@
+"""
+Plotly figure builders for the dashboard, and a bounded cache for them.
+
+Each builder takes only the values its chart shows, so a figure can be
+memoized on exactly the inputs it depends on.
+
+Time series longer than a point budget are downsampled with
+largest-triangle-three-buckets (LTTB), which keeps the shape of the line
+and, here, always the series' minimum and maximum. The payload sent to
+the browser therefore stays the same size however long the history
+grows. Traces with more than WEBGL_POINTS points, as when downsampling is
+turned off, are drawn with WebGL (Scattergl) instead of SVG.
+
+Plotly is imported by the builders, not at module load, so a page that
+draws no chart (an empty history) never pays for it.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from finance_core import month_starts
+
+# Points kept per time series; FINANCE_CHART_POINTS=0 turns downsampling off
+MAX_POINTS = int(os.environ.get("FINANCE_CHART_POINTS", 2_000))
+# Traces longer than this are rendered with WebGL
+WEBGL_POINTS = 5_000
+
+
+class FigureCache:
+    """
+    LRU cache of built figures keyed by (chart, inputs), with per-chart stats.
+
+    Cached figures are shared between reruns and sessions and must not be
+    modified after they are built.
+
+    Parameters:
+    max_entries (int): Figures kept before the least recently used is evicted
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._figures = OrderedDict()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get(self, chart, key, build):
+        """
+        Return the cached figure for (chart, key), calling build() on a miss.
+
+        Parameters:
+        chart (str): Chart name, used for the hit/miss counters
+        key (tuple): Hashable inputs the figure depends on
+        build (callable): Builds the figure when it is not cached
+        """
+        cache_key = (chart, key)
+        with self._lock:
+            stats = self._stats.setdefault(chart, {"hits": 0, "misses": 0})
+            if cache_key in self._figures:
+                self._figures.move_to_end(cache_key)
+                stats["hits"] += 1
+                return self._figures[cache_key]
+            stats["misses"] += 1
+
+        figure = build()
+        with self._lock:
+            self._figures[cache_key] = figure
+            while len(self._figures) > self.max_entries:
+                self._figures.popitem(last=False)
+        return figure
+
+    def stats(self):
+        """Hit and miss counts per chart, as {chart: {"hits": n, "misses": n}}."""
+        with self._lock:
+            return {chart: dict(counts) for chart, counts in self._stats.items()}
+
+
+def lttb_indices(y, max_points, x=None):
+    """
+    Indices of the points largest-triangle-three-buckets keeps.
+
+    The first and last points are always kept. The points in between are
+    split into max_points - 2 buckets. From each bucket the point forming
+    the largest triangle with the previously kept point and the average of
+    the next bucket is kept.
+
+    Parameters:
+    y (array-like): Series values; non-finite values count as 0 when choosing
+    max_points (int): Points to keep
+    x (array-like): Numeric x positions, defaults to evenly spaced
+
+    Returns:
+    ndarray: Sorted indices into y
+    """
+    n = len(y)
+    if not max_points or max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=float)
+    y = np.where(np.isfinite(y), y, 0.0)
+    x = np.arange(n, dtype=float) if x is None else np.asarray(x, dtype=float)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.intp)
+    edges = np.append(edges, n)
+
+    selected = np.empty(max_points, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_start, next_stop = edges[bucket + 1], edges[bucket + 2]
+        average_x = x[next_start:next_stop].mean()
+        average_y = y[next_start:next_stop].mean()
+        # Twice the triangle area; the constant factor does not change the argmax
+        area = np.abs(
+            (x[previous] - average_x) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (average_y - y[previous])
+        )
+        previous = start + int(np.argmax(area)) if stop > start else previous
+        selected[bucket + 1] = previous
+    return np.unique(selected)
+
+
+def sample_indices(series, max_points=MAX_POINTS):
+    """
+    Indices shared by several series of the same length so each keeps its shape and extremes.
+
+    Parameters:
+    series (list): Equal-length arrays plotted against the same x
+    max_points (int): Budget per series; 0 or None keeps every point
+
+    Returns:
+    ndarray or None: Sorted indices, or None when nothing is dropped
+    """
+    length = len(series[0])
+    if not max_points or length <= max_points:
+        return None
+    kept = [lttb_indices(values, max_points) for values in series]
+    for values in series:
+        finite = np.where(np.isfinite(values), values, np.nan)
+        if np.isfinite(finite).any():
+            kept.append([np.nanargmin(finite), np.nanargmax(finite)])
+    return np.unique(np.concatenate(kept))
+
+
+def _scatter(points):
+    """Scatter trace class for a trace of this many points."""
+    import plotly.graph_objects as go
+
+    return go.Scattergl if points > WEBGL_POINTS else go.Scatter
+
+
+def _take(values, indices):
+    values = np.asarray(values)
+    return values if indices is None else values[indices]
+
+
+def _month_axis(df, indices):
+    """
+    x values for history charts.
+
+    Full histories keep the "Jan 2024" category labels. A downsampled one
+    switches to dates so the dropped months keep their width on the axis.
+    """
+    if indices is None:
+        return df['Display_Date']
+    return month_starts(df['Month ordinal'].to_numpy()[indices])
+
+
+def build_simple_projection_figure(future_months, future_portfolio, max_points=MAX_POINTS, symbol="₪"):
+    """Portfolio growth without contributions."""
+    import plotly.graph_objects as go
+
+    indices = sample_indices([future_portfolio], max_points)
+    future_months = _take(future_months, indices)
+
+    fig_simple = go.Figure()
+    fig_simple.add_trace(_scatter(len(future_months))(
+        x=future_months,
+        y=_take(future_portfolio, indices),
+        mode='lines',
+        name='Portfolio Value',
+        line=dict(color="#00ff88", width=2)
+    ))
+    fig_simple.update_layout(
+        margin=dict(l=20, r=20, t=30, b=20),
+        height=400,
+        template="plotly_dark",
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='white'),
+        showlegend=False,
+        xaxis=dict(
+            showgrid=True,
+            gridcolor='rgba(128,128,128,0.2)',
+            title=None
+        ),
+        yaxis=dict(
+            showgrid=True,
+            gridcolor='rgba(128,128,128,0.2)',
+            title=f"Portfolio Value ({symbol})"
+        )
+    )
+    return fig_simple
+
+
+def build_detailed_projection_figure(future_months, nominal_values, real_values, max_points=MAX_POINTS, symbol="₪"):
+    """Nominal and inflation-adjusted projection with contributions."""
+    import plotly.graph_objects as go
+
+    indices = sample_indices([nominal_values, real_values], max_points)
+    future_months = _take(future_months, indices)
+    Scatter = _scatter(len(future_months))
+
+    fig_detailed = go.Figure()
+
+    fig_detailed.add_trace(Scatter(
+        x=future_months,
+        y=_take(nominal_values, indices),
+        mode='lines',
+        name='Nominal Value',
+        line=dict(color="#00ff88", width=2)
+    ))
+
+    fig_detailed.add_trace(Scatter(
+        x=future_months,
+        y=_take(real_values, indices),
+        mode='lines',
+        name='Real Value (Inflation Adjusted)',
+        line=dict(color="#88ffcc", width=2, dash='dash')
+    ))
+
+    fig_detailed.update_layout(
+        margin=dict(l=20, r=20, t=30, b=20),
+        height=400,
+        template="plotly_dark",
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='white'),
+        legend=dict(
+            yanchor="top",
+            y=0.99,
+            xanchor="left",
+            x=0.01
+        ),
+        xaxis=dict(
+            showgrid=True,
+            gridcolor='rgba(128,128,128,0.2)',
+            title=None
+        ),
+        yaxis=dict(
+            showgrid=True,
+            gridcolor='rgba(128,128,128,0.2)',
+            title=f"Portfolio Value ({symbol})"
+        )
+    )
+    return fig_detailed
+
+
+def build_monte_carlo_figure(future_months, bands, max_points=MAX_POINTS, symbol="₪"):
+    """Percentile fan chart; bands maps each percentile to its monthly values."""
+    import plotly.graph_objects as go
+
+    indices = sample_indices(list(bands.values()), max_points)
+    future_months = _take(future_months, indices)
+    bands = {percentile: _take(values, indices) for percentile, values in bands.items()}
+    Scatter = _scatter(len(future_months))
+
+    fig_monte_carlo = go.Figure()
+    for lower, upper, color, name in [(5, 95, "rgba(0,255,136,0.15)", "5th-95th Percentile"),
+                                      (25, 75, "rgba(0,255,136,0.3)", "25th-75th Percentile")]:
+        fig_monte_carlo.add_trace(Scatter(
+            x=future_months,
+            y=bands[upper],
+            mode='lines',
+            line=dict(width=0),
+            showlegend=False,
+            hoverinfo='skip'
+        ))
+        fig_monte_carlo.add_trace(Scatter(
+            x=future_months,
+            y=bands[lower],
+            mode='lines',
+            line=dict(width=0),
+            fill='tonexty',
+            fillcolor=color,
+            name=name
+        ))
+    fig_monte_carlo.add_trace(Scatter(
+        x=future_months,
+        y=bands[50],
+        mode='lines',
+        name='Median',
+        line=dict(color="#00ff88", width=2)
+    ))
+    fig_monte_carlo.update_layout(
+        margin=dict(l=20, r=20, t=30, b=20),
+        height=400,
+        template="plotly_dark",
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='white'),
+        legend=dict(
+            yanchor="top",
+            y=0.99,
+            xanchor="left",
+            x=0.01
+        ),
+        xaxis=dict(
+            showgrid=True,
+            gridcolor='rgba(128,128,128,0.2)',
+            title=None
+        ),
+        yaxis=dict(
+            showgrid=True,
+            gridcolor='rgba(128,128,128,0.2)',
+            title=f"Portfolio Value ({symbol})"
+        )
+    )
+    return fig_monte_carlo
+
+
+def build_backtest_figure(months, value, contributed, max_points=MAX_POINTS, symbol="₪"):
+    """Replayed portfolio value against the cash put in, month by month."""
+    import plotly.graph_objects as go
+
+    indices = sample_indices([value, contributed], max_points)
+    months = _take(months, indices)
+    Scatter = _scatter(len(months))
+
+    fig_backtest = go.Figure()
+    fig_backtest.add_trace(Scatter(
+        x=months,
+        y=_take(value, indices),
+        mode='lines',
+        name='Portfolio Value',
+        line=dict(color="#00ff88", width=2)
+    ))
+    fig_backtest.add_trace(Scatter(
+        x=months,
+        y=_take(contributed, indices),
+        mode='lines',
+        name='Net Invested',
+        line=dict(color='white', width=2, dash='dash')
+    ))
+    fig_backtest.update_layout(
+        margin=dict(l=20, r=20, t=30, b=20),
+        height=400,
+        template="plotly_dark",
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='white'),
+        legend=dict(
+            yanchor="top",
+            y=0.99,
+            xanchor="left",
+            x=0.01
+        ),
+        hovermode='x unified',
+        xaxis=dict(
+            showgrid=True,
+            gridcolor='rgba(128,128,128,0.2)',
+            title=None
+        ),
+        yaxis=dict(
+            showgrid=True,
+            gridcolor='rgba(128,128,128,0.2)',
+            title=f"Portfolio Value ({symbol})"
+        )
+    )
+    return fig_backtest
+
+
+def build_rolling_backtest_figure(starts, values, contributed, max_points=MAX_POINTS, symbol="₪"):
+    """Final value of the contribution pattern by the month it starts in."""
+    import plotly.graph_objects as go
+
+    indices = sample_indices([values], max_points)
+    starts = _take(starts, indices)
+    Scatter = _scatter(len(starts))
+
+    fig_rolling = go.Figure()
+    fig_rolling.add_trace(Scatter(
+        x=starts,
+        y=_take(values, indices),
+        mode='lines',
+        name='Final Value',
+        line=dict(color="#00ff88", width=2)
+    ))
+    fig_rolling.add_trace(Scatter(
+        x=starts,
+        y=_take(contributed, indices),
+        mode='lines',
+        name='Net Invested',
+        line=dict(color='white', width=1, dash='dash')
+    ))
+    fig_rolling.update_layout(
+        margin=dict(l=20, r=20, t=30, b=20),
+        height=400,
+        template="plotly_dark",
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='white'),
+        showlegend=False,
+        hovermode='x unified',
+        xaxis=dict(
+            showgrid=True,
+            gridcolor='rgba(128,128,128,0.2)',
+            title="Start Month",
+            hoverformat="%b %Y"
+        ),
+        yaxis=dict(
+            showgrid=True,
+            gridcolor='rgba(128,128,128,0.2)',
+            title=f"Final Value ({symbol})"
+        )
+    )
+    return fig_rolling
+
+
+def build_income_expenses_figure(df, max_points=MAX_POINTS, symbol="₪"):
+    """Total monthly income versus expenses."""
+    import plotly.graph_objects as go
+
+    indices = sample_indices([df['Total Income'].to_numpy(), df['Total Expenses'].to_numpy()], max_points)
+    x = _month_axis(df, indices)
+    total_income = _take(df['Total Income'], indices)
+    total_expenses = _take(df['Total Expenses'], indices)
+    Scatter = _scatter(len(x))
+
+    fig_income_expenses = go.Figure()
+
+    fig_income_expenses.add_trace(Scatter(
+        x=x,
+        y=total_income,
+        name='Total Income',
+        line=dict(color='#00ff88', width=2),
+        fill='tonexty'
+    ))
+
+    fig_income_expenses.add_trace(Scatter(
+        x=x,
+        y=total_expenses,
+        name='Total Expenses',
+        line=dict(color='#ff4444', width=2),
+        fill='tonexty'
+    ))
+
+    fig_income_expenses.update_layout(
+        template='plotly_dark',
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        margin=dict(l=20, r=20, t=30, b=20),
+        height=400,
+        yaxis_title=f"Amount ({symbol})",
+        hovermode='x unified',
+        xaxis_title=None,
+        xaxis_hoverformat="%b %Y"
+    )
+    return fig_income_expenses
+
+
+def build_expense_pie_figure(expense_categories):
+    """Total expenses by category."""
+    import plotly.graph_objects as go
+
+    fig_pie = go.Figure(data=[go.Pie(
+        labels=list(expense_categories.keys()),
+        values=list(expense_categories.values()),
+        hole=0.4,
+        marker=dict(colors=['#00ff88', '#00cc88', '#008866', '#ff4444', '#cc4444', '#884444'])
+    )])
+
+    fig_pie.update_layout(
+        template='plotly_dark',
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        margin=dict(l=20, r=20, t=30, b=20),
+        height=400,
+        showlegend=True
+    )
+    return fig_pie
+
+
+def build_savings_rate_figure(df, avg_savings_rate, savings_rate_max, max_points=MAX_POINTS):
+    """Monthly savings rate with its average."""
+    import plotly.graph_objects as go
+
+    indices = sample_indices([df['Savings Rate'].to_numpy()], max_points)
+    x = _month_axis(df, indices)
+    savings_rate = _take(df['Savings Rate'], indices)
+
+    fig_savings = go.Figure()
+
+    fig_savings.add_trace(_scatter(len(x))(
+        x=x,
+        y=savings_rate,
+        # Markers would merge into a band on a downsampled history
+        mode='lines+markers' if indices is None else 'lines',
+        name='Savings Rate',
+        line=dict(color='#00ff88', width=2),
+        marker=dict(size=8)
+    ))
+
+    fig_savings.add_hline(
+        y=avg_savings_rate,
+        line_dash="dash",
+        line_color="white",
+        annotation_text=f"Average: {avg_savings_rate:.1f}%"
+    )
+
+    fig_savings.update_layout(
+        template='plotly_dark',
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        margin=dict(l=20, r=20, t=30, b=20),
+        height=400,
+        yaxis_title="Savings Rate (%)",
+        yaxis_range=[0, max(100, savings_rate_max * 1.1)],
+        xaxis_title=None,
+        xaxis_hoverformat="%b %Y"
+    )
+    return fig_savings
+
+
+def build_investment_figure(df, max_points=MAX_POINTS, symbol="₪"):
+    """Monthly and cumulative market investment."""
+    import plotly.graph_objects as go
+
+    indices = sample_indices(
+        [df['Expenses market'].to_numpy(), df['Cumulative Investment'].to_numpy()], max_points
+    )
+    x = _month_axis(df, indices)
+
+    fig_investment = go.Figure()
+
+    fig_investment.add_trace(go.Bar(
+        x=x,
+        y=_take(df['Expenses market'], indices),
+        name='Monthly Investment',
+        marker_color='#00ff88'
+    ))
+
+    fig_investment.add_trace(_scatter(len(x))(
+        x=x,
+        y=_take(df['Cumulative Investment'], indices),
+        name='Cumulative Investment',
+        line=dict(color='white', width=2),
+        yaxis='y2'
+    ))
+
+    fig_investment.update_layout(
+        template='plotly_dark',
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        margin=dict(l=20, r=20, t=30, b=20),
+        height=400,
+        yaxis_title=f"Monthly Investment ({symbol})",
+        yaxis2=dict(
+            title=f"Cumulative Investment ({symbol})",
+            overlaying='y',
+            side='right'
+        ),
+        showlegend=True,
+        hovermode='x unified',
+        xaxis_title=None,
+        xaxis_hoverformat="%b %Y"
+    )
+    return fig_investment
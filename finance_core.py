@@ -0,0 +1,740 @@
+"""
+Finance calculations shared by the dashboard and batch jobs.
+
+Nothing here imports Streamlit or Plotly, and only NumPy is loaded up
+front: pandas and the storage backends are imported by the functions that
+need them, so cron jobs and pool workers start quickly.
+
+Summarize a directory of households (one records file per household, in
+any storage backend: .csv, .feather, .arrow or .sqlite) with:
+
+    python finance_core.py batch households/ summaries/ --workers 4
+
+Each household gets a `<name>.json` summary, and `summary.csv` collects
+one row per household. Amounts are converted to the reporting currency
+(`--currency`, BASE_CURRENCY by default) at the rates of the fx_rates.csv
+file in the input directory.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+MONTHS = [
+    "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December"
+]
+MONTH_INDEX = {name: index for index, name in enumerate(MONTHS)}
+MONTH_ABBREVIATIONS = np.array([name[:3] for name in MONTHS])
+INCOME_COLUMNS = ["Income Salary", "Income plus"]
+EXPENSE_COLUMNS = [
+    "Expenses Day-to-day", "Expenses rent", "Expenses loan",
+    "Expenses market", "Expenses taxes", "Expenses mortgage"
+]
+# Currencies amounts can be recorded in, with their display symbols. Exchange
+# rates are quoted in BASE_CURRENCY, which is also the currency of amounts
+# recorded without one.
+CURRENCY_SYMBOLS = {
+    "ILS": "₪", "USD": "$", "EUR": "€", "GBP": "£",
+    "JPY": "¥", "CHF": "CHF ", "CAD": "C$", "AUD": "A$",
+}
+CURRENCIES = list(CURRENCY_SYMBOLS)
+BASE_CURRENCY = "ILS"
+# Columns of the Key Financial Metrics, averaged and compared to the latest month
+METRIC_COLUMNS = ["Monthly left", "Savings Rate", "Expense Ratio", "Investment Ratio"]
+# Trailing windows, in recorded months, of the rolling metric columns
+ROLLING_WINDOWS = [3, 6, 12]
+# Capital gains tax on portfolio profits
+TAX_RATE = 0.25
+# Grid of the shared compounding table: the dashboard's return and inflation
+# sliders, and months enough for a century of history or projection
+TABLE_RETURNS = np.arange(0, 21)
+TABLE_INFLATION_RATES = np.arange(0, 101) / 10
+TABLE_MONTHS = 1200
+SUMMARY_FILE = "summary.csv"
+
+
+def capital_gains_tax(gains):
+    """
+    Tax owed on portfolio gains; losses are not taxed.
+
+    Parameters:
+    gains (float or array-like): Portfolio value minus amount invested
+
+    Returns:
+    float or ndarray: TAX_RATE of the positive gains, shaped like gains
+    """
+    tax = np.where(np.asarray(gains) > 0, TAX_RATE * np.asarray(gains, dtype=float), 0.0)
+    return float(tax) if tax.ndim == 0 else tax
+
+
+def month_ordinals(df):
+    """
+    Integer month ordinal (year * 12 + zero-based month) for every row.
+
+    Parameters:
+    df (DataFrame): Monthly records with "Month" names and "Year" columns,
+        and optionally the precomputed "Month ordinal"
+
+    Returns:
+    ndarray: int64 ordinals, one per row
+    """
+    if "Month ordinal" in df:
+        return df["Month ordinal"].to_numpy(dtype=np.int64)
+    month_index = df["Month"].map(MONTH_INDEX).to_numpy(dtype=np.int64)
+    return df["Year"].to_numpy(dtype=np.int64) * 12 + month_index
+
+
+def month_starts(ordinals):
+    """
+    First day of every month ordinal, the inverse of month_ordinals.
+
+    Parameters:
+    ordinals (array-like): Month ordinals
+
+    Returns:
+    Series: datetime64 first days of the months
+    """
+    import pandas as pd
+
+    ordinals = np.asarray(ordinals, dtype=np.int64)
+    return pd.to_datetime({"year": ordinals // 12, "month": ordinals % 12 + 1, "day": 1})
+
+
+def month_label(ordinal, abbreviated=True):
+    """"Jan 2024" label of a month ordinal, or "January 2024" when not abbreviated."""
+    names = MONTH_ABBREVIATIONS if abbreviated else MONTHS
+    return f"{names[ordinal % 12]} {ordinal // 12}"
+
+
+def _ratios(values):
+    """Savings rate, expense ratio and investment ratio from column arrays."""
+    income = values["Income Salary"] + values["Income plus"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "Savings Rate": np.round(values["Monthly left"] / income * 100, 2),
+            "Expense Ratio": (
+                values["Expenses rent"] + values["Expenses mortgage"] + values["Expenses loan"]
+            ) / values["Expenses Day-to-day"],
+            "Investment Ratio": values["Expenses market"] / income * 100,
+        }
+
+
+def _column_values(df):
+    """Float arrays of the columns the ratios and totals are built from."""
+    columns = ["Income Salary", "Income plus", "Monthly left"] + EXPENSE_COLUMNS
+    return {column: df[column].to_numpy(dtype=float) for column in columns}
+
+
+def month_ratios(df):
+    """
+    Totals and ratios of each month.
+
+    Savings rate is money left as a percentage of income, expense
+    efficiency (the "Expense Ratio" column) is essential spending (rent,
+    mortgage, loan) over day-to-day spending, and investment ratio is
+    market investment as a percentage of income.
+
+    Parameters:
+    df (DataFrame): Monthly records; it is not modified
+
+    Returns:
+    DataFrame: df with "Total Income", "Total Expenses" and the ratio columns added
+    """
+    import pandas as pd
+
+    values = _column_values(df)
+    columns = {
+        "Total Income": values["Income Salary"] + values["Income plus"],
+        "Total Expenses": np.sum([values[column] for column in EXPENSE_COLUMNS], axis=0),
+        **_ratios(values),
+    }
+    # Added in one concat rather than column by column
+    return pd.concat([df.drop(columns=list(columns), errors="ignore"), pd.DataFrame(columns, index=df.index)], axis=1)
+
+
+class RunningTotals:
+    """
+    Sums behind the headline numbers, updated as months are added or removed.
+
+    Each update costs time in the months it adds or removes, not in the
+    length of the history. Ratios that are not finite (a month without
+    income or day-to-day spending) are left out of their average, so they
+    can be removed again without poisoning the sum.
+
+    The latest month's ratios are kept too. Only removing the latest month
+    needs the history again, through `refresh_latest`.
+    """
+
+    SUM_COLUMNS = ["Monthly left"] + EXPENSE_COLUMNS + METRIC_COLUMNS[1:]
+
+    def __init__(self):
+        self.months = 0
+        self.sums = dict.fromkeys(self.SUM_COLUMNS, 0.0)
+        self.counts = dict.fromkeys(METRIC_COLUMNS, 0)
+        self.latest_ordinal = None
+        self.latest = dict.fromkeys(METRIC_COLUMNS, 0.0)
+        self._latest_stale = False
+
+    @classmethod
+    def from_frame(cls, df):
+        """Totals of every month in df."""
+        totals = cls()
+        totals.add(df)
+        return totals
+
+    def copy(self):
+        totals = RunningTotals()
+        totals.months = self.months
+        totals.sums = dict(self.sums)
+        totals.counts = dict(self.counts)
+        totals.latest_ordinal = self.latest_ordinal
+        totals.latest = dict(self.latest)
+        totals._latest_stale = self._latest_stale
+        return totals
+
+    def add(self, df):
+        """Add the months of df."""
+        values = self._update(df, 1)
+        if values is None or self._latest_stale:
+            return
+        ordinals = month_ordinals(df)
+        position = int(ordinals.argmax())
+        if self.latest_ordinal is None or ordinals[position] >= self.latest_ordinal:
+            self._set_latest(int(ordinals[position]), values, position)
+
+    def remove(self, df):
+        """Remove the months of df, which must have been added."""
+        if self._update(df, -1) is not None and self.latest_ordinal in set(month_ordinals(df).tolist()):
+            self.latest_ordinal = None
+            self._latest_stale = True
+
+    def refresh_latest(self, df):
+        """Take the latest month from df if removing it left the totals without one."""
+        if not self._latest_stale:
+            return
+        self._latest_stale = False
+        self.latest_ordinal = None
+        self.latest = dict.fromkeys(METRIC_COLUMNS, 0.0)
+        if len(df):
+            ordinals = month_ordinals(df)
+            position = int(ordinals.argmax())
+            latest = df.iloc[[position]]
+            values = _column_values(latest)
+            values.update(_ratios(values))
+            self._set_latest(int(ordinals[position]), values, 0)
+
+    def _set_latest(self, ordinal, values, position):
+        self.latest_ordinal = ordinal
+        self.latest = {column: float(values[column][position]) for column in METRIC_COLUMNS}
+
+    def _update(self, df, sign):
+        if df.empty:
+            return None
+        values = _column_values(df)
+        values.update(_ratios(values))
+        for column in self.SUM_COLUMNS:
+            finite = np.isfinite(values[column])
+            self.sums[column] += sign * float(values[column][finite].sum())
+            if column in self.counts:
+                self.counts[column] += sign * int(finite.sum())
+        self.months += sign * len(df)
+        return values
+
+    @property
+    def bank_account(self):
+        return self.sums["Monthly left"]
+
+    @property
+    def avg_monthly_investment(self):
+        return self.sums["Expenses market"] / self.months if self.months else 0.0
+
+    @property
+    def expense_categories(self):
+        return {
+            'Day-to-day': self.sums['Expenses Day-to-day'],
+            'Rent': self.sums['Expenses rent'],
+            'Loan': self.sums['Expenses loan'],
+            'Market Investment': self.sums['Expenses market'],
+            'Taxes': self.sums['Expenses taxes'],
+            'Mortgage': self.sums['Expenses mortgage']
+        }
+
+    def metrics(self):
+        """(mean, latest) per METRIC_COLUMNS column."""
+        return {
+            column: (self.sums[column] / self.counts[column] if self.counts[column] else 0.0, self.latest[column])
+            for column in METRIC_COLUMNS
+        }
+
+
+class GrowthTable:
+    """
+    Read-only compounding factors indexed by (rate, months).
+
+    growth[r, k] is the growth of one unit over k months at the yearly
+    return TABLE_RETURNS[r], annuity[r, k] the value after k months of one
+    unit contributed at the start of each month, and deflators[i, k] the
+    real value of one unit after k months of yearly inflation
+    TABLE_INFLATION_RATES[i]. One table is built at import and shared by
+    every session and thread.
+
+    Parameters:
+    returns (array-like): Yearly return percentages
+    inflation_rates (array-like): Yearly inflation percentages
+    months (int): Longest span covered
+    """
+
+    def __init__(self, returns=TABLE_RETURNS, inflation_rates=TABLE_INFLATION_RATES, months=TABLE_MONTHS):
+        self.returns = np.asarray(returns, dtype=float)
+        self.inflation_rates = np.asarray(inflation_rates, dtype=float)
+        self.months = int(months)
+        elapsed = np.arange(self.months + 1)
+
+        self.growth = np.exp(np.outer(np.log1p(self.returns / 100) / 12, elapsed))
+        self.annuity = np.zeros_like(self.growth)
+        np.cumsum(self.growth[:, 1:], axis=1, out=self.annuity[:, 1:])
+        # Same monthly real adjustment as the projection has always used
+        monthly_deflator = 1 - ((1 + self.inflation_rates / 100) ** (1 / 12) - 1)
+        self.deflators = monthly_deflator[:, np.newaxis] ** elapsed
+        for table in (self.growth, self.annuity, self.deflators):
+            table.setflags(write=False)
+
+    @staticmethod
+    def _rows(grid, values):
+        """Row of every value in grid, or None if any value is not on it."""
+        values = np.asarray(values, dtype=float)
+        rows = np.clip(np.searchsorted(grid, values - 1e-9), 0, len(grid) - 1)
+        return rows if np.allclose(grid[rows], values, rtol=0, atol=1e-9) else None
+
+    def return_rows(self, yearly_return):
+        return self._rows(self.returns, yearly_return)
+
+    def inflation_rows(self, inflation_rate):
+        return self._rows(self.inflation_rates, inflation_rate)
+
+
+GROWTH_TABLE = GrowthTable()
+
+
+def _months_passed(ordinals, as_of):
+    """
+    Whole months between the first of each month and as_of; like
+    relativedelta, partial months are truncated towards zero.
+    """
+    months_passed = as_of.year * 12 + as_of.month - 1 - ordinals
+    if as_of > datetime(as_of.year, as_of.month, 1):
+        months_passed = np.where(months_passed < 0, months_passed + 1, months_passed)
+    return months_passed
+
+
+def portfolio_lots(df, yearly_return, as_of=None, method="fifo"):
+    """
+    Market contributions as tax lots, with the withdrawals sold from them.
+
+    Months with a positive "Expenses market" buy a lot, and months with a
+    negative one withdraw that amount. The modelled share price compounds
+    at yearly_return and is 1 at as_of, so a contribution buys amount *
+    growth shares and is worth amount * growth today. Withdrawals beyond
+    the modelled holdings empty the portfolio.
+
+    Parameters:
+    df (DataFrame): Monthly records; it is not modified
+    yearly_return (float): Yearly return percentage
+    as_of (datetime): Valuation date, defaults to now
+    method (str): How withdrawals pick lots, "fifo" or "lifo"
+
+    Returns:
+    LotBook: Lots and disposals; value them with unrealized(1.0)
+    """
+    from lots import LotBook
+
+    ordinals = month_ordinals(df)
+    order = np.argsort(ordinals, kind="stable")
+    ordinals = ordinals[order]
+    amounts = df["Expenses market"].to_numpy(dtype=float)[order]
+    months_passed = _months_passed(ordinals, as_of or datetime.now())
+    prices = np.exp(-np.log1p(yearly_return / 100) / 12 * months_passed)
+
+    bought, sold = amounts > 0, amounts < 0
+    book = LotBook(ordinals[bought], amounts[bought] / prices[bought], prices[bought])
+    book.sell(ordinals[sold], -amounts[sold] / prices[sold], prices[sold], method=method, clip=True)
+    return book
+
+
+def calculate_portfolio_value(df, yearly_return, as_of=None, method="fifo"):
+    """
+    Value every historical market contribution compounded to today.
+
+    Without withdrawals every contribution is still held and, under one
+    constant return, every lot's gain has the same sign, so the tax on the
+    total gain equals the sum of the per-lot taxes and the contributions
+    are valued together. Withdrawals (negative "Expenses market") are sold
+    from the lots of portfolio_lots, and the result is what is still held.
+
+    Parameters:
+    df (DataFrame): Monthly records; it is not modified
+    yearly_return (float or array-like): Yearly return percentage, or a
+        vector of them to value several scenarios in one pass
+    as_of (datetime): Valuation date, defaults to now
+    method (str): How withdrawals pick lots, "fifo" or "lifo"
+
+    Returns:
+    tuple: (portfolio_value, total_invested, gains, tax_amount, after_tax),
+        floats for a scalar return or arrays matching yearly_return;
+        total_invested is the cost basis still held
+    """
+    returns = np.atleast_1d(np.asarray(yearly_return, dtype=float))
+
+    if df.empty:
+        zeros = np.zeros_like(returns)
+        values = zeros, zeros, zeros, zeros, zeros
+    elif (df["Expenses market"].to_numpy() < 0).any():
+        held = np.array([
+            [part.sum() for part in portfolio_lots(df, value, as_of, method).unrealized(1.0)]
+            for value in returns
+        ]).T
+        values = (*held, held[0] - held[3])
+    else:
+        as_of = as_of or datetime.now()
+        amounts = df["Expenses market"].to_numpy(dtype=float)
+        invested = amounts > 0
+        amounts = amounts[invested]
+        months_passed = _months_passed(month_ordinals(df)[invested], as_of)
+
+        rows = GROWTH_TABLE.return_rows(returns)
+        in_table = months_passed.size == 0 or 0 <= months_passed.min() <= months_passed.max() <= GROWTH_TABLE.months
+        if rows is not None and in_table:
+            # Contributions made the same number of months ago grow alike
+            by_months = np.bincount(months_passed, weights=amounts)
+            portfolio_value = GROWTH_TABLE.growth[rows, :by_months.size] @ by_months
+        else:
+            portfolio_value = np.exp(np.outer(np.log1p(returns / 100) / 12, months_passed)) @ amounts
+        total_invested = np.full_like(returns, amounts.sum())
+        portfolio_gains = portfolio_value - total_invested
+        tax_amount = capital_gains_tax(portfolio_gains)
+        values = (portfolio_value, total_invested, portfolio_gains, tax_amount,
+                  portfolio_value - tax_amount)
+
+    if np.ndim(yearly_return) == 0:
+        return tuple(float(value[0]) for value in values)
+    return values
+
+
+def calculate_realized_gains(df, yearly_return, as_of=None, method="fifo"):
+    """
+    Gains realized by withdrawals, and the tax on them lot by lot.
+
+    Parameters are those of calculate_portfolio_value.
+
+    Returns:
+    tuple: (realized_gains, realized_tax), floats for a scalar return or
+        arrays matching yearly_return; zero without withdrawals
+    """
+    returns = np.atleast_1d(np.asarray(yearly_return, dtype=float))
+    realized = np.zeros((2, returns.size))
+    if not df.empty and (df["Expenses market"].to_numpy() < 0).any():
+        realized = np.array([
+            [part.sum() for part in portfolio_lots(df, value, as_of, method).realized()] for value in returns
+        ]).T
+
+    if np.ndim(yearly_return) == 0:
+        return float(realized[0, 0]), float(realized[1, 0])
+    return realized[0], realized[1]
+
+
+def calculate_future_portfolio(
+        current_portfolio,
+        yearly_return,
+        monthly_contribution,
+        years,
+        inflation_rate=2.0
+):
+    """
+    Calculate future portfolio value with more realistic assumptions.
+
+    Every month the contribution is added and the monthly return applied,
+    which compounds to the annuity P_k = P_0 * g^k + c * (g + ... + g^k).
+    The real value uses the same formula with the growth factor reduced by
+    monthly inflation. Returns and inflation rates on the GROWTH_TABLE grid
+    read g^k and the annuity sums from it; others use the closed form
+    c * g * (g^k - 1) / (g - 1).
+
+    current_portfolio, yearly_return, monthly_contribution and
+    inflation_rate may be scalars or arrays; they are broadcast together
+    into a scenario grid and projected in one call.
+
+    Parameters:
+    current_portfolio (float or array-like): Current portfolio value
+    yearly_return (float or array-like): Expected yearly return percentage
+    monthly_contribution (float or array-like): Monthly investment amount
+    years (int): Number of years to project
+    inflation_rate (float or array-like): Expected yearly inflation rate percentage
+
+    Returns:
+    tuple: (nominal_values, real_values, total_invested) where the value
+        arrays have shape scenarios + (months,) and total_invested has the
+        scenario shape
+    """
+    current_portfolio, yearly_return, monthly_contribution, inflation_rate = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float)
+          for value in (current_portfolio, yearly_return, monthly_contribution, inflation_rate))
+    )
+    months = int(years) * 12
+    elapsed = np.arange(1, months + 1)
+
+    def compound(growth_k, annuity):
+        return current_portfolio[..., np.newaxis] * growth_k + monthly_contribution[..., np.newaxis] * annuity
+
+    return_rows = GROWTH_TABLE.return_rows(yearly_return)
+    inflation_rows = GROWTH_TABLE.inflation_rows(inflation_rate)
+    if return_rows is not None and inflation_rows is not None and months <= GROWTH_TABLE.months:
+        growth_k = GROWTH_TABLE.growth[return_rows, 1:months + 1]
+        real_growth_k = growth_k * GROWTH_TABLE.deflators[inflation_rows, 1:months + 1]
+        nominal_values = compound(growth_k, GROWTH_TABLE.annuity[return_rows, 1:months + 1])
+        real_values = compound(real_growth_k, np.cumsum(real_growth_k, axis=-1))
+    else:
+        nominal_growth = (1 + yearly_return / 100) ** (1 / 12)
+        real_growth = nominal_growth * (1 - ((1 + inflation_rate / 100) ** (1 / 12) - 1))
+
+        def closed_form(growth):
+            growth = growth[..., np.newaxis]
+            growth_k = growth ** elapsed
+            with np.errstate(divide="ignore", invalid="ignore"):
+                annuity = np.where(np.isclose(growth, 1.0), elapsed, growth * (growth_k - 1) / (growth - 1))
+            return compound(growth_k, annuity)
+
+        nominal_values = closed_form(nominal_growth)
+        real_values = closed_form(real_growth)
+    total_invested = current_portfolio + monthly_contribution * elapsed.size
+
+    return nominal_values, real_values, total_invested
+
+
+def summarize_history(data, totals=None):
+    """
+    Totals, ratios and averages of a monthly history.
+
+    Ratios are described in `month_ratios`. Each METRIC_COLUMNS column also
+    gets its trailing mean over ROLLING_WINDOWS recorded months ("Savings
+    Rate 3m", ...) and its change from the same month a year earlier
+    ("Savings Rate YoY"), both left empty where the history is too short.
+
+    Parameters:
+    data (DataFrame): Monthly records; it is not modified
+    totals (RunningTotals): Running totals of data, kept by the store; built
+        from data when not given
+
+    Returns:
+    dict: "frame" (history sorted by month with ordinal, display date, totals,
+        ratios and their rolling and year-over-year columns), "bank_account",
+        "avg_monthly_investment", "expense_categories", "metrics" ((mean,
+        latest) per ratio column), "trailing" (latest rolling and YoY values
+        per ratio column) and "savings_rate_max"
+    """
+    import pandas as pd
+
+    ordinals = month_ordinals(data)
+    order = np.argsort(ordinals, kind="stable")
+    ordinals = ordinals[order]
+    df = data.iloc[order].reset_index(drop=True)
+    # One label per distinct month, taken for every row
+    distinct, inverse = np.unique(ordinals, return_inverse=True)
+    labels = pd.array([month_label(ordinal) for ordinal in distinct.tolist()], dtype="str")
+    df = pd.concat([
+        df.drop(columns=["Month ordinal"], errors="ignore"),
+        pd.DataFrame({"Month ordinal": ordinals, "Display_Date": labels.take(inverse)}),
+    ], axis=1)
+
+    df = month_ratios(df)
+
+    # Row of the same month a year earlier, found by ordinal so gaps in the
+    # history do not shift the comparison
+    earlier = np.minimum(np.searchsorted(ordinals, ordinals - 12), max(len(df) - 1, 0))
+    has_earlier = ordinals[earlier] == ordinals - 12 if len(df) else np.zeros(0, dtype=bool)
+    window_columns = {"Cumulative Investment": np.cumsum(df["Expenses market"].to_numpy(dtype=float))}
+    for column in METRIC_COLUMNS:
+        current = df[column].to_numpy(dtype=float)
+        finite = np.isfinite(current)
+        # Window sums as differences of running sums; a window with any
+        # non-finite month is left empty
+        sums = np.concatenate([[0.0], np.cumsum(np.where(finite, current, 0.0))])
+        counts = np.concatenate([[0], np.cumsum(finite)])
+        for window in ROLLING_WINDOWS:
+            means = np.full(len(df), np.nan)
+            if len(df) >= window:
+                full = counts[window:] - counts[:-window] == window
+                means[window - 1:] = np.where(full, (sums[window:] - sums[:-window]) / window, np.nan)
+            window_columns[f"{column} {window}m"] = means
+        current = np.where(finite, current, np.nan)
+        window_columns[f"{column} YoY"] = np.where(has_earlier, current - current[earlier], np.nan)
+    df = pd.concat([df, pd.DataFrame(window_columns)], axis=1)
+
+    if totals is None:
+        totals = RunningTotals.from_frame(df)
+    trailing = {
+        column: {
+            label: float(df[f"{column} {label}"].iloc[-1]) if len(df) else float("nan")
+            for label in [f"{window}m" for window in ROLLING_WINDOWS] + ["YoY"]
+        }
+        for column in METRIC_COLUMNS
+    }
+
+    return {
+        "frame": df,
+        "bank_account": totals.bank_account,
+        "avg_monthly_investment": totals.avg_monthly_investment,
+        "expense_categories": totals.expense_categories,
+        "metrics": totals.metrics(),
+        "trailing": trailing,
+        "savings_rate_max": df["Savings Rate"].max() if len(df) else 0.0,
+    }
+
+
+def summarize_household(data, yearly_return=7.0, years=10, inflation_rate=2.0, as_of=None):
+    """
+    The dashboard's headline numbers for one household, as plain values.
+
+    Parameters:
+    data (DataFrame): Monthly records
+    yearly_return (float): Yearly return percentage for valuation and projection
+    years (int): Projection horizon, contributing the average monthly investment
+    inflation_rate (float): Yearly inflation rate percentage for the real projection
+    as_of (datetime): Valuation date, defaults to now
+
+    Returns:
+    dict: JSON-serializable summary
+    """
+    history = summarize_history(data)
+    portfolio, invested, gains, tax, after_tax = calculate_portfolio_value(data, yearly_return, as_of)
+    nominal_values, real_values, future_invested = calculate_future_portfolio(
+        portfolio, yearly_return, history["avg_monthly_investment"], years, inflation_rate
+    )
+    projected = float(nominal_values[-1])
+    frame = history["frame"]
+    metrics = history["metrics"]
+
+    return {
+        "months": len(frame),
+        "first_month": frame["Display_Date"].iloc[0] if len(frame) else None,
+        "last_month": frame["Display_Date"].iloc[-1] if len(frame) else None,
+        "total_income": float(frame["Total Income"].sum()),
+        "total_expenses": float(frame["Total Expenses"].sum()),
+        "bank_account": float(history["bank_account"]),
+        "avg_monthly_savings": float(metrics["Monthly left"][0]),
+        "avg_savings_rate": float(metrics["Savings Rate"][0]),
+        "avg_expense_efficiency": float(metrics["Expense Ratio"][0]),
+        "avg_investment_ratio": float(metrics["Investment Ratio"][0]),
+        "yearly_return": float(yearly_return),
+        "portfolio_value": portfolio,
+        "portfolio_invested": invested,
+        "portfolio_gains": gains,
+        "portfolio_tax": tax,
+        "portfolio_after_tax": after_tax,
+        "total_assets": float(history["bank_account"]) + after_tax,
+        "projection_years": int(years),
+        "projected_value": projected,
+        "projected_real_value": float(real_values[-1]),
+        "projected_after_tax": projected - capital_gains_tax(projected - float(future_invested)),
+    }
+
+
+def summarize_file(path, output_dir, yearly_return=7.0, years=10, inflation_rate=2.0, as_of=None,
+                   currency=BASE_CURRENCY):
+    """
+    Summarize one household file and write `<name>.json` to output_dir.
+
+    The records are loaded through the store, so edits still in a journal
+    are included as the dashboard would show them, and converted to
+    currency at the rates of the rate file next to them.
+
+    Returns:
+    dict: The summary, with "household" and "currency" set
+    """
+    from fx import convert_history, load_rates, rates_path
+    from storage import open_store
+
+    try:
+        data = convert_history(open_store(path).data, load_rates(rates_path(path)), currency)
+    except ValueError as error:
+        raise ValueError(f"{path}: {error}") from error
+    household = os.path.splitext(os.path.basename(path))[0]
+    summary = {"household": household, "currency": currency}
+    summary.update(summarize_household(data, yearly_return, years, inflation_rate, as_of))
+    with open(os.path.join(output_dir, household + ".json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def run_batch(input_dir, output_dir, workers=None, yearly_return=7.0, years=10, inflation_rate=2.0,
+              currency=BASE_CURRENCY):
+    """
+    Summarize every household records file in input_dir across a process pool.
+
+    All households are valued as of the same moment. Besides the per
+    household JSON files, SUMMARY_FILE in output_dir gets one row each.
+
+    Parameters:
+    input_dir (str): Directory of records files; transaction ledgers and
+        the rate file next to them are skipped
+    output_dir (str): Directory for the summaries, created if missing
+    workers (int): Worker processes, defaults to the CPU count; 1 runs in-process
+    yearly_return, years, inflation_rate: As for summarize_household
+    currency (str): Reporting currency of every summary
+
+    Returns:
+    list: Household summaries, in file name order
+    """
+    import pandas as pd
+    from fx import RATES_FILE
+    from storage import STORE_EXTENSIONS
+
+    # A store edited since its last compaction may so far have only a journal
+    names = {name.split(".journal")[0] for name in os.listdir(input_dir)}
+    paths = sorted(
+        os.path.join(input_dir, name) for name in names
+        if name.endswith(STORE_EXTENSIONS) and not name.endswith(".ledger.sqlite") and name != RATES_FILE
+    )
+    os.makedirs(output_dir, exist_ok=True)
+    workers = min(workers or os.cpu_count() or 1, max(len(paths), 1))
+    args = (output_dir, yearly_return, years, inflation_rate, datetime.now(), currency)
+    per_path = [[arg] * len(paths) for arg in args]
+
+    if workers > 1:
+        # Spawn like the simulations, so workers import only this module
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            summaries = list(pool.map(summarize_file, paths, *per_path, chunksize=4))
+    else:
+        summaries = list(map(summarize_file, paths, *per_path))
+
+    pd.DataFrame(summaries).to_csv(os.path.join(output_dir, SUMMARY_FILE), index=False)
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless finance calculations")
+    commands = parser.add_subparsers(dest="command", required=True)
+    batch_parser = commands.add_parser("batch", help="Summarize a directory of household records files")
+    batch_parser.add_argument("input_dir")
+    batch_parser.add_argument("output_dir")
+    batch_parser.add_argument("--workers", type=int, default=None)
+    batch_parser.add_argument("--yearly-return", type=float, default=7.0)
+    batch_parser.add_argument("--years", type=int, default=10)
+    batch_parser.add_argument("--inflation-rate", type=float, default=2.0)
+    batch_parser.add_argument("--currency", choices=CURRENCIES, default=BASE_CURRENCY,
+                              help="Reporting currency of the summaries")
+    args = parser.parse_args()
+
+    if args.command == "batch":
+        summaries = run_batch(args.input_dir, args.output_dir, args.workers,
+                              args.yearly_return, args.years, args.inflation_rate, args.currency)
+        print(f"Summarized {len(summaries)} households into {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
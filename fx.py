@@ -0,0 +1,204 @@
+"""
+Exchange rates and conversion of the records to a reporting currency.
+
+Rates live in a local, append-only CSV (Date, Currency, Rate), where Rate
+is how many BASE_CURRENCY units one unit of Currency buys on Date. New
+quotes are appended, never rewritten; when a (Date, Currency) pair is
+quoted twice the later line wins.
+
+Each month of the history is converted at the rates in force at its end:
+the latest quote on or before the month's last day, or the earliest quote
+for months before any. `convert_history` looks those up with one
+`merge_asof` over every (month, currency) pair the history uses and then
+converts all amounts with array indexing, so its cost does not depend on
+how many rows share a month or a currency.
+
+Record a quote with:
+
+    python fx.py add fx_rates.csv 2024-06-30 USD 3.76
+"""
+import argparse
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from finance_core import BASE_CURRENCY, CURRENCIES, EXPENSE_COLUMNS, INCOME_COLUMNS, month_starts
+from storage import AMOUNT_COLUMNS, AMOUNT_DTYPE, CURRENCY_COLUMNS, CURRENCY_DTYPE
+
+RATE_COLUMNS = ["Date", "Currency", "Rate"]
+RATES_FILE = "fx_rates.csv"
+# Amounts that carry a currency, in CURRENCY_COLUMNS order
+CONVERTED_COLUMNS = AMOUNT_COLUMNS[:-1]
+
+
+def rates_path(records_path):
+    """The rate file kept next to a records file."""
+    return os.path.join(os.path.dirname(os.path.abspath(records_path)), RATES_FILE)
+
+
+def load_rates(path):
+    """
+    Read a rate file.
+
+    Parameters:
+    path (str): Rate CSV; a missing file has no rates
+
+    Returns:
+    DataFrame: RATE_COLUMNS sorted by Date, one quote per (Date, Currency)
+    """
+    if not os.path.exists(path):
+        return pd.DataFrame({
+            "Date": pd.Series(dtype="datetime64[ns]"),
+            "Currency": pd.Series(dtype=CURRENCY_DTYPE),
+            "Rate": pd.Series(dtype="float64"),
+        })
+
+    rates = pd.read_csv(path, dtype={"Currency": "category", "Rate": "float64"}, parse_dates=["Date"])
+    if list(rates.columns) != RATE_COLUMNS:
+        raise ValueError(f"{path} columns {list(rates.columns)} do not match {RATE_COLUMNS}")
+    unknown = sorted(set(rates["Currency"].cat.categories.astype(str)) - set(CURRENCIES))
+    if unknown:
+        raise ValueError(f"{path}: unknown currencies {unknown[:5]}, expected one of {CURRENCIES}")
+    if not (np.isfinite(rates["Rate"]) & (rates["Rate"] > 0)).all():
+        raise ValueError(f"{path}: rates must be positive numbers")
+    rates["Currency"] = rates["Currency"].astype(CURRENCY_DTYPE)
+    rates["Date"] = rates["Date"].astype("datetime64[ns]")
+    # Later lines correct earlier ones
+    rates = rates.drop_duplicates(["Date", "Currency"], keep="last")
+    return rates.sort_values("Date", kind="stable").reset_index(drop=True)
+
+
+def append_rates(path, rates):
+    """
+    Append quotes to a rate file, creating it if needed.
+
+    Parameters:
+    path (str): Rate CSV
+    rates (iterable): (date, currency, rate) tuples
+    """
+    rates = pd.DataFrame(list(rates), columns=RATE_COLUMNS)
+    unknown = sorted(set(rates["Currency"]) - set(CURRENCIES))
+    if unknown:
+        raise ValueError(f"Unknown currencies {unknown[:5]}, expected one of {CURRENCIES}")
+    if not (np.isfinite(rates["Rate"].astype(float)) & (rates["Rate"].astype(float) > 0)).all():
+        raise ValueError("Rates must be positive numbers")
+    rates["Date"] = pd.to_datetime(rates["Date"]).dt.strftime("%Y-%m-%d")
+    header = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, "a", newline="") as f:
+        rates.to_csv(f, header=header, index=False)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def month_rates(ordinals, rates, currencies):
+    """
+    Rate of each currency at the end of each month.
+
+    Parameters:
+    ordinals (ndarray): Distinct month ordinals, sorted
+    rates (DataFrame): load_rates result
+    currencies (list): Currency codes to look up; BASE_CURRENCY is always 1
+
+    Returns:
+    ndarray: (len(ordinals), len(CURRENCIES)) BASE_CURRENCY units per unit
+        of each currency, NaN for currencies not looked up
+    """
+    table = np.full((len(ordinals), len(CURRENCIES)), np.nan)
+    table[:, CURRENCIES.index(BASE_CURRENCY)] = 1.0
+    currencies = [currency for currency in currencies if currency != BASE_CURRENCY]
+    if not currencies or not len(ordinals):
+        return table
+
+    quoted = rates[rates["Currency"].isin(currencies)]
+    missing = sorted(set(currencies) - set(quoted["Currency"].astype(str)))
+    if missing:
+        raise ValueError(f"No exchange rates for {', '.join(missing)}")
+
+    month_ends = month_starts(ordinals) + pd.offsets.MonthEnd(0)
+    lookups = pd.DataFrame({
+        "Date": np.repeat(month_ends.to_numpy(dtype="datetime64[ns]"), len(currencies)),
+        "Currency": pd.Categorical(np.tile(currencies, len(ordinals)), dtype=CURRENCY_DTYPE),
+        "Position": np.repeat(np.arange(len(ordinals)), len(currencies)),
+    })
+    found = pd.merge_asof(lookups, quoted, on="Date", by="Currency", direction="backward")
+    values = found["Rate"].to_numpy(copy=True)
+    before = np.isnan(values)
+    if before.any():
+        # Months before a currency's first quote use that quote
+        later = pd.merge_asof(lookups[before], quoted, on="Date", by="Currency", direction="forward")
+        values[before] = later["Rate"].to_numpy()
+    table[found["Position"].to_numpy(), found["Currency"].cat.codes.to_numpy()] = values
+    return table
+
+
+def mixed_currency(df):
+    """
+    Rows whose amounts are in more than one currency.
+
+    Their stored "Monthly left" adds amounts in different currencies, so
+    it is only meaningful after convert_history recomputes it.
+
+    Returns:
+    ndarray: bool per row of df
+    """
+    if not len(df):
+        return np.zeros(0, dtype=bool)
+    codes = np.column_stack([df[column].cat.codes.to_numpy() for column in CURRENCY_COLUMNS])
+    return codes.min(axis=1) != codes.max(axis=1)
+
+
+def convert_history(df, rates, currency=BASE_CURRENCY):
+    """
+    Records with every amount in one currency.
+
+    "Monthly left" is recomputed from the converted amounts, since the
+    entered amounts it is derived from may be in different currencies.
+
+    Parameters:
+    df (DataFrame): Records in the compact schema
+    rates (DataFrame): load_rates result
+    currency (str): Reporting currency
+
+    Returns:
+    DataFrame: df itself when every amount is already in currency, else a
+        converted copy whose currency columns all say currency
+    """
+    if currency not in CURRENCIES:
+        raise ValueError(f"Unknown currency {currency}, expected one of {CURRENCIES}")
+    target = CURRENCIES.index(currency)
+    codes = np.column_stack([df[column].cat.codes.to_numpy() for column in CURRENCY_COLUMNS]) if len(df) else None
+    if codes is None or (codes == target).all():
+        return df
+
+    ordinals, positions = np.unique(df["Month ordinal"].to_numpy(), return_inverse=True)
+    used = sorted({CURRENCIES[code] for code in np.unique(codes)} | {currency})
+    table = month_rates(ordinals, rates, used)
+    # Entered currency -> base -> reporting currency, per row and column
+    factors = table[positions[:, None], codes] / table[positions, target][:, None]
+    amounts = (df[CONVERTED_COLUMNS].to_numpy(dtype=np.float64) * factors).astype(AMOUNT_DTYPE)
+
+    currencies = pd.Categorical.from_codes(np.full(len(df), target, dtype=np.int8), dtype=CURRENCY_DTYPE)
+    converted = df.assign(**dict(zip(CONVERTED_COLUMNS, amounts.T)), **dict.fromkeys(CURRENCY_COLUMNS, currencies))
+    converted["Monthly left"] = converted[INCOME_COLUMNS].sum(axis=1) - converted[EXPENSE_COLUMNS].sum(axis=1)
+    return converted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exchange rate file tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add_parser = commands.add_parser("add", help="Append a quote to a rate file")
+    add_parser.add_argument("rates", help="Rate CSV, created if missing")
+    add_parser.add_argument("date", type=date.fromisoformat)
+    add_parser.add_argument("currency", choices=CURRENCIES)
+    add_parser.add_argument("rate", type=float, help=f"{BASE_CURRENCY} per unit of currency")
+    args = parser.parse_args()
+
+    if args.command == "add":
+        append_rates(args.rates, [(args.date, args.currency, args.rate)])
+        print(f"{args.date} {args.currency} = {args.rate} {BASE_CURRENCY}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+Import bank statements as monthly records.
+
+Transactions are streamed from a CSV, OFX or QIF export in fixed-size
+chunks. Each chunk is categorized against a rule table and summed per
+(month, column) with one groupby. Only the running monthly totals are kept
+between chunks, so memory stays bounded however long the export is. The
+months are then written with a single `write_batch` call, which means one
+journal append or one SQLite transaction.
+
+Amounts are signed as in the export: credits count towards the column
+their rule names, and debits towards expense columns. A refund lowers its
+category. Imported months replace stored months with the same (Year, Month).
+
+    python importer.py import statement.ofx finance_data.csv --rules rules.csv
+"""
+import argparse
+import io
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from finance_core import EXPENSE_COLUMNS, INCOME_COLUMNS, MONTHS
+from storage import AMOUNT_COLUMNS, COLUMNS, open_store
+
+CHUNK_ROWS = 100_000
+# Columns a rule may assign transactions to; "Monthly left" is derived
+CATEGORY_COLUMNS = INCOME_COLUMNS + EXPENSE_COLUMNS
+# (pattern, column) pairs tried in order against the description, case-insensitively
+DEFAULT_RULES = [
+    (r"salary|payroll|wage", "Income Salary"),
+    (r"\brent\b", "Expenses rent"),
+    (r"mortgage", "Expenses mortgage"),
+    (r"\bloan\b", "Expenses loan"),
+    (r"\btax\b|national insurance|income tax", "Expenses taxes"),
+    (r"broker|invest|\betf\b|securities|pension fund", "Expenses market"),
+]
+# Where transactions matching no rule go, by the sign of the amount
+DEFAULT_CREDIT_COLUMN = "Income plus"
+DEFAULT_DEBIT_COLUMN = "Expenses Day-to-day"
+TRANSACTION_COLUMNS = ["Date", "Description", "Amount"]
+FORMATS = {".csv": "csv", ".ofx": "ofx", ".qfx": "ofx", ".qif": "qif"}
+
+_OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+
+def load_rules(path):
+    """
+    Read a rule table from a CSV file with "pattern" and "column" columns.
+
+    Returns:
+    list: (pattern, column) pairs, in file order
+    """
+    rules = pd.read_csv(path, dtype=str)
+    unknown = sorted(set(rules["column"]) - set(CATEGORY_COLUMNS))
+    if unknown:
+        raise ValueError(f"{path}: unknown columns {unknown}, expected one of {CATEGORY_COLUMNS}")
+    return list(zip(rules["pattern"], rules["column"]))
+
+
+def _batches(transactions, chunk_rows):
+    """Group an iterator of transaction dicts into DataFrames of chunk_rows rows."""
+    batch = []
+    for transaction in transactions:
+        batch.append(transaction)
+        if len(batch) == chunk_rows:
+            yield pd.DataFrame(batch, columns=TRANSACTION_COLUMNS)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch, columns=TRANSACTION_COLUMNS)
+
+
+def _ofx_transactions(lines):
+    """Transactions from the STMTTRN blocks of SGML or XML OFX."""
+    transaction = None
+    for line in lines:
+        for closing, tag, value in _OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                if closing and transaction is not None:
+                    yield {
+                        "Date": transaction.get("DTPOSTED", "")[:8],
+                        "Description": " ".join(
+                            filter(None, (transaction.get("NAME"), transaction.get("MEMO")))
+                        ),
+                        "Amount": transaction.get("TRNAMT", "0"),
+                    }
+                transaction = None if closing else {}
+            elif transaction is not None and not closing:
+                transaction[tag] = value.strip()
+
+
+def _qif_transactions(lines):
+    """Transactions from QIF records (D date, T/U amount, P payee, M memo, ^ end)."""
+    transaction = {}
+    for line in lines:
+        code, value = line[:1], line[1:].strip()
+        if code == "^":
+            if "Date" in transaction:
+                transaction.setdefault("Amount", "0")
+                transaction["Description"] = " ".join(transaction.pop("parts", []))
+                yield transaction
+            transaction = {}
+        elif code == "D":
+            # Quicken writes years from 2000 as 1/31'24
+            transaction["Date"] = value.replace("'", "/").replace(" ", "")
+        elif code in ("T", "U"):
+            transaction["Amount"] = value.replace(",", "")
+        elif code in ("P", "M"):
+            transaction.setdefault("parts", []).append(value)
+
+
+def read_transactions(source, format=None, chunk_rows=CHUNK_ROWS, columns=None):
+    """
+    Stream transactions from a statement export.
+
+    Parameters:
+    source (str or file): Path or binary/text file object
+    format (str): "csv", "ofx" or "qif"; defaults to the path's extension
+    chunk_rows (int): Transactions per yielded chunk
+    columns (dict): For CSV, the export's column name for each of "Date",
+        "Description" and "Amount"; defaults to those names
+
+    Returns:
+    iterator: DataFrames with raw "Date", "Description" and "Amount" columns
+    """
+    if format is None:
+        name = source if isinstance(source, str) else getattr(source, "name", "")
+        format = FORMATS.get(os.path.splitext(name)[1].lower())
+        if format is None:
+            raise ValueError(f"Cannot tell the statement format of {name!r}; pass format")
+
+    if format == "csv":
+        columns = columns or {}
+        renames = {columns.get(column, column): column for column in TRANSACTION_COLUMNS}
+        reader = pd.read_csv(
+            source, usecols=list(renames), dtype={name: str for name in renames}, chunksize=chunk_rows
+        )
+        with reader:
+            for chunk in reader:
+                yield chunk.rename(columns=renames)[TRANSACTION_COLUMNS]
+        return
+
+    parse = {"ofx": _ofx_transactions, "qif": _qif_transactions}[format]
+    if isinstance(source, str):
+        with open(source, encoding="utf-8", errors="replace") as f:
+            yield from _batches(parse(f), chunk_rows)
+    else:
+        if not isinstance(source, io.TextIOBase):
+            source = io.TextIOWrapper(source, encoding="utf-8", errors="replace")
+        yield from _batches(parse(source), chunk_rows)
+
+
+def categorize(descriptions, amounts, rules=DEFAULT_RULES):
+    """
+    Column of every transaction, matching the rules in order.
+
+    Parameters:
+    descriptions (Series): Transaction descriptions
+    amounts (ndarray): Signed amounts, picking the default for unmatched rows
+    rules (list): (pattern, column) pairs
+
+    Returns:
+    ndarray: Column name per transaction
+    """
+    # Statements repeat a few thousand payees, so match each one once
+    codes, payees = pd.factorize(descriptions.fillna(""))
+    payees = pd.Series(payees, dtype=str)
+    conditions = [payees.str.contains(pattern, case=False, regex=True).to_numpy() for pattern, _ in rules]
+    rule_index = np.select(conditions, np.arange(len(rules)), default=-1)[codes]
+    default = np.where(amounts > 0, DEFAULT_CREDIT_COLUMN, DEFAULT_DEBIT_COLUMN)
+    rule_columns = np.array([column for _, column in rules] + [""])
+    return np.where(rule_index >= 0, rule_columns[rule_index], default)
+
+
+def signed_amounts(columns, amounts):
+    """Amounts as they count towards their columns: credits for income, debits for expenses."""
+    return np.where(np.isin(columns, INCOME_COLUMNS), amounts, -amounts)
+
+
+def prepare_transactions(chunk, rules=DEFAULT_RULES, date_format=None):
+    """
+    Parse and categorize one chunk of raw transactions.
+
+    Parameters:
+    chunk (DataFrame): Raw "Date", "Description" and "Amount" strings
+    rules (list): (pattern, column) pairs
+    date_format (str): strptime format of the dates; inferred when None
+
+    Returns:
+    DataFrame: "Date" (datetime), "Description", "Amount" (signed float),
+        "Column" and "Month ordinal"
+    """
+    dates = pd.to_datetime(chunk["Date"], format=date_format)
+    amounts = pd.to_numeric(chunk["Amount"].str.replace(",", "", regex=False)).to_numpy(dtype=float)
+    return pd.DataFrame({
+        "Date": dates.to_numpy(),
+        "Description": chunk["Description"].fillna("").to_numpy(),
+        "Amount": amounts,
+        "Column": categorize(chunk["Description"], amounts, rules),
+        "Month ordinal": dates.dt.year.to_numpy(dtype=np.int64) * 12 + dates.dt.month.to_numpy(dtype=np.int64) - 1,
+    })
+
+
+def column_totals(transactions):
+    """Per (month ordinal, column) sums of prepared transactions."""
+    signed = signed_amounts(transactions["Column"].to_numpy(), transactions["Amount"].to_numpy())
+    return pd.Series(signed).groupby(
+        [transactions["Month ordinal"].to_numpy(), transactions["Column"].to_numpy()]
+    ).sum()
+
+
+def monthly_records(totals):
+    """
+    Monthly records from per (month ordinal, column) totals.
+
+    Returns:
+    DataFrame: One row per month in the records schema, with "Monthly left"
+    """
+    if totals.empty:
+        return pd.DataFrame(columns=COLUMNS)
+
+    monthly = totals.unstack(fill_value=0.0).reindex(columns=CATEGORY_COLUMNS, fill_value=0.0).round(2)
+    ordinals = monthly.index.to_numpy(dtype=np.int64)
+    monthly["Monthly left"] = monthly[INCOME_COLUMNS].sum(axis=1) - monthly[EXPENSE_COLUMNS].sum(axis=1)
+    monthly["Month"] = np.array(MONTHS)[ordinals % 12]
+    monthly["Year"] = ordinals // 12
+    return monthly.reset_index(drop=True)[COLUMNS].astype({column: "float64" for column in AMOUNT_COLUMNS})
+
+
+def aggregate_transactions(chunks, rules=DEFAULT_RULES, date_format=None):
+    """
+    Fold chunks of transactions into monthly records.
+
+    Parameters:
+    chunks (iterable): DataFrames as yielded by read_transactions
+    rules (list): (pattern, column) pairs
+    date_format (str): strptime format of the dates; inferred when None
+
+    Returns:
+    DataFrame: One row per month in the records schema, with "Monthly left"
+    """
+    totals = None
+    for chunk in chunks:
+        chunk_totals = column_totals(prepare_transactions(chunk, rules, date_format))
+        totals = chunk_totals if totals is None else totals.add(chunk_totals, fill_value=0.0)
+
+    if totals is None:
+        return pd.DataFrame(columns=COLUMNS)
+    return monthly_records(totals)
+
+
+def import_statement(store, source, format=None, rules=DEFAULT_RULES, date_format=None,
+                     chunk_rows=CHUNK_ROWS, columns=None, ledger=None):
+    """
+    Aggregate a statement export and upsert its months in one storage write.
+
+    With a ledger the transactions are also kept for drill-down. Lines
+    already in the ledger (an overlapping or repeated statement) are
+    skipped, and the months written are the ledger's rollups, so they
+    include transactions recorded by earlier imports.
+
+    Parameters:
+    store: Storage backend from storage.open_store
+    ledger (Ledger): Transaction ledger to record into, optional
+    Others as for read_transactions and aggregate_transactions
+
+    Returns:
+    DataFrame: The imported monthly records
+    """
+    chunks = read_transactions(source, format, chunk_rows, columns)
+    if ledger is None:
+        monthly = aggregate_transactions(chunks, rules, date_format)
+        if not monthly.empty:
+            store.write_batch(monthly.to_dict("records"))
+        return monthly
+
+    touched, seen = set(), {}
+    try:
+        for chunk in chunks:
+            touched |= ledger.add(prepare_transactions(chunk, rules, date_format), seen)
+    finally:
+        # Chunks recorded before a bad line would be skipped by a re-import,
+        # so their months are written even when a later chunk fails
+        upserts, deletes = ledger.records(touched)
+        if upserts or deletes:
+            store.write_batch(upserts, deletes)
+    return pd.DataFrame(upserts, columns=COLUMNS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bank statement import")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="Add a statement's months to the records")
+    import_parser.add_argument("statement")
+    import_parser.add_argument("data", nargs="?", default="finance_data.csv")
+    import_parser.add_argument("--rules", help="CSV rule table with pattern and column columns")
+    import_parser.add_argument("--format", choices=sorted(set(FORMATS.values())))
+    import_parser.add_argument("--date-format", help="strptime format of the statement dates")
+    import_parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    import_parser.add_argument("--dry-run", action="store_true", help="Print the months without saving")
+    import_parser.add_argument("--ledger", action="store_true", help="Keep the transactions for drill-down")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        rules = load_rules(args.rules) if args.rules else DEFAULT_RULES
+        if args.dry_run:
+            monthly = aggregate_transactions(
+                read_transactions(args.statement, args.format, args.chunk_rows), rules, args.date_format
+            )
+            print(monthly.to_string(index=False))
+            return
+        ledger = None
+        if args.ledger:
+            from ledger import Ledger, ledger_path
+
+            ledger = Ledger(ledger_path(args.data))
+        monthly = import_statement(
+            open_store(args.data), args.statement, args.format, rules, args.date_format, args.chunk_rows,
+            ledger=ledger
+        )
+        print(f"Imported {len(monthly)} months from {args.statement} into {args.data}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Transaction ledger underneath the monthly records.
+
+Transactions live in a SQLite table indexed by (month, column) and by
+(column, month), so drill-downs read only the rows they show. A rollups
+table holds the signed total and count per (month, column). Every add,
+edit or remove updates those totals in the same transaction by applying
+the change's delta, so the totals are never rebuilt from the ledger.
+
+Every imported line has a fingerprint: its date, description, amount and
+how many identical lines came before it in the statement. Fingerprints
+are unique, so importing a statement again, or one that overlaps an
+earlier import, adds only the lines not yet recorded; the rollups get the
+deltas of the rows actually inserted.
+
+The monthly records that the dashboard charts are produced from the
+rollups with `records` and saved through the records store. The charts
+therefore never scan the ledger.
+
+The ledger of finance_data.csv lives in finance_data.ledger.sqlite.
+"""
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from finance_core import MONTHS
+from importer import CATEGORY_COLUMNS, monthly_records, signed_amounts
+
+TRANSACTION_FIELDS = ["id", "Date", "Description", "Amount", "Column", "Month ordinal"]
+
+_ROLLUP_SQL = (
+    "INSERT INTO rollups (ordinal, category, total, count) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (ordinal, category) DO UPDATE SET "
+    "total = total + excluded.total, count = count + excluded.count"
+)
+
+
+def ledger_path(data_path):
+    """Ledger file kept next to a records file."""
+    return os.path.splitext(data_path)[0] + ".ledger.sqlite"
+
+
+def _placeholders(values):
+    return ", ".join("?" * len(values))
+
+
+def fingerprints(dates, descriptions, amounts, seen):
+    """
+    Identity of each statement line.
+
+    Parameters:
+    dates (list): "YYYY-MM-DD" strings
+    descriptions (list): Descriptions
+    amounts (list): Signed amounts
+    seen (dict): Lines counted so far per (date, description, amount),
+        carried across the chunks of one statement; updated in place
+
+    Returns:
+    list: "date|description|amount|occurrence" strings
+    """
+    base = pd.Series(dates, dtype=object) + "|" + pd.Series(descriptions, dtype=object).astype(str) \
+        + "|" + pd.Series(amounts, dtype=float).map(repr)
+    occurrence = base.groupby(base).cumcount() + base.map(seen).fillna(0).astype(np.int64)
+    seen.update((base.value_counts() + pd.Series(seen).reindex(base.unique()).fillna(0)).astype(int).to_dict())
+    return (base + "|" + occurrence.astype(str)).tolist()
+
+
+class Ledger:
+    """
+    Transactions with incrementally maintained monthly rollups.
+
+    Parameters:
+    path (str): Database file path
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER PRIMARY KEY,
+                date TEXT NOT NULL,
+                description TEXT NOT NULL,
+                amount REAL NOT NULL,
+                category TEXT NOT NULL,
+                ordinal INTEGER NOT NULL,
+                fingerprint TEXT
+            );
+            CREATE INDEX IF NOT EXISTS transactions_month ON transactions (ordinal, category);
+            CREATE INDEX IF NOT EXISTS transactions_category ON transactions (category, ordinal);
+            CREATE UNIQUE INDEX IF NOT EXISTS transactions_fingerprint ON transactions (fingerprint);
+            CREATE TABLE IF NOT EXISTS rollups (
+                ordinal INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                total REAL NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (ordinal, category)
+            ) WITHOUT ROWID;
+        """)
+
+    def _apply_deltas(self, ordinals, categories, amounts, counts):
+        """Add signed amounts and counts to the rollups; returns the months touched."""
+        deltas = pd.DataFrame({
+            "ordinal": ordinals,
+            "category": categories,
+            "total": signed_amounts(np.asarray(categories), np.asarray(amounts, dtype=float)),
+            "count": counts,
+        }).groupby(["ordinal", "category"], as_index=False).sum()
+        self._connection.executemany(
+            _ROLLUP_SQL,
+            zip(deltas["ordinal"].tolist(), deltas["category"].tolist(),
+                deltas["total"].tolist(), deltas["count"].tolist())
+        )
+        months = sorted(set(deltas["ordinal"].tolist()))
+        self._connection.execute(
+            f"DELETE FROM rollups WHERE count = 0 AND ordinal IN ({_placeholders(months)})", months
+        )
+        return set(months)
+
+    def _transaction(self, write):
+        with self._lock:
+            self._connection.execute("BEGIN")
+            try:
+                touched = write()
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+        return touched
+
+    def add(self, transactions, seen=None):
+        """
+        Record the transactions not recorded yet and add them to the rollups.
+
+        Parameters:
+        transactions (DataFrame): As returned by importer.prepare_transactions
+        seen (dict): fingerprints state shared by the chunks of one
+            statement; a fresh one treats transactions as a whole statement
+
+        Returns:
+        set: Month ordinals whose totals changed
+        """
+        if transactions.empty:
+            return set()
+        dates = pd.to_datetime(transactions["Date"]).dt.strftime("%Y-%m-%d").tolist()
+        descriptions = transactions["Description"].tolist()
+        amounts = transactions["Amount"].to_numpy(dtype=float).tolist()
+        rows = list(zip(
+            dates, descriptions, amounts, transactions["Column"].tolist(),
+            transactions["Month ordinal"].to_numpy(dtype=np.int64).tolist(),
+            fingerprints(dates, descriptions, amounts, {} if seen is None else seen)
+        ))
+
+        def write():
+            # Row ids only grow, so the rows inserted here are those above the current maximum
+            first_new = self._connection.execute("SELECT COALESCE(MAX(id), 0) FROM transactions").fetchone()[0]
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO transactions (date, description, amount, category, ordinal, fingerprint) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            inserted = self._connection.execute(
+                "SELECT ordinal, category, amount FROM transactions WHERE id > ?", (first_new,)
+            ).fetchall()
+            if not inserted:
+                return set()
+            ordinals, categories, inserted_amounts = zip(*inserted)
+            return self._apply_deltas(
+                np.array(ordinals, dtype=np.int64), np.array(categories, dtype=object),
+                np.array(inserted_amounts, dtype=float), np.ones(len(inserted), dtype=np.int64)
+            )
+
+        return self._transaction(write)
+
+    def _fetch(self, ids):
+        ids = [int(transaction_id) for transaction_id in ids]
+        rows = self._connection.execute(
+            f"SELECT id, date, description, amount, category, ordinal FROM transactions "
+            f"WHERE id IN ({_placeholders(ids)})", ids
+        ).fetchall()
+        return pd.DataFrame(rows, columns=TRANSACTION_FIELDS)
+
+    def edit(self, changes):
+        """
+        Change transactions, moving their amounts between rollups.
+
+        Edits leaving a transaction without a parseable date, a description,
+        a finite amount or a known column raise ValueError, and none of the
+        changes are written.
+
+        Parameters:
+        changes (dict): id -> {field: value} with fields among "Date",
+            "Description", "Amount" and "Column"
+
+        Returns:
+        set: Month ordinals whose totals changed
+        """
+        if not changes:
+            return set()
+
+        def write():
+            old = self._fetch(changes)
+            new = pd.DataFrame(
+                [{**row, **changes[row["id"]]} for row in old.to_dict("records")], columns=TRANSACTION_FIELDS
+            )
+            dates = pd.to_datetime(new["Date"], errors="coerce")
+            new["Amount"] = pd.to_numeric(new["Amount"], errors="coerce")
+            missing = {
+                "a valid date": dates.isna(),
+                "a description": new["Description"].fillna("").astype(str).str.strip() == "",
+                "an amount": ~np.isfinite(new["Amount"].to_numpy(dtype=float)),
+                "a category": ~new["Column"].isin(CATEGORY_COLUMNS),
+            }
+            for requirement, rows in missing.items():
+                if rows.any():
+                    raise ValueError(f"Transaction {new.loc[rows, 'id'].iloc[0]} needs {requirement}")
+            new["Date"] = dates.dt.strftime("%Y-%m-%d")
+            new["Month ordinal"] = dates.dt.year * 12 + dates.dt.month - 1
+            self._connection.executemany(
+                "UPDATE transactions SET date = ?, description = ?, amount = ?, category = ?, ordinal = ? "
+                "WHERE id = ?",
+                zip(new["Date"].tolist(), new["Description"].tolist(), new["Amount"].astype(float).tolist(),
+                    new["Column"].tolist(), new["Month ordinal"].tolist(), new["id"].tolist())
+            )
+            # Take the old values out of their rollups and add the new ones
+            return self._apply_deltas(
+                np.concatenate([old["Month ordinal"], new["Month ordinal"]]),
+                np.concatenate([old["Column"], new["Column"]]),
+                np.concatenate([-old["Amount"].to_numpy(dtype=float), new["Amount"].to_numpy(dtype=float)]),
+                np.concatenate([-np.ones(len(old), dtype=np.int64), np.ones(len(new), dtype=np.int64)])
+            )
+
+        return self._transaction(write)
+
+    def remove(self, ids):
+        """
+        Delete transactions and subtract them from the rollups.
+
+        Returns:
+        set: Month ordinals whose totals changed
+        """
+        if not ids:
+            return set()
+
+        def write():
+            old = self._fetch(ids)
+            self._connection.executemany(
+                "DELETE FROM transactions WHERE id = ?", [(transaction_id,) for transaction_id in old["id"].tolist()]
+            )
+            return self._apply_deltas(
+                old["Month ordinal"].to_numpy(), old["Column"].to_numpy(),
+                -old["Amount"].to_numpy(dtype=float), -np.ones(len(old), dtype=np.int64)
+            )
+
+        return self._transaction(write)
+
+    def months(self):
+        """Month ordinals that have transactions, oldest first."""
+        with self._lock:
+            rows = self._connection.execute("SELECT DISTINCT ordinal FROM rollups ORDER BY ordinal").fetchall()
+        return [ordinal for ordinal, in rows]
+
+    def records(self, ordinals):
+        """
+        Monthly records for the given months, built from the rollups.
+
+        Returns:
+        tuple: (upserts, deletes) for a store's write_batch; months left
+            without transactions are deleted
+        """
+        ordinals = sorted(int(ordinal) for ordinal in ordinals)
+        if not ordinals:
+            return [], []
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT ordinal, category, total FROM rollups WHERE ordinal IN ({_placeholders(ordinals)})",
+                ordinals
+            ).fetchall()
+        totals = pd.DataFrame(rows, columns=["ordinal", "category", "total"]).set_index(["ordinal", "category"])["total"]
+        upserts = monthly_records(totals).to_dict("records")
+        emptied = sorted(set(ordinals) - set(totals.index.get_level_values("ordinal").tolist()))
+        deletes = [(ordinal // 12, MONTHS[ordinal % 12]) for ordinal in emptied]
+        return upserts, deletes
+
+    def transactions(self, ordinal=None, column=None):
+        """
+        Drill-down: transactions of one month and/or column, read through an index.
+
+        Returns:
+        DataFrame: TRANSACTION_FIELDS columns ordered by date
+        """
+        conditions, values = [], []
+        if ordinal is not None:
+            conditions.append("ordinal = ?")
+            values.append(int(ordinal))
+        if column is not None:
+            conditions.append("category = ?")
+            values.append(column)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT id, date, description, amount, category, ordinal FROM transactions {where} ORDER BY date, id",
+                values
+            ).fetchall()
+        return pd.DataFrame(rows, columns=TRANSACTION_FIELDS)
@@ -0,0 +1,237 @@
+"""
+Tax lots of the market portfolio.
+
+Every buy is a lot, one row of a few parallel NumPy arrays (buy month,
+shares, cost per share, shares still held), so decades of monthly lots
+take a few kilobytes. Sells take shares from the lots first-in-first-out,
+last-in-first-out, or from lots named per sell. What each sell took from
+each lot is kept as disposals, parallel arrays of (lot, sell month,
+shares, price), from which realized gains are computed per lot.
+
+FIFO matching merges two sorted cumulative share axes: a sell takes the
+shares between the cumulative amounts sold before and after it, and
+searchsorted finds the lots that interval covers. LIFO walks a stack of
+open lots once; every lot leaves the stack at most once and every sell
+ends in at most one partly sold lot. Either way a batch of m sells
+against n lots costs O((n + m) log(n + m)).
+
+Gains and the capital gains tax are per lot: realized from the
+disposals, unrealized from the shares still held at a given price.
+"""
+import numpy as np
+
+from finance_core import capital_gains_tax
+
+LOT_METHODS = ("fifo", "lifo", "specific")
+# Share counts within this fraction of the holdings are rounding noise
+_TOLERANCE = 1e-9
+
+
+class LotBook:
+    """
+    Lots bought, and the sells matched against them.
+
+    Parameters:
+    ordinals (array-like): Buy month ordinal of every lot, non-decreasing
+    shares (array-like): Shares bought in every lot
+    prices (array-like): Price paid per share in every lot
+    """
+
+    def __init__(self, ordinals, shares, prices):
+        self.ordinals = np.asarray(ordinals, dtype=np.int64)
+        self.shares = np.asarray(shares, dtype=np.float64)
+        self.cost = np.broadcast_to(np.asarray(prices, dtype=np.float64), self.shares.shape).copy()
+        if self.ordinals.shape != self.shares.shape or self.ordinals.ndim != 1:
+            raise ValueError("Lot ordinals, shares and prices must be one value per lot")
+        if np.any(np.diff(self.ordinals) < 0):
+            raise ValueError("Lots must be given in buy order")
+        if not (np.isfinite(self.shares).all() and (self.shares >= 0).all()):
+            raise ValueError("Lot shares must be non-negative numbers")
+        if not (np.isfinite(self.cost).all() and (self.cost > 0).all()):
+            raise ValueError("Lot prices must be positive numbers")
+        self.remaining = self.shares.copy()
+        self._disposals = []
+        self._last_sell = None
+
+    def __len__(self):
+        return len(self.shares)
+
+    def _tolerance(self):
+        return _TOLERANCE * max(float(self.shares.sum()), 1.0)
+
+    def _limit_to_holdings(self, ordinals, shares, clip):
+        """
+        Shares each sell can take from the lots bought by its month.
+
+        With clip, sells beyond the holdings are cut down to them: the
+        cumulative amount sold after sell k is S_k + min(0, min_{j<=k}(H_j - S_j)),
+        with S the requested and H the available cumulative shares.
+        """
+        held = np.concatenate([[0.0], np.cumsum(self.remaining)])
+        available = held[np.searchsorted(self.ordinals, ordinals, side="right")]
+        sold = np.cumsum(shares)
+        shortfall = np.minimum.accumulate(np.minimum(available - sold, 0.0))
+        if not clip:
+            short = np.flatnonzero(shortfall < -self._tolerance())
+            if short.size:
+                k = short[0]
+                raise ValueError(
+                    f"Selling {sold[k] - (sold[k - 1] if k else 0.0):,.4f} shares in month ordinal "
+                    f"{ordinals[k]}, but only {available[k] - (sold[k - 1] if k else 0.0):,.4f} are held"
+                )
+            return shares
+        return np.maximum(np.diff(sold + shortfall, prepend=0.0), 0.0)
+
+    def _take_fifo(self, shares):
+        """Oldest shares first: split the sold interval at every lot boundary."""
+        lot_ends = np.cumsum(self.remaining)
+        sell_ends = np.cumsum(shares)
+        total = sell_ends[-1]
+        edges = np.union1d(lot_ends[lot_ends < total], sell_ends)
+        starts = np.concatenate([[0.0], edges[:-1]])
+        sizes = edges - starts
+        keep = sizes > self._tolerance()
+        starts = starts[keep]
+        lots = np.minimum(np.searchsorted(lot_ends, starts, side="right"), len(self) - 1)
+        sells = np.searchsorted(sell_ends, starts, side="right")
+        return lots, sells, sizes[keep]
+
+    def _take_lifo(self, ordinals, shares):
+        """Newest shares held at each sell first, from a stack of open lots."""
+        tolerance = self._tolerance()
+        bought = np.searchsorted(self.ordinals, ordinals, side="right").tolist()
+        remaining = self.remaining.tolist()
+        lots, sells, taken = [], [], []
+        stack, pushed = [], 0
+        for sell, (count, wanted) in enumerate(zip(bought, shares.tolist())):
+            stack.extend(range(pushed, count))
+            pushed = max(pushed, count)
+            while wanted > tolerance and stack:
+                lot = stack[-1]
+                take = min(wanted, remaining[lot])
+                if take > tolerance:
+                    lots.append(lot)
+                    sells.append(sell)
+                    taken.append(take)
+                remaining[lot] -= take
+                wanted -= take
+                if remaining[lot] <= tolerance:
+                    stack.pop()
+        return np.array(lots, dtype=np.int64), np.array(sells, dtype=np.int64), np.array(taken)
+
+    def _take_specific(self, ordinals, shares, lots):
+        """Each sell takes its shares from the lot it names."""
+        if lots.size and (lots.min() < 0 or lots.max() >= len(self)):
+            raise ValueError(f"Lots are numbered 0 to {len(self) - 1}")
+        early = np.flatnonzero(self.ordinals[lots] > ordinals)
+        if early.size:
+            raise ValueError(f"Sell in month ordinal {ordinals[early[0]]} is before lot {lots[early[0]]} was bought")
+        wanted = np.bincount(lots, weights=shares, minlength=len(self))
+        over = np.flatnonzero(wanted > self.remaining + self._tolerance())
+        if over.size:
+            raise ValueError(
+                f"Selling {wanted[over[0]]:,.4f} shares of lot {over[0]}, "
+                f"which holds {self.remaining[over[0]]:,.4f}"
+            )
+        return lots, np.arange(len(shares)), shares
+
+    def sell(self, ordinals, shares, prices, method="fifo", lots=None, clip=False):
+        """
+        Match a batch of sells against the lots.
+
+        Sells may come in any order within a batch, but not before a sell
+        of an earlier batch. A sell can take shares from lots bought in
+        its month or before.
+
+        Parameters:
+        ordinals (array-like): Month ordinal of every sell
+        shares (array-like): Shares sold
+        prices (array-like): Sale price per share
+        method (str): One of LOT_METHODS
+        lots (array-like): Lot number of every sell, for "specific"
+        clip (bool): Cut sells down to the shares held instead of raising
+            ValueError (not for "specific")
+
+        Returns:
+        ndarray: Shares each sell took, in the order given
+        """
+        if method not in LOT_METHODS:
+            raise ValueError(f"Unknown lot method {method}, expected one of {LOT_METHODS}")
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        shares = np.asarray(shares, dtype=np.float64)
+        prices = np.broadcast_to(np.asarray(prices, dtype=np.float64), shares.shape)
+        if ordinals.shape != shares.shape or ordinals.ndim != 1:
+            raise ValueError("Sell ordinals, shares and prices must be one value per sell")
+        if not (np.isfinite(shares).all() and (shares >= 0).all()):
+            raise ValueError("Sold shares must be non-negative numbers")
+        if not (np.isfinite(prices).all() and (prices > 0).all()):
+            raise ValueError("Sale prices must be positive numbers")
+        if method == "specific":
+            if lots is None or np.shape(lots) != shares.shape:
+                raise ValueError("Specific lot selection needs the lot of every sell")
+            lots = np.asarray(lots, dtype=np.int64)
+        if not shares.size:
+            return shares.copy()
+
+        order = np.argsort(ordinals, kind="stable")
+        ordinals, shares, prices = ordinals[order], shares[order], prices[order]
+        if self._last_sell is not None and ordinals[0] < self._last_sell:
+            raise ValueError(f"Sells must come after the last sell, in month ordinal {self._last_sell}")
+
+        if method == "specific":
+            lot, sell, taken = self._take_specific(ordinals, shares, lots[order])
+        else:
+            shares = self._limit_to_holdings(ordinals, shares, clip)
+            if shares.sum() <= self._tolerance():
+                lot = sell = np.empty(0, dtype=np.int64)
+                taken = np.empty(0)
+            elif method == "fifo":
+                lot, sell, taken = self._take_fifo(shares)
+            else:
+                lot, sell, taken = self._take_lifo(ordinals, shares)
+
+        self.remaining -= np.bincount(lot, weights=taken, minlength=len(self))
+        np.maximum(self.remaining, 0.0, out=self.remaining)
+        self._disposals.append((lot, ordinals[sell], taken, prices[sell]))
+        self._last_sell = int(ordinals[-1])
+
+        sold = np.empty_like(shares)
+        sold[order] = np.bincount(sell, weights=taken, minlength=len(shares))
+        return sold
+
+    @property
+    def disposals(self):
+        """dict: "lot", "ordinal", "shares" and "price" arrays, one entry per lot a sell took from."""
+        if not self._disposals:
+            empty = np.empty(0, dtype=np.int64)
+            return {"lot": empty, "ordinal": empty, "shares": np.empty(0), "price": np.empty(0)}
+        return dict(zip(["lot", "ordinal", "shares", "price"], map(np.concatenate, zip(*self._disposals))))
+
+    def realized(self):
+        """
+        Gains realized by the sells so far.
+
+        Returns:
+        tuple: (gains, tax) arrays with one entry per lot
+        """
+        disposals = self.disposals
+        lot = disposals["lot"]
+        gains = np.bincount(
+            lot, weights=disposals["shares"] * (disposals["price"] - self.cost[lot]), minlength=len(self)
+        )
+        return gains, capital_gains_tax(gains)
+
+    def unrealized(self, price):
+        """
+        Value and gains of the shares still held.
+
+        Parameters:
+        price (float): Current price per share
+
+        Returns:
+        tuple: (value, cost_basis, gains, tax) arrays with one entry per lot
+        """
+        value = self.remaining * price
+        basis = self.remaining * self.cost
+        gains = value - basis
+        return value, basis, gains, capital_gains_tax(gains)
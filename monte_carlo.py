@@ -0,0 +1,182 @@
+"""
+Stochastic portfolio projections.
+
+Return paths are simulated as one (paths x months) NumPy matrix. Work is
+split into fixed-size chunks, each with its own seed spawned from the
+caller's seed, so the result is the same whether the chunks run in this
+process or across a process pool.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from finance_core import capital_gains_tax
+
+PERCENTILES = (5, 25, 50, 75, 95)
+CHUNK_PATHS = 10_000
+# Below this many paths a process pool costs more to start than it saves
+PARALLEL_PATHS = 200_000
+
+
+def _monthly_growth(rng, paths, months, yearly_return, yearly_volatility, historical_returns):
+    """Draw a (months x paths) matrix of monthly growth factors."""
+    if historical_returns is not None:
+        # Bootstrap: resample whole months from the local return series
+        historical_growth = 1 + np.asarray(historical_returns, dtype=float) / 100
+        return rng.choice(historical_growth, size=(months, paths))
+
+    # Lognormal months whose mean compounds to the expected yearly return
+    sigma = yearly_volatility / 100 / np.sqrt(12)
+    mu = np.log1p(yearly_return / 100) / 12 - sigma ** 2 / 2
+    growth = rng.standard_normal(size=(months, paths))
+    growth *= sigma
+    growth += mu
+    return np.exp(growth, out=growth)
+
+
+def _simulate_chunk(seed, paths, months, current_portfolio, monthly_contribution,
+                    yearly_return, yearly_volatility, historical_returns, out=None):
+    """Simulate one chunk month-major, (months x paths), into out if given."""
+    rng = np.random.default_rng(seed)
+    growth = _monthly_growth(rng, paths, months, yearly_return, yearly_volatility, historical_returns)
+
+    # Contribution then growth each month:
+    # P_k = G_k * (P_0 + c * sum_{j<=k} 1 / G_{j-1}) with G the cumulative growth
+    cumulative = np.cumprod(growth, axis=0, out=growth)
+    values = np.empty_like(cumulative) if out is None else out
+    values[0] = 1.0
+    np.divide(1.0, cumulative[:-1], out=values[1:])
+    np.cumsum(values, axis=0, out=values)
+    values *= monthly_contribution
+    values += current_portfolio
+    values *= cumulative
+    return values
+
+
+def simulate_portfolio_paths(
+        current_portfolio,
+        monthly_contribution,
+        years,
+        yearly_return,
+        yearly_volatility=15.0,
+        paths=10_000,
+        seed=0,
+        historical_returns=None,
+        workers=1
+):
+    """
+    Simulate portfolio values month by month for many return paths.
+
+    Parameters:
+    current_portfolio (float): Current portfolio value
+    monthly_contribution (float): Monthly investment amount
+    years (int): Number of years to project
+    yearly_return (float): Expected yearly return percentage (normal model)
+    yearly_volatility (float): Yearly volatility percentage (normal model)
+    paths (int): Number of simulated paths
+    seed (int): Seed for the random generator
+    historical_returns (array-like): Monthly return percentages to bootstrap
+        from; when given the normal model is not used
+    workers (int): Processes to spread the chunks over; 1 runs in-process
+
+    Returns:
+    ndarray: Portfolio values with shape (paths, months), stored month-major
+    """
+    months = int(years) * 12
+    bounds = list(range(0, paths, CHUNK_PATHS)) + [paths]
+    chunks = list(zip(bounds[:-1], bounds[1:]))
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    args = (months, current_portfolio, monthly_contribution,
+            yearly_return, yearly_volatility, historical_returns)
+    values = np.empty((months, paths))
+
+    if workers > 1 and len(chunks) > 1:
+        # Spawn rather than fork: the Streamlit server is multi-threaded
+        context = multiprocessing.get_context("spawn")
+        sizes = [stop - start for start, stop in chunks]
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context) as pool:
+            results = pool.map(_simulate_chunk, seeds, sizes, *([arg] * len(chunks) for arg in args))
+            for (start, stop), result in zip(chunks, results):
+                values[:, start:stop] = result
+    else:
+        for (start, stop), chunk_seed in zip(chunks, seeds):
+            _simulate_chunk(chunk_seed, stop - start, *args, out=values[:, start:stop])
+
+    return values.T
+
+
+def _select_ranks(rows, ranks, low, high):
+    """Move the given order statistics of every row into place."""
+    if not ranks:
+        return
+    middle = len(ranks) // 2
+    rank = ranks[middle]
+    # Bisect the ranks so each pass is a cheap single-kth selection
+    rows[:, low:high].partition(rank - low, axis=1)
+    _select_ranks(rows, ranks[:middle], low, rank)
+    _select_ranks(rows, ranks[middle + 1:], rank + 1, high)
+
+
+def _percentile_bands(values):
+    """Nearest-rank percentiles per month, (len(PERCENTILES) x months); reorders values."""
+    paths = values.shape[0]
+    ranks = np.rint(np.asarray(PERCENTILES) / 100 * (paths - 1)).astype(np.intp)
+    by_month = np.ascontiguousarray(values.T)
+    _select_ranks(by_month, sorted(set(ranks.tolist())), 0, paths)
+    return by_month[:, ranks].T
+
+
+def monte_carlo_projection(
+        current_portfolio,
+        monthly_contribution,
+        years,
+        yearly_return,
+        yearly_volatility=15.0,
+        paths=10_000,
+        seed=0,
+        historical_returns=None,
+        workers=None,
+        cost_basis=None
+):
+    """
+    Summarize simulated paths as percentile bands.
+
+    Parameters are those of simulate_portfolio_paths; workers defaults to
+    the CPU count for PARALLEL_PATHS paths or more and to 1 below that.
+    cost_basis is what the current portfolio cost, which the tax on the
+    final value is measured from; it defaults to current_portfolio.
+
+    Returns:
+    dict: "percentiles" (the PERCENTILES tuple), "bands" (percentile x
+        month values), "final" (final value per percentile), "total_invested",
+        "final_after_tax" (final value per percentile after capital gains tax)
+    """
+    if workers is None:
+        workers = (os.cpu_count() or 1) if paths >= PARALLEL_PATHS else 1
+    values = simulate_portfolio_paths(
+        current_portfolio, monthly_contribution, years, yearly_return,
+        yearly_volatility, paths, seed, historical_returns, workers
+    )
+    bands = _percentile_bands(values)
+    final = bands[:, -1]
+    if cost_basis is None:
+        cost_basis = current_portfolio
+    total_invested = cost_basis + monthly_contribution * values.shape[1]
+    final_after_tax = final - capital_gains_tax(final - total_invested)
+
+    return {
+        "percentiles": PERCENTILES,
+        "bands": bands,
+        "final": final,
+        "total_invested": total_invested,
+        "final_after_tax": final_after_tax,
+    }
+
+
+def load_return_series(path):
+    """Read monthly return percentages from the "Return" column of a CSV file."""
+    with open(path) as f:
+        header = f.readline().strip().split(",")
+    return np.loadtxt(path, delimiter=",", skiprows=1, usecols=header.index("Return"), ndmin=1)
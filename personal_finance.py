@@ -1,232 +1,101 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
 import os
+import uuid
+
+from backtest import backtest, load_prices, rolling_backtest
+from charts import (
+    FigureCache,
+    build_backtest_figure,
+    build_detailed_projection_figure,
+    build_expense_pie_figure,
+    build_income_expenses_figure,
+    build_investment_figure,
+    build_monte_carlo_figure,
+    build_rolling_backtest_figure,
+    build_savings_rate_figure,
+    build_simple_projection_figure,
+)
+
+from finance_core import (
+    BASE_CURRENCY,
+    CURRENCIES,
+    CURRENCY_SYMBOLS,
+    EXPENSE_COLUMNS,
+    MONTHS,
+    TABLE_RETURNS,
+    calculate_future_portfolio,
+    calculate_portfolio_value,
+    calculate_realized_gains,
+    capital_gains_tax,
+    month_label,
+    month_starts,
+    summarize_history,
+)
+from fx import convert_history, load_rates, mixed_currency, rates_path
+from importer import CATEGORY_COLUMNS, import_statement
+from ledger import Ledger, ledger_path
+from lots import LOT_METHODS
+from monte_carlo import PERCENTILES, load_return_series, monte_carlo_projection
+from profiler import RerunTimer
+from storage import AMOUNT_COLUMNS, CURRENCY_COLUMNS, RECORD_COLUMNS, StaleWriteError, open_store
 
 # Page configuration
 st.set_page_config(layout="wide", page_title="Finance Dashboard", page_icon="💰")
-
-# Enhanced CSS Styling with enforced dark theme
-st.markdown("""
-    <style>
-    /* Force dark theme */
-    [data-testid="stAppViewContainer"], 
-    [data-testid="stHeader"],
-    section[data-testid="stSidebar"],
-    [data-testid="stToolbar"] {
-        background-color: #0e1117 !important;
-        color: #ffffff !important;
-    }
-
-    /* Headers */
-    h1, h2, h3, h4, h5, h6, .stMarkdown h1, .stMarkdown h2, .stMarkdown h3 {
-        color: #ffffff !important;
-        font-weight: 600 !important;
-    }
-
-    /* Ensure dark theme for all text elements */
-    p, span, div, label, .stMarkdown p {
-        color: #ffffff !important;
-    }
-
-    /* Style metrics containers */
-    [data-testid="stMetric"] {
-        background-color: #1e1e1e !important;
-        padding: 1rem !important;
-        border-radius: 0.5rem !important;
-        border: 1px solid #2d2d2d !important;
-    }
-
-    /* Style metric values and labels */
-    [data-testid="stMetricValue"] {
-        color: #ffffff !important;
-        font-size: 1.2rem !important;
-    }
-
-    /* Enhanced Select/Dropdown styling */
-    select,
-    .stSelectbox > div > div > select,
-    div[data-baseweb="select"] > div,
-    div[data-baseweb="select"] input {
-        background-color: #262730 !important;
-        color: #ffffff !important;
-        border-color: #404040 !important;
-    }
-
-    /* Style all dropdown-related elements */
-    div[data-baseweb="popover"] {
-        background-color: #262730 !important;
-    }
-
-    div[data-baseweb="popover"] * {
-        background-color: #262730 !important;
-        color: #ffffff !important;
-    }
-
-    div[data-baseweb="select"] * {
-        background-color: #262730 !important;
-        color: #ffffff !important;
-    }
-
-    /* Style the dropdown options container */
-    div[role="listbox"] {
-        background-color: #262730 !important;
-        border: 1px solid #404040 !important;
-    }
-
-    /* Style individual dropdown items */
-    div[role="option"] {
-        background-color: #262730 !important;
-        color: #ffffff !important;
-    }
-
-    /* Style dropdown hover state */
-    div[role="option"]:hover {
-        background-color: #404040 !important;
-    }
-
-    /* Style selected option */
-    div[aria-selected="true"] {
-        background-color: #404040 !important;
-        color: #ffffff !important;
-    }
-
-    /* Fix for white background in dropdowns */
-    .stSelectbox > div,
-    .stSelectbox > div > div {
-        background-color: #262730 !important;
-    }
-
-    /* Style the select value container */
-    div[data-baseweb="select"] div[data-testid="stMarkdown"] {
-        background-color: #262730 !important;
-        color: #ffffff !important;
-    }
-
-    [data-testid="stMetricDelta"] {
-        color: #00ff88 !important;
-    }
-
-    [data-testid="stMetricLabel"] {
-        color: #cccccc !important;
-    }
-
-    /* Style buttons consistently */
-    button, [data-testid="baseButton-secondary"] {
-        background-color: #262730 !important;
-        color: #ffffff !important;
-        border: 1px solid #404040 !important;
-    }
-
-    button:hover {
-        border-color: #00ff88 !important;
-    }
-
-    /* Style expanders */
-    [data-testid="stExpander"] {
-        background-color: #1e1e1e !important;
-        border-radius: 0.5rem !important;
-        border: 1px solid #2d2d2d !important;
-    }
-
-    /* Form inputs */
-    input, .stTextInput > div > div > input,
-    .stNumberInput > div > div > input,
-    .stSelectbox > div > div > select {
-        background-color: #262730 !important;
-        color: #ffffff !important;
-        border-color: #404040 !important;
-    }
-
-    /* Selectbox */
-    .stSelectbox > div > div::before {
-        background-color: #262730 !important;
-    }
-
-    /* Dataframe styling */
-    .dataframe {
-        background-color: #1e1e1e !important;
-        color: #ffffff !important;
-    }
-
-    .dataframe th {
-        background-color: #262730 !important;
-        color: #ffffff !important;
-    }
-
-    .dataframe td {
-        background-color: #1e1e1e !important;
-        color: #ffffff !important;
-    }
-
-    /* Force white text for all markdown */
-    .stMarkdown {
-        color: #ffffff !important;
-    }
-
-    /* Style tooltips */
-    .tooltip {
-        background-color: #1e1e1e !important;
-        color: #ffffff !important;
-    }
-
-    /* Override any Streamlit defaults */
-    .stApp {
-        background-color: #0e1117 !important;
-    }
-
-    .streamlit-expanderHeader {
-        color: #ffffff !important;
-    }
-
-    /* Sidebar */
-    [data-testid="stSidebarNav"] {
-        background-color: #0e1117 !important;
-    }
-
-    [data-testid="stSidebarNav"] li {
-        background-color: #1e1e1e !important;
-    }
-
-    /* Mobile-specific adjustments */
-    @media (max-width: 768px) {
-        .stMetric {
-            padding: 0.75rem !important;
-        }
-
-        [data-testid="stMetricValue"] {
-            font-size: 1rem !important;
-        }
-
-        .main .block-container {
-            padding: 1rem !important;
-        }
-    }
-    </style>
-""", unsafe_allow_html=True)
+# The dark theme is in .streamlit/config.toml, so the browser gets it once
+# instead of a stylesheet on every rerun
 
 # Get current month for default selection
 current_month = datetime.now().strftime("%B")
-months = [
-    "January", "February", "March", "April", "May", "June",
-    "July", "August", "September", "October", "November", "December"
-]
-
-# File for saving data
-file_path = "finance_data.csv"
+# Every value the "Yearly Stock Return" slider can take, all read from the
+# shared compounding table
+SLIDER_RETURNS = TABLE_RETURNS
+RECORDS_PAGE_SIZE = 12
+# Seconds edits wait for others before being written together
+WRITE_DELAY = 0.25
+
+# File for saving data; the extension picks the storage backend
+# (.csv, .feather/.arrow or .sqlite)
+file_path = os.environ.get("FINANCE_DATA_PATH", "finance_data.csv")
+# Imported transactions, kept for drill-down
+ledger_file_path = ledger_path(file_path)
+# Append-only exchange rates (Date, Currency, Rate); see fx.py
+fx_rates_path = rates_path(file_path)
+# Optional monthly market returns ("Return" column, %) for bootstrap simulations
+returns_file_path = "market_returns.csv"
+# Optional daily or monthly index closes (Date, Close) for backtests; see backtest.py
+prices_file_path = "index_prices.feather"
+
+
+@st.cache_resource
+def get_store(path):
+    # One store per file, shared by every session of this process; other
+    # server processes on the same file are picked up by refresh.
+    # Edits are written in the background, so submitting never waits on the disk.
+    return open_store(path, write_delay=WRITE_DELAY)
+
+
+@st.cache_resource
+def get_ledger(path):
+    return Ledger(path)
+
+
+# Section timings for this session; see the "Rerun Timings" debug panel
+if "rerun_timer" not in st.session_state:
+    st.session_state.rerun_timer = RerunTimer(session=uuid.uuid4().hex[:8])
+timer = st.session_state.rerun_timer
+timer.begin()
 
 # Initialize data storage
-if "data" not in st.session_state:
-    if os.path.exists(file_path):
-        st.session_state.data = pd.read_csv(file_path)
-    else:
-        st.session_state.data = pd.DataFrame(columns=[
-            "Month", "Year", "Income Salary", "Income plus", "Expenses Day-to-day",
-            "Expenses rent", "Expenses loan", "Expenses market",
-            "Expenses taxes", "Expenses mortgage", "Monthly left"
-        ])
+with timer.span("data_load"):
+    store = get_store(file_path)
+    # Picks up writes from other server processes; a few stat calls otherwise
+    store.refresh()
+    # Edits from other sessions bump the version, which keys every derived cache
+    if st.session_state.get("data_version") != store.version:
+        st.session_state.data, st.session_state.data_version = store.snapshot()
 
 if "yearly_return" not in st.session_state:
     st.session_state.yearly_return = 7  # Default value
@@ -234,585 +103,891 @@ if "yearly_return" not in st.session_state:
 def update_yearly_return():
     st.session_state.yearly_return = st.session_state.yearly_return_slider
 
-def calculate_portfolio_value(df, yearly_return):
-    if df.empty:
-        return 0, 0, 0, 0, 0
-
-    monthly_rate = (1 + yearly_return / 100) ** (1 / 12) - 1
-    current_date = datetime.now()
-
-    total_invested = 0
-    current_portfolio_value = 0
-
-    df['Date'] = pd.to_datetime(df.apply(lambda x: f"{x['Month']} {x['Year']}", axis=1))
-    df_sorted = df.sort_values('Date')
-
-    for _, row in df_sorted.iterrows():
-        investment_date = row['Date']
-        investment_amount = row['Expenses market']
-        if investment_amount <= 0:
-            continue
-
-        months_passed = relativedelta(current_date, investment_date).months + \
-                        12 * relativedelta(current_date, investment_date).years
-        current_value = investment_amount * (1 + monthly_rate) ** months_passed
+@st.cache_resource
+def get_figure_cache():
+    # Process-wide so unchanged charts are reused across reruns and sessions
+    return FigureCache(max_entries=64)
+
+
+figure_cache = get_figure_cache()
+
+
+@st.cache_data(max_entries=8, show_spinner="Simulating market paths...")
+def cached_monte_carlo_projection(current_portfolio, monthly_contribution, years, yearly_return,
+                                  yearly_volatility, paths, returns_source, cost_basis):
+    historical_returns = load_return_series(returns_source[0]) if returns_source else None
+    return monte_carlo_projection(
+        current_portfolio=current_portfolio,
+        monthly_contribution=monthly_contribution,
+        years=years,
+        yearly_return=yearly_return,
+        yearly_volatility=yearly_volatility,
+        paths=paths,
+        seed=0,
+        historical_returns=historical_returns,
+        cost_basis=cost_basis
+    )
 
-        total_invested += investment_amount
-        current_portfolio_value += current_value
 
-    portfolio_gains = current_portfolio_value - total_invested
-    tax_amount = 0.25 * portfolio_gains if portfolio_gains > 0 else 0
-    portfolio_after_tax = current_portfolio_value - tax_amount
+def file_key(path):
+    """Changes whenever the file is rewritten or appended to; None without one."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
 
-    return current_portfolio_value, total_invested, portfolio_gains, tax_amount, portfolio_after_tax
 
+@st.cache_resource(max_entries=4)
+def get_rates(path, key):
+    """Exchange rates, reloaded when the rate file's key changes."""
+    return load_rates(path)
 
-# Main layout
-st.title("💰 Personal Finance Dashboard")
-col_input, col_summary, col_projection = st.columns([1.2, 1, 1])
 
-with col_input:
-    with st.expander("📝 Add New Month Data", expanded=True):
-        with st.form("add_month_form", clear_on_submit=True):
-            # Set current month as default
-            month = st.selectbox("Month",
-                                 options=months,
-                                 index=months.index(current_month))
-            current_year = st.number_input("Year", value=datetime.now().year, min_value=2000, max_value=2100)
-
-            c1, c2 = st.columns(2)
-            with c1:
-                st.subheader("Income")
-                income_salary = st.number_input("Salary (₪)", value=0, step=100)
-                income_plus = st.number_input("Additional Income (₪)", value=0, step=100)
-
-            with c2:
-                st.subheader("Expenses")
-                expenses_day_to_day = st.number_input("Day-to-Day (₪)", value=0, step=100)
-                expenses_rent = st.number_input("Rent (₪)", value=0, step=100)
-                expenses_loan = st.number_input("Loan (₪)", value=0, step=100)
-                expenses_market = st.number_input("Market Investment (₪)", value=0, step=100)
-                expenses_taxes = st.number_input("Taxes (₪)", value=0, step=100)
-                expenses_mortgage = st.number_input("Mortgage (₪)", value=0, step=100)
-
-            monthly_left = income_salary + income_plus - (
-                    expenses_day_to_day + expenses_rent + expenses_loan +
-                    expenses_market + expenses_taxes + expenses_mortgage
-            )
+@st.cache_resource(max_entries=16)
+def converted_history(_data, path, version, currency, key):
+    """
+    The records with every amount in currency, at month-end rates.
 
-            submitted = st.form_submit_button("Add Month")
-            if submitted:
-                if not st.session_state.data.empty and any((st.session_state.data["Month"] == month) &
-                                                           (st.session_state.data["Year"] == current_year)):
-                    st.error(f"Data for {month} {current_year} already exists!")
-                else:
-                    new_row = {
-                        "Month": month,
-                        "Year": current_year,
-                        "Income Salary": income_salary,
-                        "Income plus": income_plus,
-                        "Expenses Day-to-day": expenses_day_to_day,
-                        "Expenses rent": expenses_rent,
-                        "Expenses loan": expenses_loan,
-                        "Expenses market": expenses_market,
-                        "Expenses taxes": expenses_taxes,
-                        "Expenses mortgage": expenses_mortgage,
-                        "Monthly left": monthly_left,
-                    }
-                    st.session_state.data = pd.concat([st.session_state.data, pd.DataFrame([new_row])],
-                                                      ignore_index=True)
-                    st.session_state.data.to_csv(file_path, index=False)
-                    st.success(f"Added data for {month} {current_year}")
+    Cached per (version, currency, rate file), so switching the display
+    currency back to one already shown does not rerun the rate join.
+    """
+    return convert_history(_data, get_rates(rates_path(path), key), currency)
 
-    if not st.session_state.data.empty:
-        st.subheader("📊 Monthly Records")
-        for index, row in st.session_state.data.iterrows():
-            col1, col2 = st.columns([0.95, 0.05])
-            with col1:
-                st.write(f"{row['Month']} {row['Year']}: ₪{row['Monthly left']:,.2f}")
-            with col2:
-                if st.button("🗑", key=f"delete_{index}"):
-                    st.session_state.data = st.session_state.data.drop(index).reset_index(drop=True)
-                    st.session_state.data.to_csv(file_path, index=False)
-                    st.rerun()
-
-with col_summary:
-    st.subheader("📈 Financial Summary")
 
-    if not st.session_state.data.empty:
-        current_bank_account = st.session_state.data["Monthly left"].sum()
-        yearly_return = st.slider(
-            "Yearly Stock Return (%)",
-            min_value=0,
-            max_value=20,
-            value=st.session_state.yearly_return,
-            key="yearly_return_slider",
-            on_change=update_yearly_return
-        )
+@st.cache_resource(max_entries=2)
+def get_prices(path, key):
+    """Index closes, reloaded when the price file's key changes."""
+    return load_prices(path)
 
-        current_portfolio, total_invested, portfolio_gains, tax_amount, portfolio_after_tax = \
-            calculate_portfolio_value(st.session_state.data, st.session_state.yearly_return)
 
-        overall_assets = current_bank_account + portfolio_after_tax
+@st.cache_resource(max_entries=8)
+def cached_backtest(_frame, data_key, path, key, lot_method):
+    """
+    Replay and rolling windows of the history data_key identifies.
 
-        st.metric("💳 Bank Account", f"₪{current_bank_account:,.2f}")
-        st.metric("💰 Portfolio Investment", f"₪{total_invested:,.2f}")
-        st.metric("📈 Portfolio Gains", f"₪{portfolio_gains:,.2f}")
-        st.metric("💸 Tax Amount (25%)", f"₪{tax_amount:,.2f}")
-        st.metric("📊 Portfolio After Tax", f"₪{portfolio_after_tax:,.2f}")
-        st.metric("🏦 Total Assets", f"₪{overall_assets:,.2f}")
+    Raises ValueError when the prices do not cover the market investments.
+    """
+    dates, closes = get_prices(path, key)
+    return backtest(_frame, dates, closes, lot_method), rolling_backtest(_frame, dates, closes)
 
 
-def calculate_future_portfolio(
-        current_portfolio,
-        yearly_return,
-        monthly_contribution,
-        years,
-        inflation_rate=2.0
-):
+@st.cache_resource(max_entries=16)
+def build_derived(_data, path, version, valuation_month, fx_key, lot_method):
     """
-    Calculate future portfolio value with more realistic assumptions.
+    Everything the summary, projections and analytics read from the history.
+
+    (path, version, fx_key) identifies the frame, so it is not hashed; the
+    result is shared read-only across reruns and sessions instead of being copied.
 
     Parameters:
-    current_portfolio (float): Current portfolio value
-    yearly_return (float): Expected yearly return percentage
-    monthly_contribution (float): Monthly investment amount
-    years (int): Number of years to project
-    inflation_rate (float): Expected yearly inflation rate percentage
+    _data (DataFrame): Monthly records, as loaded from the store or converted
+    path (str): Storage file the records come from
+    version (int): Store version of _data
+    valuation_month (int): Month ordinal of today, so valuations roll over monthly
+    fx_key (tuple): (currency, rate file key) _data was converted with, or
+        None if it is the store's frame as recorded
+    lot_method (str): Lots withdrawals are sold from, "fifo" or "lifo"
 
     Returns:
-    tuple: (nominal_values, real_values, total_invested)
+    dict: summarize_history's result plus "portfolio" (valuation five-tuple
+        of arrays indexed by SLIDER_RETURNS) and "realized" (realized gains
+        and tax arrays, likewise)
     """
-    months = years * 12
-    monthly_rate = (1 + yearly_return / 100) ** (1 / 12) - 1
-    monthly_inflation = (1 + inflation_rate / 100) ** (1 / 12) - 1
-
-    nominal_values = []
-    real_values = []
-    total_invested = current_portfolio
-
-    portfolio_nominal = current_portfolio
-    portfolio_real = current_portfolio
-
-    for _ in range(months):
-        # Add monthly contribution
-        portfolio_nominal += monthly_contribution
-        portfolio_real += monthly_contribution
+    # The store keeps the averages up to date as months change; they only
+    # apply to the amounts as recorded, if no write has landed since _data was read
+    totals, totals_version = get_store(path).running_totals()
+    derived = summarize_history(_data, totals if totals_version == version and fx_key is None else None)
+    derived["portfolio"] = calculate_portfolio_value(_data, SLIDER_RETURNS, method=lot_method)
+    derived["realized"] = calculate_realized_gains(_data, SLIDER_RETURNS, method=lot_method)
+    return derived
+
+
+@st.fragment(run_every=0.5)
+def render_pending_save():
+    """Save status, polled until the queued edits are on disk."""
+    status = store.durability()
+    if status["error"] is not None:
+        st.warning(f"⚠️ Saving failed, retrying: {status['error']}")
+    elif status["durable_version"] < status["version"]:
+        st.caption("⏳ Saving changes...")
+    else:
+        # A fragment cannot cancel its own timer; the full rerun draws the
+        # static status instead of this fragment, which stops the polling
+        st.rerun()
 
-        # Apply returns
-        portfolio_nominal *= (1 + monthly_rate)
-        portfolio_real *= (1 + monthly_rate)
 
-        # Apply inflation adjustment to real value
-        portfolio_real *= (1 - monthly_inflation)
+def stale_write_message(error):
+    months = ", ".join(f"{month} {year}" for year, month in error.keys)
+    return f"⚠️ {months} changed in another session. The latest data is shown; make your edits again."
 
-        total_invested += monthly_contribution
-        nominal_values.append(portfolio_nominal)
-        real_values.append(portfolio_real)
 
-    return nominal_values, real_values, total_invested
+def render_save_status():
+    if "stale_write" in st.session_state:
+        st.warning(st.session_state.pop("stale_write"))
+    status = store.durability()
+    if status["error"] is None and status["durable_version"] >= status["version"]:
+        st.caption("💾 All changes saved")
+    else:
+        render_pending_save()
 
 
-with col_projection:
-    st.subheader("🔮 Portfolio Projections")
+@st.fragment
+def render_records(records, data_version):
+    """
+    Paginated records editor.
 
-    if not st.session_state.data.empty:
-        years = st.slider("Projection Years", min_value=1, max_value=30, value=5)
-
-        # Tab creation
-        tab1, tab2 = st.tabs(["Simple Projection", "Detailed Projection"])
-
-        # Simple Projection (Original)
-        with tab1:
-            st.markdown("##### Current Portfolio Growth")
-            st.caption("Projects current portfolio value without additional contributions")
-
-            future_months = pd.date_range(start=datetime.now(), periods=years * 12, freq="M")
-            monthly_rate = (1 + st.session_state.yearly_return / 100) ** (1 / 12) - 1
-
-            future_portfolio = [current_portfolio]
-            for _ in range(len(future_months)):
-                future_portfolio.append(future_portfolio[-1] * (1 + monthly_rate))
-
-            fig_simple = go.Figure()
-            fig_simple.add_trace(go.Scatter(
-                x=future_months,
-                y=future_portfolio[1:],
-                mode='lines',
-                name='Portfolio Value',
-                line=dict(color="#00ff88", width=2)
-            ))
-            fig_simple.update_layout(
-                margin=dict(l=20, r=20, t=30, b=20),
-                height=400,
-                template="plotly_dark",
-                paper_bgcolor='rgba(0,0,0,0)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                font=dict(color='white'),
-                showlegend=False,
-                xaxis=dict(
-                    showgrid=True,
-                    gridcolor='rgba(128,128,128,0.2)',
-                    title=None
+    Runs as a fragment: paging and cell edits rerun only this panel, and
+    applying changes reruns the whole app since the data changed.
+    """
+    with timer.span("records"):
+        st.subheader("📊 Monthly Records")
+        st.caption("Tick 🗑 to delete months or edit amounts, then apply all changes at once")
+
+        # Only one page of records is sent to the browser, so the widget
+        # count stays the same however long the history gets
+        page_count = (len(records) - 1) // RECORDS_PAGE_SIZE + 1
+        page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1)
+        start = (page - 1) * RECORDS_PAGE_SIZE
+        page_records = records.iloc[start:start + RECORDS_PAGE_SIZE].reset_index(drop=True)
+        # A month mixing currencies has no meaningful total as entered
+        shown_left = page_records["Monthly left"].mask(mixed_currency(page_records))
+
+        edited_records = st.data_editor(
+            page_records.assign(Delete=False, **{"Monthly left": shown_left})[["Delete"] + RECORD_COLUMNS],
+            key=f"records_editor_{data_version}_{page}",
+            disabled=["Month", "Year", "Monthly left"],
+            column_config={
+                "Delete": st.column_config.CheckboxColumn("🗑"),
+                "Monthly left": st.column_config.NumberColumn(
+                    help="Blank for months with amounts in different currencies; "
+                         "the full data table shows it in the display currency"
                 ),
-                yaxis=dict(
-                    showgrid=True,
-                    gridcolor='rgba(128,128,128,0.2)',
-                    title="Portfolio Value (₪)"
-                )
-            )
-            st.plotly_chart(fig_simple, use_container_width=True)
-
-            final_portfolio_value = future_portfolio[-1]
-            final_gains = final_portfolio_value - total_invested
-            final_tax = 0.25 * final_gains if final_gains > 0 else 0
-            final_value_after_tax = final_portfolio_value - final_tax
-
-            c1, c2 = st.columns(2)
-            with c1:
-                st.metric("Projected Value", f"₪{final_portfolio_value:,.2f}")
-                st.metric("Projected Tax", f"₪{final_tax:,.2f}")
-            with c2:
-                st.metric("Projected Gains", f"₪{final_gains:,.2f}")
-                st.metric("After Tax Value", f"₪{final_value_after_tax:,.2f}")
-
-        # Detailed Projection (New)
-        with tab2:
-            st.markdown("##### Advanced Portfolio Projection")
-            st.caption("Projects future value including monthly contributions and inflation")
-
-            # Get the average monthly investment from historical data
-            avg_monthly_investment = st.session_state.data['Expenses market'].mean()
-
-            # Additional inputs for detailed projection
-            monthly_contribution = st.number_input(
-                "Monthly Investment (₪)",
-                value=float(avg_monthly_investment),
-                step=100.0,
-                help="Expected monthly contribution to your portfolio"
-            )
-            inflation_rate = st.slider(
-                "Expected Inflation Rate (%)",
-                min_value=0.0,
-                max_value=10.0,
-                value=2.0,
-                step=0.1,
-                help="Average annual inflation rate"
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+        st.caption(f"Page {page} of {page_count}")
+
+        if st.button("Apply Changes"):
+            deleted = edited_records["Delete"].to_numpy()
+            editable = AMOUNT_COLUMNS + CURRENCY_COLUMNS
+            changed = (edited_records[editable].to_numpy() != page_records[editable].to_numpy()).any(axis=1)
+            updated_records = edited_records.loc[changed & ~deleted, RECORD_COLUMNS]
+            updated_records["Monthly left"] = (
+                updated_records["Income Salary"] + updated_records["Income plus"]
+                - updated_records[EXPENSE_COLUMNS].sum(axis=1)
             )
+            deleted_keys = list(zip(edited_records.loc[deleted, "Year"], edited_records.loc[deleted, "Month"]))
+
+            if deleted_keys or not updated_records.empty:
+                try:
+                    # Rejected if another session changed these months since the page was drawn
+                    store.write_batch(
+                        updated_records.to_dict("records"), deleted_keys, expected_version=data_version
+                    )
+                except StaleWriteError as error:
+                    st.session_state.stale_write = stale_write_message(error)
+                except ValueError as error:
+                    # An invalid value, such as a cleared amount; nothing was written and
+                    # the edits stay in the editor to be corrected
+                    st.error(f"⚠️ Changes not applied: {error}")
+                    return
+                st.session_state.data, st.session_state.data_version = store.snapshot()
+                st.rerun()
+
+
+@st.fragment
+def render_valuation(derived, data_key, valuation_month, symbol, lot_method):
+    """
+    Financial summary and projections.
 
-            # Calculate detailed projections
-            nominal_values, real_values, total_future_invested = calculate_future_portfolio(
-                current_portfolio=current_portfolio,
-                yearly_return=st.session_state.yearly_return,
-                monthly_contribution=monthly_contribution,
-                years=years,
-                inflation_rate=inflation_rate
-            )
+    Runs as a fragment so the return, horizon, inflation and simulation
+    inputs rerun only these two columns, reading the cached derived history.
+    """
+    with timer.span("valuation"):
+        col_summary, col_projection = st.columns(2)
+
+        with col_summary:
+            with timer.span("summary"):
+                st.subheader("📈 Financial Summary")
+
+                if not derived["frame"].empty:
+                    current_bank_account = derived["bank_account"]
+                    yearly_return = st.slider(
+                        "Yearly Stock Return (%)",
+                        min_value=0,
+                        max_value=20,
+                        value=st.session_state.yearly_return,
+                        key="yearly_return_slider",
+                        on_change=update_yearly_return
+                    )
+
+                    current_portfolio, total_invested, portfolio_gains, tax_amount, portfolio_after_tax = (
+                        float(values[st.session_state.yearly_return]) for values in derived["portfolio"]
+                    )
+
+                    realized_gains, realized_tax = (
+                        float(values[st.session_state.yearly_return]) for values in derived["realized"]
+                    )
+
+                    overall_assets = current_bank_account + portfolio_after_tax
+
+                    st.metric("💳 Bank Account", f"{symbol}{current_bank_account:,.2f}", border=True)
+                    st.metric("💰 Portfolio Investment", f"{symbol}{total_invested:,.2f}", border=True)
+                    st.metric("📈 Portfolio Gains", f"{symbol}{portfolio_gains:,.2f}", border=True)
+                    st.metric("💸 Tax Amount (25%)", f"{symbol}{tax_amount:,.2f}", border=True)
+                    st.metric("📊 Portfolio After Tax", f"{symbol}{portfolio_after_tax:,.2f}", border=True)
+                    if realized_gains or realized_tax:
+                        st.metric(
+                            "🧾 Realized Gains",
+                            f"{symbol}{realized_gains:,.2f}",
+                            help=f"Gains on withdrawals; {symbol}{realized_tax:,.2f} tax at 25% per lot",
+                            border=True
+                        )
+                    st.metric("🏦 Total Assets", f"{symbol}{overall_assets:,.2f}", border=True)
+
+
+        with col_projection:
+            with timer.span("projection"):
+                st.subheader("🔮 Portfolio Projections")
+
+                if not derived["frame"].empty:
+                    years = st.slider("Projection Years", min_value=1, max_value=30, value=5)
+
+                    # Tab creation
+                    tab1, tab2, tab3, tab4 = st.tabs(
+                        ["Simple Projection", "Detailed Projection", "Monte Carlo", "Backtest"]
+                    )
+
+                    # Detailed projection inputs are rendered first so both tabs can
+                    # slice a single projection grid
+                    with tab2:
+                        st.markdown("##### Advanced Portfolio Projection")
+                        st.caption("Projects future value including monthly contributions and inflation")
+
+                        # Get the average monthly investment from historical data
+                        avg_monthly_investment = derived["avg_monthly_investment"]
+
+                        # Additional inputs for detailed projection
+                        monthly_contribution = st.number_input(
+                            f"Monthly Investment ({symbol})",
+                            value=float(avg_monthly_investment),
+                            step=100.0,
+                            help="Expected monthly contribution to your portfolio"
+                        )
+                        inflation_rate = st.slider(
+                            "Expected Inflation Rate (%)",
+                            min_value=0.0,
+                            max_value=10.0,
+                            value=2.0,
+                            step=0.1,
+                            help="Average annual inflation rate"
+                        )
+
+                    # Scenario 0 is the simple projection (no contributions), scenario 1
+                    # the detailed one
+                    nominal_grid, real_grid, invested_grid = calculate_future_portfolio(
+                        current_portfolio=current_portfolio,
+                        yearly_return=st.session_state.yearly_return,
+                        monthly_contribution=np.array([0.0, monthly_contribution]),
+                        years=years,
+                        inflation_rate=inflation_rate
+                    )
+                    # Month ends from the current month on, so the axis only changes monthly
+                    month_start = datetime(valuation_month // 12, valuation_month % 12 + 1, 1)
+                    future_months = pd.date_range(start=month_start, periods=years * 12, freq=pd.offsets.MonthEnd())
+
+                    # Simple Projection (Original)
+                    with tab1:
+                        with timer.span("simple"):
+                            st.markdown("##### Current Portfolio Growth")
+                            st.caption("Projects current portfolio value without additional contributions")
+
+                            future_portfolio = nominal_grid[0]
+
+                            fig_simple = figure_cache.get(
+                                "simple_projection",
+                                (data_key, st.session_state.yearly_return, years),
+                                lambda: build_simple_projection_figure(future_months, future_portfolio, symbol=symbol)
+                            )
+
+                            st.plotly_chart(fig_simple, use_container_width=True)
+
+                            final_portfolio_value = future_portfolio[-1]
+                            final_gains = final_portfolio_value - total_invested
+                            final_tax = capital_gains_tax(final_gains)
+                            final_value_after_tax = final_portfolio_value - final_tax
+
+                            c1, c2 = st.columns(2)
+                            with c1:
+                                st.metric("Projected Value", f"{symbol}{final_portfolio_value:,.2f}", border=True)
+                                st.metric("Projected Tax", f"{symbol}{final_tax:,.2f}", border=True)
+                            with c2:
+                                st.metric("Projected Gains", f"{symbol}{final_gains:,.2f}", border=True)
+                                st.metric("After Tax Value", f"{symbol}{final_value_after_tax:,.2f}", border=True)
+
+                    # Detailed Projection (New)
+                    with tab2:
+                        with timer.span("detailed"):
+                            nominal_values, real_values = nominal_grid[1], real_grid[1]
+                            # Future contributions are lots of their own; under one constant
+                            # return every lot gains alike, so the total gain is taxed as a whole
+                            total_future_invested = invested_grid[1] - current_portfolio + total_invested
+
+                            # Create the detailed projection chart
+                            fig_detailed = figure_cache.get(
+                                "detailed_projection",
+                                (data_key, st.session_state.yearly_return, years, monthly_contribution, inflation_rate),
+                                lambda: build_detailed_projection_figure(
+                                    future_months, nominal_values, real_values, symbol=symbol
+                                )
+                            )
+
+                            st.plotly_chart(fig_detailed, use_container_width=True)
+
+                            # Calculate and display detailed metrics
+                            final_portfolio_nominal = nominal_values[-1]
+                            final_portfolio_real = real_values[-1]
+                            final_gains = final_portfolio_nominal - total_future_invested
+                            final_tax = capital_gains_tax(final_gains)
+                            final_value_after_tax = final_portfolio_nominal - final_tax
+
+                            c1, c2 = st.columns(2)
+                            with c1:
+                                st.metric(
+                                    "Projected Nominal Value",
+                                    f"{symbol}{final_portfolio_nominal:,.2f}",
+                                    help="Future value without accounting for inflation",
+                                    border=True
+                                )
+                                st.metric(
+                                    "Total Invested",
+                                    f"{symbol}{total_future_invested:,.2f}",
+                                    help="Cost of the current holdings plus all future contributions",
+                                    border=True
+                                )
+                            with c2:
+                                st.metric(
+                                    "Projected Real Value",
+                                    f"{symbol}{final_portfolio_real:,.2f}",
+                                    help="Future value adjusted for inflation",
+                                    border=True
+                                )
+                                st.metric(
+                                    "After Tax Value",
+                                    f"{symbol}{final_value_after_tax:,.2f}",
+                                    help="Nominal value after 25% capital gains tax on profits",
+                                    border=True
+                                )
+
+                    # Monte Carlo Projection
+                    with tab3:
+                        with timer.span("monte_carlo"):
+                            st.markdown("##### Projection Range")
+                            st.caption("Simulates many market paths to show the spread of likely outcomes")
+
+                            return_models = ["Normal"]
+                            if os.path.exists(returns_file_path):
+                                return_models.append("Bootstrap")
+                            return_model = st.radio(
+                                "Return Model",
+                                options=return_models,
+                                horizontal=True,
+                                help=f"Bootstrap resamples monthly returns from {returns_file_path}"
+                            )
+                            yearly_volatility = st.slider(
+                                "Yearly Volatility (%)",
+                                min_value=0.0,
+                                max_value=40.0,
+                                value=15.0,
+                                step=0.5,
+                                disabled=return_model == "Bootstrap"
+                            )
+                            paths = st.select_slider("Simulated Paths", options=[1_000, 10_000, 50_000, 100_000], value=10_000)
+
+                            # The modification time keys the cache on the return file's contents
+                            returns_source = (returns_file_path, os.path.getmtime(returns_file_path)) \
+                                if return_model == "Bootstrap" else None
+                            simulation = cached_monte_carlo_projection(
+                                current_portfolio=current_portfolio,
+                                monthly_contribution=monthly_contribution,
+                                years=years,
+                                yearly_return=st.session_state.yearly_return,
+                                yearly_volatility=yearly_volatility,
+                                paths=paths,
+                                returns_source=returns_source,
+                                cost_basis=total_invested
+                            )
+                            bands = dict(zip(PERCENTILES, simulation["bands"]))
+
+                            fig_monte_carlo = figure_cache.get(
+                                "monte_carlo",
+                                (data_key, st.session_state.yearly_return, years, monthly_contribution,
+                                 returns_source, yearly_volatility, paths),
+                                lambda: build_monte_carlo_figure(future_months, bands, symbol=symbol)
+                            )
+
+                            st.plotly_chart(fig_monte_carlo, use_container_width=True)
+
+                            st.dataframe(
+                                pd.DataFrame({
+                                    "Percentile": [f"{percentile}th" for percentile in PERCENTILES],
+                                    f"Projected Value ({symbol})": simulation["final"],
+                                    f"After Tax Value ({symbol})": simulation["final_after_tax"],
+                                }).style.format(symbol + "{:,.2f}", subset=[f"Projected Value ({symbol})", f"After Tax Value ({symbol})"]),
+                                hide_index=True,
+                                use_container_width=True
+                            )
+
+                    # Historical Backtest
+                    with tab4:
+                        with timer.span("backtest"):
+                            st.markdown("##### Historical Backtest")
+                            st.caption("Replays your market investments against actual index closes")
+
+                            prices_key = file_key(prices_file_path)
+                            replay = None
+                            if prices_key is None:
+                                st.info(
+                                    f"Add daily or monthly index closes (Date, Close) to {prices_file_path} "
+                                    "to backtest; `python backtest.py convert` turns a CSV export into one"
+                                )
+                            else:
+                                try:
+                                    replay, rolling = cached_backtest(
+                                        derived["frame"], data_key, prices_file_path, prices_key, lot_method
+                                    )
+                                except ValueError as error:
+                                    st.warning(f"⚠️ {error}")
+
+                            if replay is not None:
+                                value, basis, gains, tax, after_tax = replay["portfolio"]
+                                c1, c2 = st.columns(2)
+                                with c1:
+                                    st.metric("Backtest Value", f"{symbol}{value:,.2f}", border=True)
+                                    st.metric("Backtest Tax", f"{symbol}{tax:,.2f}", border=True)
+                                with c2:
+                                    st.metric("Backtest Gains", f"{symbol}{gains:,.2f}", border=True)
+                                    st.metric("After Tax Value", f"{symbol}{after_tax:,.2f}", border=True)
+
+                                fig_backtest = figure_cache.get(
+                                    "backtest",
+                                    (data_key, prices_key),
+                                    lambda: build_backtest_figure(
+                                        month_starts(replay["ordinals"]),
+                                        replay["value"], replay["contributed"], symbol=symbol
+                                    )
+                                )
+                                st.plotly_chart(fig_backtest, use_container_width=True)
+
+                                st.markdown("###### Every Start Month")
+                                st.caption(
+                                    f"The same contributions started in each of {len(rolling):,} months from "
+                                    f"{rolling['Start'].iloc[0]:%b %Y} to {rolling['Start'].iloc[-1]:%b %Y}"
+                                )
+                                fig_rolling = figure_cache.get(
+                                    "rolling_backtest",
+                                    (data_key, prices_key),
+                                    lambda: build_rolling_backtest_figure(
+                                        rolling["Start"], rolling["Value"], rolling["Contributed"], symbol=symbol
+                                    )
+                                )
+                                st.plotly_chart(fig_rolling, use_container_width=True)
+                                st.dataframe(
+                                    pd.DataFrame({
+                                        "Percentile": [f"{percentile}th" for percentile in PERCENTILES],
+                                        f"Final Value ({symbol})": np.percentile(rolling["Value"], PERCENTILES),
+                                        f"Gains ({symbol})": np.percentile(rolling["Gains"], PERCENTILES),
+                                    }).style.format(symbol + "{:,.2f}", subset=[f"Final Value ({symbol})", f"Gains ({symbol})"]),
+                                    hide_index=True,
+                                    use_container_width=True
+                                )
+
+
+@st.fragment
+def render_transactions(ledger, data_version):
+    """
+    Drill-down into imported transactions by month and category.
 
-            # Create the detailed projection chart
-            fig_detailed = go.Figure()
-
-            fig_detailed.add_trace(go.Scatter(
-                x=future_months,
-                y=nominal_values,
-                mode='lines',
-                name='Nominal Value',
-                line=dict(color="#00ff88", width=2)
-            ))
-
-            fig_detailed.add_trace(go.Scatter(
-                x=future_months,
-                y=real_values,
-                mode='lines',
-                name='Real Value (Inflation Adjusted)',
-                line=dict(color="#88ffcc", width=2, dash='dash')
-            ))
-
-            fig_detailed.update_layout(
-                margin=dict(l=20, r=20, t=30, b=20),
-                height=400,
-                template="plotly_dark",
-                paper_bgcolor='rgba(0,0,0,0)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                font=dict(color='white'),
-                legend=dict(
-                    yanchor="top",
-                    y=0.99,
-                    xanchor="left",
-                    x=0.01
-                ),
-                xaxis=dict(
-                    showgrid=True,
-                    gridcolor='rgba(128,128,128,0.2)',
-                    title=None
-                ),
-                yaxis=dict(
-                    showgrid=True,
-                    gridcolor='rgba(128,128,128,0.2)',
-                    title="Portfolio Value (₪)"
-                )
+    Reads one month or category at a time through the ledger's indexes.
+    Applying edits updates the ledger rollups and rewrites only the months
+    they touched.
+    """
+    with timer.span("transactions"):
+        ledger_months = ledger.months()
+        if not ledger_months:
+            st.caption("No imported transactions yet")
+            return
+
+        c1, c2 = st.columns(2)
+        with c1:
+            ordinal = st.selectbox(
+                "Month",
+                options=[None] + ledger_months[::-1],
+                format_func=lambda value: "All months" if value is None else month_label(value, abbreviated=False),
+                index=1,
+                key="transactions_month"
             )
-            st.plotly_chart(fig_detailed, use_container_width=True)
+        with c2:
+            column = st.selectbox("Category", options=[None] + CATEGORY_COLUMNS,
+                                  format_func=lambda value: value or "All categories", key="transactions_column")
+        if ordinal is None and column is None:
+            st.caption("Pick a month or a category")
+            return
+
+        transactions = ledger.transactions(ordinal, column)
+        edited = st.data_editor(
+            transactions.assign(Delete=False)[["Delete", "id", "Date", "Description", "Amount", "Column"]],
+            key=f"transactions_editor_{data_version}_{ordinal}_{column}",
+            disabled=["id"],
+            column_config={
+                "Delete": st.column_config.CheckboxColumn("🗑"),
+                "Column": st.column_config.SelectboxColumn("Category", options=CATEGORY_COLUMNS, required=True),
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+        st.caption(f"{len(transactions):,} transactions")
+
+        if st.button("Apply Transaction Changes"):
+            fields = ["Date", "Description", "Amount", "Column"]
+            deleted = edited["Delete"].to_numpy()
+            changed = (edited[fields].astype(str).to_numpy() != transactions[fields].astype(str).to_numpy()).any(axis=1)
+            changes = {
+                row["id"]: {field: row[field] for field in fields}
+                for row in edited.loc[changed & ~deleted].to_dict("records")
+            }
+            try:
+                # Edits first: an invalid one is rejected before anything is removed
+                touched = ledger.edit(changes) | ledger.remove(edited.loc[deleted, "id"].tolist())
+            except ValueError as error:
+                st.error(f"⚠️ Changes not applied: {error}")
+                return
+            if touched:
+                store.write_batch(*ledger.records(touched))
+                st.session_state.data, st.session_state.data_version = store.snapshot()
+                st.rerun()
+
+
+def amount_input(label):
+    """Amount and currency inputs side by side; returns (amount, currency)."""
+    c_amount, c_currency = st.columns([2, 1])
+    with c_amount:
+        amount = st.number_input(label, value=0, step=100)
+    with c_currency:
+        currency = st.selectbox(f"{label} currency", CURRENCIES, label_visibility="hidden")
+    return amount, currency
 
-            # Calculate and display detailed metrics
-            final_portfolio_nominal = nominal_values[-1]
-            final_portfolio_real = real_values[-1]
-            final_gains = final_portfolio_nominal - total_future_invested
-            final_tax = 0.25 * final_gains if final_gains > 0 else 0
-            final_value_after_tax = final_portfolio_nominal - final_tax
 
-            c1, c2 = st.columns(2)
-            with c1:
-                st.metric(
-                    "Projected Nominal Value",
-                    f"₪{final_portfolio_nominal:,.2f}",
-                    help="Future value without accounting for inflation"
-                )
-                st.metric(
-                    "Total Invested",
-                    f"₪{total_future_invested:,.2f}",
-                    help="Current portfolio plus all future contributions"
+# Main layout
+st.title("💰 Personal Finance Dashboard")
+col_input, col_valuation = st.columns([1.2, 2])
+
+with col_input:
+    with st.expander("📝 Add New Month Data", expanded=True):
+        with timer.span("input_form"):
+            with st.form("add_month_form", clear_on_submit=True):
+                # Set current month as default
+                month = st.selectbox("Month",
+                                     options=MONTHS,
+                                     index=MONTHS.index(current_month))
+                current_year = st.number_input("Year", value=datetime.now().year, min_value=2000, max_value=2100)
+
+                c1, c2 = st.columns(2)
+                with c1:
+                    st.subheader("Income")
+                    income_salary, income_salary_currency = amount_input("Salary")
+                    income_plus, income_plus_currency = amount_input("Additional Income")
+
+                with c2:
+                    st.subheader("Expenses")
+                    expenses_day_to_day, expenses_day_to_day_currency = amount_input("Day-to-Day")
+                    expenses_rent, expenses_rent_currency = amount_input("Rent")
+                    expenses_loan, expenses_loan_currency = amount_input("Loan")
+                    expenses_market, expenses_market_currency = amount_input("Market Investment")
+                    expenses_taxes, expenses_taxes_currency = amount_input("Taxes")
+                    expenses_mortgage, expenses_mortgage_currency = amount_input("Mortgage")
+
+                monthly_left = income_salary + income_plus - (
+                        expenses_day_to_day + expenses_rent + expenses_loan +
+                        expenses_market + expenses_taxes + expenses_mortgage
                 )
-            with c2:
-                st.metric(
-                    "Projected Real Value",
-                    f"₪{final_portfolio_real:,.2f}",
-                    help="Future value adjusted for inflation"
+
+                replace = st.checkbox("Replace the month if it already exists")
+                submitted = st.form_submit_button("Add Month")
+                if submitted:
+                    exists = store.exists(current_year, month)
+                    if exists and not replace:
+                        st.error(f"Data for {month} {current_year} already exists!")
+                    else:
+                        new_row = {
+                            "Month": month,
+                            "Year": current_year,
+                            "Income Salary": income_salary,
+                            "Income plus": income_plus,
+                            "Expenses Day-to-day": expenses_day_to_day,
+                            "Expenses rent": expenses_rent,
+                            "Expenses loan": expenses_loan,
+                            "Expenses market": expenses_market,
+                            "Expenses taxes": expenses_taxes,
+                            "Expenses mortgage": expenses_mortgage,
+                            "Monthly left": monthly_left,
+                            **dict(zip(CURRENCY_COLUMNS, [
+                                income_salary_currency, income_plus_currency, expenses_day_to_day_currency,
+                                expenses_rent_currency, expenses_loan_currency, expenses_market_currency,
+                                expenses_taxes_currency, expenses_mortgage_currency,
+                            ])),
+                        }
+                        try:
+                            store.upsert(new_row, expected_version=st.session_state.data_version)
+                        except StaleWriteError as error:
+                            st.warning(stale_write_message(error))
+                        else:
+                            st.success(f"{'Replaced' if exists else 'Added'} data for {month} {current_year}")
+                        st.session_state.data, st.session_state.data_version = store.snapshot()
+
+    with st.expander("📥 Import Bank Statement"):
+        with timer.span("import"):
+            with st.form("import_statement_form", clear_on_submit=True):
+                statement = st.file_uploader(
+                    "Statement export",
+                    type=["csv", "ofx", "qfx", "qif"],
+                    help="CSV exports need Date, Description and Amount columns"
                 )
-                st.metric(
-                    "After Tax Value",
-                    f"₪{final_value_after_tax:,.2f}",
-                    help="Nominal value after 25% capital gains tax on profits"
+                st.caption(
+                    "Transactions already imported are skipped, so overlapping statements are safe; "
+                    "the months a statement covers are replaced by all their transactions"
                 )
 
+                if st.form_submit_button("Import") and statement is not None:
+                    try:
+                        with st.spinner("Importing transactions..."):
+                            imported = import_statement(store, statement, ledger=get_ledger(ledger_file_path))
+                    except ValueError as error:
+                        # Missing columns or unparseable dates and amounts
+                        st.error(f"⚠️ Could not import {statement.name}: {error}")
+                    else:
+                        st.success(f"Imported {len(imported)} months from {statement.name}")
+                    st.session_state.data, st.session_state.data_version = store.snapshot()
+
+    render_save_status()
+
+    if not st.session_state.data.empty:
+        render_records(st.session_state.data, st.session_state.data_version)
+
+# Built after the input form so a month added this run is included
+with timer.span("derive"):
+    today = datetime.now()
+    valuation_month = today.year * 12 + today.month - 1
+    currency = st.sidebar.selectbox(
+        "Display currency", CURRENCIES, index=CURRENCIES.index(BASE_CURRENCY), key="display_currency"
+    )
+    fx_rates_key = file_key(fx_rates_path)
+    try:
+        history = converted_history(
+            st.session_state.data, file_path, st.session_state.data_version, currency, fx_rates_key
+        )
+    except ValueError as error:
+        st.warning(f"⚠️ {error} in {fx_rates_path}; amounts are shown as recorded")
+        history, currency = st.session_state.data, BASE_CURRENCY
+    fx_key = None if history is st.session_state.data else (currency, fx_rates_key)
+    symbol = CURRENCY_SYMBOLS[currency]
+    lot_method = st.sidebar.selectbox(
+        "Withdrawal lots",
+        [method for method in LOT_METHODS if method != "specific"],
+        format_func=str.upper,
+        key="lot_method",
+        help="Which contributions a negative market investment sells first"
+    )
+    derived = build_derived(history, file_path, st.session_state.data_version, valuation_month, fx_key, lot_method)
+    # Identifies the history every cached figure was built from
+    data_key = (file_path, st.session_state.data_version, valuation_month, fx_key, lot_method)
+
+with col_valuation:
+    render_valuation(derived, data_key, valuation_month, symbol, lot_method)
+
 if not st.session_state.data.empty:
     with st.expander("📋 View Full Data Table"):
-        st.dataframe(st.session_state.data, use_container_width=True)
+        with timer.span("data_table"):
+            records = st.session_state.data
+            if history is records:
+                # Not converted: months mixing currencies are left blank
+                shown_left, left_label = records["Monthly left"].mask(mixed_currency(records)), "Monthly left"
+            else:
+                shown_left, left_label = history["Monthly left"], f"Monthly left ({currency})"
+            st.dataframe(
+                records[RECORD_COLUMNS].assign(**{"Monthly left": shown_left}),
+                column_config={"Monthly left": st.column_config.NumberColumn(left_label)},
+                use_container_width=True
+            )
+
+if os.path.exists(ledger_file_path):
+    with st.expander("🔎 Transactions"):
+        render_transactions(get_ledger(ledger_file_path), st.session_state.data_version)
+
+if st.query_params.get("debug"):
+    with st.sidebar.expander("🧰 Chart Cache", expanded=True):
+        st.dataframe(pd.DataFrame.from_dict(figure_cache.stats(), orient="index"), use_container_width=True)
 
 st.markdown("---")
 st.header("📊 Financial Analytics")
 
 if not st.session_state.data.empty:
-    # Prepare data
-    df = st.session_state.data.copy()
-    df['Date'] = pd.to_datetime(df.apply(lambda x: f"{x['Month']} {x['Year']}", axis=1))
-    df = df.sort_values('Date')
-
-    # Format dates for display
-    df['Display_Date'] = df['Date'].dt.strftime('%b %Y')
-
-    # 1. Income vs Expenses Breakdown
-    st.subheader("Income vs Expenses Over Time")
-    st.markdown(
-        '<p style="font-size: 0.9em; color: #888888;">Shows your total monthly income (green) versus expenses (red), helping you track your spending relative to earnings.</p>',
-        unsafe_allow_html=True)
-
-    total_expenses = df['Expenses Day-to-day'] + df['Expenses rent'] + df['Expenses loan'] + \
-                     df['Expenses market'] + df['Expenses taxes'] + df['Expenses mortgage']
-    total_income = df['Income Salary'] + df['Income plus']
-
-    fig_income_expenses = go.Figure()
-
-    fig_income_expenses.add_trace(go.Scatter(
-        x=df['Display_Date'],
-        y=total_income,
-        name='Total Income',
-        line=dict(color='#00ff88', width=2),
-        fill='tonexty'
-    ))
-
-    fig_income_expenses.add_trace(go.Scatter(
-        x=df['Display_Date'],
-        y=total_expenses,
-        name='Total Expenses',
-        line=dict(color='#ff4444', width=2),
-        fill='tonexty'
-    ))
-
-    fig_income_expenses.update_layout(
-        template='plotly_dark',
-        paper_bgcolor='rgba(0,0,0,0)',
-        plot_bgcolor='rgba(0,0,0,0)',
-        margin=dict(l=20, r=20, t=30, b=20),
-        height=400,
-        yaxis_title="Amount (₪)",
-        hovermode='x unified',
-        xaxis_title=None
-    )
+    # Sorted history with totals and ratios, shared with the other sections
+    with timer.span("analytics"):
+        df = derived["frame"]
+
+        # 1. Income vs Expenses Breakdown
+        with timer.span("income_expenses"):
+            st.subheader("Income vs Expenses Over Time")
+            st.markdown(
+                '<p style="font-size: 0.9em; color: #888888;">Shows your total monthly income (green) versus expenses (red), helping you track your spending relative to earnings.</p>',
+                unsafe_allow_html=True)
+
+            fig_income_expenses = figure_cache.get(
+                "income_expenses", data_key, lambda: build_income_expenses_figure(df, symbol=symbol)
+            )
 
-    st.plotly_chart(fig_income_expenses, use_container_width=True)
-
-    # 2. Expense Categories Breakdown
-    col1, col2 = st.columns(2)
-
-    with col1:
-        st.subheader("Expense Distribution")
-        st.markdown(
-            '<p style="font-size: 0.9em; color: #888888;">Breakdown of your total expenses by category, showing where most of your money goes.</p>',
-            unsafe_allow_html=True)
-
-        expense_categories = {
-            'Day-to-day': df['Expenses Day-to-day'].sum(),
-            'Rent': df['Expenses rent'].sum(),
-            'Loan': df['Expenses loan'].sum(),
-            'Market Investment': df['Expenses market'].sum(),
-            'Taxes': df['Expenses taxes'].sum(),
-            'Mortgage': df['Expenses mortgage'].sum()
-        }
-
-        fig_pie = go.Figure(data=[go.Pie(
-            labels=list(expense_categories.keys()),
-            values=list(expense_categories.values()),
-            hole=0.4,
-            marker=dict(colors=['#00ff88', '#00cc88', '#008866', '#ff4444', '#cc4444', '#884444'])
-        )])
-
-        fig_pie.update_layout(
-            template='plotly_dark',
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            margin=dict(l=20, r=20, t=30, b=20),
-            height=400,
-            showlegend=True
-        )
+            st.plotly_chart(fig_income_expenses, use_container_width=True)
 
-        st.plotly_chart(fig_pie, use_container_width=True)
+        # 2. Expense Categories Breakdown
+        col1, col2 = st.columns(2)
 
-    with col2:
-        st.subheader("Monthly Savings Rate")
-        st.markdown(
-            '<p style="font-size: 0.9em; color: #888888;">Your monthly savings as a percentage of income, with dashed line showing the average rate.</p>',
-            unsafe_allow_html=True)
+        with col1:
+            with timer.span("expense_distribution"):
+                st.subheader("Expense Distribution")
+                st.markdown(
+                    '<p style="font-size: 0.9em; color: #888888;">Breakdown of your total expenses by category, showing where most of your money goes.</p>',
+                    unsafe_allow_html=True)
 
-        savings_rate = (df['Monthly left'] / total_income * 100).round(2)
+                expense_categories = derived["expense_categories"]
 
-        fig_savings = go.Figure()
+                fig_pie = figure_cache.get(
+                    "expense_distribution", data_key, lambda: build_expense_pie_figure(expense_categories)
+                )
 
-        fig_savings.add_trace(go.Scatter(
-            x=df['Display_Date'],
-            y=savings_rate,
-            mode='lines+markers',
-            name='Savings Rate',
-            line=dict(color='#00ff88', width=2),
-            marker=dict(size=8)
-        ))
+                st.plotly_chart(fig_pie, use_container_width=True)
 
-        fig_savings.add_hline(
-            y=savings_rate.mean(),
-            line_dash="dash",
-            line_color="white",
-            annotation_text=f"Average: {savings_rate.mean():.1f}%"
-        )
+        with col2:
+            with timer.span("savings_rate"):
+                st.subheader("Monthly Savings Rate")
+                st.markdown(
+                    '<p style="font-size: 0.9em; color: #888888;">Your monthly savings as a percentage of income, with dashed line showing the average rate.</p>',
+                    unsafe_allow_html=True)
 
-        fig_savings.update_layout(
-            template='plotly_dark',
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            margin=dict(l=20, r=20, t=30, b=20),
-            height=400,
-            yaxis_title="Savings Rate (%)",
-            yaxis_range=[0, max(100, savings_rate.max() * 1.1)],
-            xaxis_title=None
-        )
+                avg_savings_rate, current_savings_rate = derived["metrics"]["Savings Rate"]
 
-        st.plotly_chart(fig_savings, use_container_width=True)
-
-    # 3. Monthly Investment Growth
-    st.subheader("Investment Contributions Over Time")
-    st.markdown(
-        '<p style="font-size: 0.9em; color: #888888;">Monthly investment amounts (bars) and cumulative total invested (white line) over time.</p>',
-        unsafe_allow_html=True)
-
-    fig_investment = go.Figure()
-
-    fig_investment.add_trace(go.Bar(
-        x=df['Display_Date'],
-        y=df['Expenses market'],
-        name='Monthly Investment',
-        marker_color='#00ff88'
-    ))
-
-    fig_investment.add_trace(go.Scatter(
-        x=df['Display_Date'],
-        y=df['Expenses market'].cumsum(),
-        name='Cumulative Investment',
-        line=dict(color='white', width=2),
-        yaxis='y2'
-    ))
-
-    fig_investment.update_layout(
-        template='plotly_dark',
-        paper_bgcolor='rgba(0,0,0,0)',
-        plot_bgcolor='rgba(0,0,0,0)',
-        margin=dict(l=20, r=20, t=30, b=20),
-        height=400,
-        yaxis_title="Monthly Investment (₪)",
-        yaxis2=dict(
-            title="Cumulative Investment (₪)",
-            overlaying='y',
-            side='right'
-        ),
-        showlegend=True,
-        hovermode='x unified',
-        xaxis_title=None
-    )
+                fig_savings = figure_cache.get(
+                    "savings_rate",
+                    data_key,
+                    lambda: build_savings_rate_figure(df, avg_savings_rate, derived["savings_rate_max"])
+                )
 
-    st.plotly_chart(fig_investment, use_container_width=True)
-
-    # 4. Key Metrics
-    st.subheader("Key Financial Metrics")
-    st.markdown('''
-            <p style="font-size: 0.9em; color: #888888;">
-            Summary of important financial indicators and their trends:
-            <br>• <b>Avg Monthly Savings</b>: Your average money left after all expenses each month. The delta shows how your latest month compares to this average.
-            <br>• <b>Avg Savings Rate</b>: The percentage of your income you typically save each month. The delta indicates if your latest month's savings rate was above or below average.
-            <br>• <b>Expense Efficiency</b>: The ratio of essential expenses (rent, mortgage, loan) to discretionary spending (day-to-day). Lower is better, indicating more controlled daily spending.
-            <br>• <b>Monthly Investment Ratio</b>: Your average monthly investment as a percentage of monthly income. Shows investment consistency relative to earnings.
-            </p>
-            ''', unsafe_allow_html=True)
-
-    metrics_col1, metrics_col2, metrics_col3, metrics_col4 = st.columns(4)
-
-    with metrics_col1:
-        average_savings = df['Monthly left'].mean()
-        st.metric(
-            "Avg Monthly Savings",
-            f"₪{average_savings:,.2f}",
-            delta=f"₪{df['Monthly left'].iloc[-1] - average_savings:,.2f} vs avg"
-        )
+                st.plotly_chart(fig_savings, use_container_width=True)
 
-    with metrics_col2:
-        avg_savings_rate = savings_rate.mean()
-        st.metric(
-            "Avg Savings Rate",
-            f"{avg_savings_rate:.1f}%",
-            delta=f"{savings_rate.iloc[-1] - avg_savings_rate:.1f}% vs avg"
-        )
+        # 3. Monthly Investment Growth
+        with timer.span("investment"):
+            st.subheader("Investment Contributions Over Time")
+            st.markdown(
+                '<p style="font-size: 0.9em; color: #888888;">Monthly investment amounts (bars) and cumulative total invested (white line) over time.</p>',
+                unsafe_allow_html=True)
 
-    with metrics_col3:
-        # Calculate essential vs discretionary spending ratio
-        essential_expenses = df['Expenses rent'] + df['Expenses mortgage'] + df['Expenses loan']
-        discretionary_expenses = df['Expenses Day-to-day']
-        expense_ratio = (essential_expenses / discretionary_expenses).mean()
-        current_ratio = (essential_expenses.iloc[-1] / discretionary_expenses.iloc[-1])
-
-        st.metric(
-            "Expense Efficiency",
-            f"{expense_ratio:.2f}",
-            delta=f"{current_ratio - expense_ratio:.2f} vs avg",
-            delta_color="inverse"  # Lower is better for this metric
-        )
+            fig_investment = figure_cache.get(
+                "investment", data_key, lambda: build_investment_figure(df, symbol=symbol)
+            )
+
+            st.plotly_chart(fig_investment, use_container_width=True)
+
+        # 4. Key Metrics
+        with timer.span("metrics"):
+            st.subheader("Key Financial Metrics")
+            st.markdown('''
+                    <p style="font-size: 0.9em; color: #888888;">
+                    Summary of important financial indicators and their trends:
+                    <br>• <b>Avg Monthly Savings</b>: Your average money left after all expenses each month. The delta shows how your latest month compares to this average.
+                    <br>• <b>Avg Savings Rate</b>: The percentage of your income you typically save each month. The delta indicates if your latest month's savings rate was above or below average.
+                    <br>• <b>Expense Efficiency</b>: The ratio of essential expenses (rent, mortgage, loan) to discretionary spending (day-to-day). Lower is better, indicating more controlled daily spending.
+                    <br>• <b>Monthly Investment Ratio</b>: Your average monthly investment as a percentage of monthly income. Shows investment consistency relative to earnings.
+                    <br>The table below averages each indicator over your last 3, 6 and 12 recorded months, and compares your latest month with the same month a year earlier.
+                    </p>
+                    ''', unsafe_allow_html=True)
+
+            metrics_col1, metrics_col2, metrics_col3, metrics_col4 = st.columns(4)
+
+            with metrics_col1:
+                average_savings, current_savings = derived["metrics"]["Monthly left"]
+                st.metric(
+                    "Avg Monthly Savings",
+                    f"{symbol}{average_savings:,.2f}",
+                    delta=f"{symbol}{current_savings - average_savings:,.2f} vs avg",
+                    border=True
+                )
+
+            with metrics_col2:
+                st.metric(
+                    "Avg Savings Rate",
+                    f"{avg_savings_rate:.1f}%",
+                    delta=f"{current_savings_rate - avg_savings_rate:.1f}% vs avg",
+                    border=True
+                )
 
-    with metrics_col4:
-        # Calculate average monthly investment ratio
-        monthly_investment_ratios = (df['Expenses market'] / (df['Income Salary'] + df['Income plus']) * 100)
-        avg_monthly_investment_ratio = monthly_investment_ratios.mean()
-        current_investment_ratio = monthly_investment_ratios.iloc[-1]
+            with metrics_col3:
+                # Essential vs discretionary spending ratio
+                expense_ratio, current_ratio = derived["metrics"]["Expense Ratio"]
 
-        st.metric(
-            "Monthly Investment Ratio",
-            f"{avg_monthly_investment_ratio:.1f}%",
-            delta=f"{current_investment_ratio - avg_monthly_investment_ratio:.1f}% vs avg"
-        )
+                st.metric(
+                    "Expense Efficiency",
+                    f"{expense_ratio:.2f}",
+                    delta=f"{current_ratio - expense_ratio:.2f} vs avg",
+                    delta_color="inverse",  # Lower is better for this metric
+                    border=True
+                )
+
+            with metrics_col4:
+                # Average monthly investment ratio
+                avg_monthly_investment_ratio, current_investment_ratio = derived["metrics"]["Investment Ratio"]
+
+                st.metric(
+                    "Monthly Investment Ratio",
+                    f"{avg_monthly_investment_ratio:.1f}%",
+                    delta=f"{current_investment_ratio - avg_monthly_investment_ratio:.1f}% vs avg",
+                    border=True
+                )
+
+            st.dataframe(
+                pd.DataFrame.from_dict(derived["trailing"], orient="index").rename(index={
+                    "Monthly left": f"Monthly Savings ({symbol})",
+                    "Savings Rate": "Savings Rate (%)",
+                    "Expense Ratio": "Expense Efficiency",
+                    "Investment Ratio": "Investment Ratio (%)",
+                }).rename(columns={"3m": "Last 3 months", "6m": "Last 6 months", "12m": "Last 12 months",
+                                   "YoY": "Change vs year before"}),
+                column_config={column: st.column_config.NumberColumn(format="%.2f") for column in
+                               ["Last 3 months", "Last 6 months", "Last 12 months", "Change vs year before"]},
+                use_container_width=True
+            )
 else:
     st.info("Add some financial data to see the analytics!")
+
+rerun = timer.finish()
+if st.query_params.get("debug"):
+    with st.sidebar.expander("⏱ Rerun Timings", expanded=True):
+        st.caption(
+            f"Rerun {rerun['rerun']} took {rerun['total'] * 1000:,.0f} ms · "
+            f"{timer.counts['full']} full, {timer.counts['fragment']} fragment reruns"
+        )
+        st.dataframe(
+            pd.DataFrame({"Span": list(rerun["spans"]), "ms": [seconds * 1000 for seconds in rerun["spans"].values()]}),
+            hide_index=True,
+            use_container_width=True
+        )
+        # Fragment reruns do not redraw the sidebar; they show up here on the next full rerun
+        st.dataframe(
+            pd.DataFrame(
+                [(past["rerun"], past["kind"], past["total"] * 1000) for past in reversed(timer.reruns)],
+                columns=["Rerun", "Kind", "ms"]
+            ),
+            hide_index=True,
+            use_container_width=True
+        )
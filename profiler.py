@@ -0,0 +1,123 @@
+"""
+Timing spans for dashboard reruns.
+
+A RerunTimer lives in each session's state. The script calls `begin` at
+the top and `finish` at the bottom, and wraps each section in
+`span(name)`. A span opened outside begin/finish is a fragment rerun and
+is recorded as a rerun of its own. Nested spans are named "outer/inner".
+
+Finished reruns are kept for the debug panel and, when configured through
+the environment, logged:
+
+- FINANCE_PROFILE_LOG: JSON-lines file, one line per rerun with its spans
+- FINANCE_CPROFILE: directory that gets a cProfile dump per rerun
+"""
+import cProfile
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+LOG_PATH = os.environ.get("FINANCE_PROFILE_LOG")
+CPROFILE_DIR = os.environ.get("FINANCE_CPROFILE")
+# Sessions share the log file
+_log_lock = threading.Lock()
+
+
+class RerunTimer:
+    """
+    Per-session span timings.
+
+    Parameters:
+    session (str): Identifies the session in log lines
+    history (int): Finished reruns kept for display
+    log_path (str): JSON-lines log, defaults to FINANCE_PROFILE_LOG
+    cprofile_dir (str): cProfile dump directory, defaults to FINANCE_CPROFILE
+    """
+
+    def __init__(self, session, history=50, log_path=LOG_PATH, cprofile_dir=CPROFILE_DIR):
+        self.session = session
+        self.log_path = log_path
+        self.cprofile_dir = cprofile_dir
+        self.reruns = deque(maxlen=history)
+        self.counts = Counter()
+        self._spans = None
+        self._stack = []
+        self._kind = None
+        self._started = None
+        self._profile = None
+
+    def begin(self, kind="full"):
+        """Start timing a rerun, dropping any unfinished one."""
+        self._spans = {}
+        self._stack = []
+        self._kind = kind
+        self._started = time.perf_counter()
+        if self.cprofile_dir:
+            if self._profile is not None:
+                self._profile.disable()
+            self._profile = cProfile.Profile()
+            try:
+                self._profile.enable()
+            except ValueError:
+                # Another session's rerun is being profiled
+                self._profile = None
+
+    def finish(self):
+        """
+        Record the current rerun.
+
+        Returns:
+        dict: "rerun", "kind", "timestamp", "total" and "spans" (name ->
+            seconds, in the order the spans closed)
+        """
+        total = time.perf_counter() - self._started
+        self.counts[self._kind] += 1
+        rerun = {
+            "session": self.session,
+            "rerun": sum(self.counts.values()),
+            "kind": self._kind,
+            "timestamp": datetime.now().isoformat(timespec="milliseconds"),
+            "total": total,
+            "spans": self._spans,
+        }
+        self.reruns.append(rerun)
+        self._spans = None
+
+        if self._profile is not None:
+            self._profile.disable()
+            os.makedirs(self.cprofile_dir, exist_ok=True)
+            self._profile.dump_stats(
+                os.path.join(self.cprofile_dir, f"rerun-{self.session}-{rerun['rerun']}.prof")
+            )
+            self._profile = None
+        if self.log_path:
+            line = json.dumps(rerun) + "\n"
+            with _log_lock, open(self.log_path, "a") as f:
+                f.write(line)
+        return rerun
+
+    @contextmanager
+    def span(self, name):
+        """Time the enclosed block as name; outside a rerun it is timed as a fragment rerun."""
+        fragment = self._spans is None
+        if fragment:
+            self.begin("fragment")
+        self._stack.append(name)
+        path = "/".join(self._stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._spans[path] = self._spans.get(path, 0.0) + time.perf_counter() - start
+            self._stack.pop()
+            if fragment:
+                self.finish()
+
+    @property
+    def last(self):
+        """The most recent finished rerun, or None."""
+        return self.reruns[-1] if self.reruns else None
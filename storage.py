@@ -0,0 +1,1135 @@
+"""
+Storage backends for the monthly records.
+
+The backend is picked from the file extension by `open_store`:
+
+- ``.csv``: a CSV snapshot plus an append-only journal (JournaledStore)
+- ``.feather`` / ``.arrow``: the same journal over a memory-mapped Arrow
+  snapshot with a fixed schema
+- ``.sqlite`` / ``.db``: a SQLite table with a unique (Year, Month) index
+
+Every backend exposes the loaded frame as `data`, a `version` counter
+bumped by every write, its RunningTotals as `totals`, and the same
+`snapshot`, `running_totals`, `exists`, `upsert`, `delete`, `write_batch`
+and `compact` operations, and loads with fixed dtypes instead of type
+inference. The totals are updated with the rows each write changes, so the
+headline averages never rescan the history.
+
+For the journaled backends, edits are appended to `path.journal` as one
+fsynced JSON record per line, so each edit costs a small write however
+long the history is. Once the journal grows past a threshold a background
+thread folds it into a new snapshot, written to a temporary file and
+atomically renamed over the old one. Records are keyed by (Year, Month)
+and are idempotent: replaying a journal over a snapshot that already
+contains it gives the same rows. A crash at any point of compaction
+therefore loses nothing, and a torn final journal line is dropped on load
+since it was never acknowledged.
+
+In memory the records use a compact schema (FRAME_DTYPES): months are an
+ordered categorical, years int16, amounts float64 (or float32 with
+FINANCE_AMOUNT_DTYPE=float32), and the currency of each entered amount a
+categorical of CURRENCIES. A precomputed "Month ordinal" column is added.
+`compact_frame` enforces this schema on every load and write, and rejects
+unknown months and currencies, out-of-range years, non-finite amounts and
+months recorded more than once.
+Files and rows without currency columns are in BASE_CURRENCY. Each
+store keeps an index from month ordinal to row position beside its frame,
+so `exists` is a dictionary lookup and `apply_records` updates, appends
+and drops rows by position instead of scanning the frame per record. A
+store's frame is shared read-only by every session: writes replace it and
+never modify it, and pandas copy-on-write keeps derived frames from
+writing through to it.
+
+Stores opened with a `write_delay` persist in the background: a write is
+applied in memory and returned at once, and a WriteBehind thread writes
+the edits queued during the delay with one journal append and fsync (or
+one SQLite transaction). `durability` reports how far persistence has
+got, and queued edits are flushed at interpreter exit.
+
+A store is meant to be opened once per process and shared by every
+session. Each write records the version that last changed each month, so
+a write passed the `expected_version` it was made against raises
+StaleWriteError instead of overwriting months changed after it. Server
+processes sharing a records file serialize journal appends and
+compactions through a FileLock on `path.lock`; `refresh` notices their
+writes with a few stat calls (SQLite: `PRAGMA data_version`), reads only
+what was appended, and bumps the version when the records changed.
+
+Convert between backends with:
+
+    python storage.py migrate finance_data.csv finance_data.sqlite
+"""
+import argparse
+import atexit
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from finance_core import BASE_CURRENCY, CURRENCIES, MONTH_INDEX, MONTHS, RunningTotals, month_label
+
+try:
+    import fcntl
+except ImportError:
+    # Without flock only threads of one process are serialized
+    fcntl = None
+
+AMOUNT_COLUMNS = [
+    "Income Salary", "Income plus", "Expenses Day-to-day",
+    "Expenses rent", "Expenses loan", "Expenses market",
+    "Expenses taxes", "Expenses mortgage", "Monthly left"
+]
+COLUMNS = ["Month", "Year"] + AMOUNT_COLUMNS
+KEY_COLUMNS = ["Year", "Month"]
+# Records file extensions open_store accepts
+STORE_EXTENSIONS = (".csv", ".feather", ".arrow", ".sqlite", ".db")
+# Currency of each entered amount. "Monthly left" is derived from them as
+# entered; for a month mixing currencies only fx.convert_history's value is shown
+CURRENCY_COLUMNS = [f"{column} currency" for column in AMOUNT_COLUMNS[:-1]]
+# Records without currency columns (files written before they existed,
+# rows built by the importer) are in BASE_CURRENCY
+RECORD_COLUMNS = COLUMNS + CURRENCY_COLUMNS
+# On-disk schema
+DTYPES = {
+    "Month": str,
+    "Year": "int64",
+    **{column: "float64" for column in AMOUNT_COLUMNS},
+    **{column: str for column in CURRENCY_COLUMNS},
+}
+# In-memory schema
+MONTH_DTYPE = pd.CategoricalDtype(MONTHS, ordered=True)
+CURRENCY_DTYPE = pd.CategoricalDtype(CURRENCIES)
+AMOUNT_DTYPE = os.environ.get("FINANCE_AMOUNT_DTYPE", "float64")
+FRAME_COLUMNS = RECORD_COLUMNS + ["Month ordinal"]
+FRAME_DTYPES = {
+    "Month": MONTH_DTYPE,
+    "Year": "int16",
+    **{column: AMOUNT_DTYPE for column in AMOUNT_COLUMNS},
+    **{column: CURRENCY_DTYPE for column in CURRENCY_COLUMNS},
+    "Month ordinal": "int32",
+}
+if AMOUNT_DTYPE not in ("float64", "float32"):
+    raise ValueError(f"FINANCE_AMOUNT_DTYPE must be float64 or float32, not {AMOUNT_DTYPE}")
+
+
+def empty_frame():
+    return pd.DataFrame(columns=FRAME_COLUMNS).astype(FRAME_DTYPES)
+
+
+def compact_frame(df):
+    """
+    Validate records and convert them to the in-memory schema.
+
+    Parameters:
+    df (DataFrame): Records with at least the COLUMNS columns; missing or
+        empty currencies are BASE_CURRENCY
+
+    Returns:
+    DataFrame: FRAME_COLUMNS with FRAME_DTYPES
+    """
+    months = df["Month"]
+    if not isinstance(months.dtype, pd.CategoricalDtype):
+        months = months.astype("category")
+    unknown = sorted(set(map(str, months.cat.categories)) - set(MONTHS))
+    if unknown or months.isna().any():
+        raise ValueError(f"Unknown month names {unknown[:5] or ['']}, expected one of {MONTHS}")
+    # Recode to calendar order without touching the strings again
+    codes = MONTH_DTYPE.categories.get_indexer(months.cat.categories)[months.cat.codes.to_numpy()]
+    years = df["Year"].to_numpy(dtype=np.int64)
+    if years.size and (years.min() < 1 or years.max() > 9999):
+        raise ValueError("Years must be between 1 and 9999")
+    amounts = df[AMOUNT_COLUMNS].to_numpy(dtype=AMOUNT_DTYPE)
+    if not np.isfinite(amounts).all():
+        raise ValueError("Amounts must be finite numbers")
+    ordinals = years * 12 + codes
+    # The key index and the running totals would disagree on a repeated month
+    if not pd.Index(ordinals).is_unique:
+        repeated = np.unique(ordinals[pd.Index(ordinals).duplicated()])
+        labels = [month_label(ordinal, abbreviated=False) for ordinal in repeated[:5].tolist()]
+        raise ValueError(f"Months recorded more than once: {', '.join(labels)}")
+
+    return pd.DataFrame({
+        "Month": pd.Categorical.from_codes(codes, dtype=MONTH_DTYPE),
+        "Year": years.astype(np.int16),
+        **dict(zip(AMOUNT_COLUMNS, amounts.T)),
+        **{column: _currency_values(df, column) for column in CURRENCY_COLUMNS},
+        "Month ordinal": ordinals.astype(np.int32),
+    })
+
+
+def _currency_values(df, column):
+    """df[column] as a CURRENCY_DTYPE categorical; missing values are BASE_CURRENCY."""
+    base = CURRENCY_DTYPE.categories.get_loc(BASE_CURRENCY)
+    if column not in df:
+        return pd.Categorical.from_codes(np.full(len(df), base, dtype=np.int8), dtype=CURRENCY_DTYPE)
+    values = df[column]
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype("category")
+    categories = values.cat.categories.astype(str)
+    unknown = sorted(set(categories[categories != ""]) - set(CURRENCIES))
+    if unknown:
+        raise ValueError(f"Unknown currencies {unknown[:5]}, expected one of {CURRENCIES}")
+    # Empty strings and missing values fall back to the base currency
+    lookup = np.append(CURRENCY_DTYPE.categories.get_indexer(categories), base)
+    lookup[lookup < 0] = base
+    return pd.Categorical.from_codes(lookup[values.cat.codes.to_numpy()].astype(np.int8), dtype=CURRENCY_DTYPE)
+
+
+def _storage_frame(df):
+    """Records in the on-disk schema."""
+    missing = [column for column in CURRENCY_COLUMNS if column not in df]
+    if missing:
+        df = df.assign(**dict.fromkeys(missing, BASE_CURRENCY))
+    df = df[RECORD_COLUMNS].astype(DTYPES)
+    if AMOUNT_DTYPE != "float64":
+        # float32 holds few cents exactly; store the amounts they stand for
+        df[AMOUNT_COLUMNS] = df[AMOUNT_COLUMNS].round(2)
+    return df
+
+
+def _fsync_directory(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _atomic_write(path, write, replace=os.replace):
+    """Call write(temp_path), fsync the result and atomically rename it to path with replace."""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    os.close(fd)
+    try:
+        write(temp_path)
+        with open(temp_path, "rb") as f:
+            os.fsync(f.fileno())
+        replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    _fsync_directory(path)
+
+
+def _arrow_schema(columns=RECORD_COLUMNS):
+    import pyarrow as pa
+
+    return pa.schema(
+        [("Month", pa.string()), ("Year", pa.int64())]
+        + [(column, pa.float64()) for column in AMOUNT_COLUMNS]
+        + [(column, pa.string()) for column in CURRENCY_COLUMNS if column in columns]
+    )
+
+
+def read_snapshot(path):
+    """
+    Load a CSV or Arrow snapshot with the fixed schema; missing files are empty.
+
+    Snapshots written before amounts had currencies (COLUMNS only) load
+    with every amount in BASE_CURRENCY.
+    """
+    if not os.path.exists(path):
+        return empty_frame()
+
+    if path.endswith(".csv"):
+        df = pd.read_csv(
+            path, dtype={**DTYPES, "Month": "category", **dict.fromkeys(CURRENCY_COLUMNS, "category")}
+        )
+        if list(df.columns) not in (RECORD_COLUMNS, COLUMNS):
+            raise ValueError(f"{path} columns {list(df.columns)} do not match {RECORD_COLUMNS}")
+        return compact_frame(df)
+
+    import pyarrow.feather as feather
+
+    table = feather.read_table(path, memory_map=True)
+    if not (table.schema.equals(_arrow_schema()) or table.schema.equals(_arrow_schema(COLUMNS))):
+        raise ValueError(f"{path} schema does not match the records schema:\n{table.schema}")
+    return compact_frame(table.to_pandas())
+
+
+def write_snapshot(df, path, replace=os.replace):
+    """
+    Atomically replace the CSV or Arrow snapshot at path with df.
+
+    Parameters:
+    df (DataFrame): Records to write
+    path (str): Snapshot path
+    replace (callable): Renames the written temporary file over path
+    """
+    df = _storage_frame(df)
+    if path.endswith(".csv"):
+        _atomic_write(path, lambda temp_path: df.to_csv(temp_path, index=False), replace)
+        return
+
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    # One uncompressed record batch so loads can memory-map whole columns
+    table = pa.Table.from_pandas(df, schema=_arrow_schema(), preserve_index=False).combine_chunks()
+    _atomic_write(
+        path, lambda temp_path: feather.write_feather(table, temp_path, compression="uncompressed"), replace
+    )
+
+
+def _ordinal(year, month):
+    """Month ordinal of a (year, month) key, or None for an unknown month."""
+    month_index = MONTH_INDEX.get(str(month))
+    return None if month_index is None else int(year) * 12 + month_index
+
+
+def record_index(df):
+    """Position of every record in df, keyed by month ordinal."""
+    return dict(zip(df["Month ordinal"].tolist(), range(len(df))))
+
+
+def apply_records(df, index, records, totals=None):
+    """
+    Apply journal records (upserts and deletes) to df through its key index.
+
+    Only the last record of each (Year, Month) matters, since an upsert
+    replaces the whole row. Existing rows are updated in place, new rows
+    are appended in one concat and deleted rows dropped in one pass, so a
+    batch costs one copy of df however many records it has.
+
+    Parameters:
+    df (DataFrame): Records in the compact schema
+    index (dict): record_index(df); updated in place unless rows are deleted
+    records (list): Journal records in the order they were written
+    totals (RunningTotals): Running totals of df, updated in place with the
+        rows replaced, removed and added
+
+    Returns:
+    tuple: (DataFrame, dict) the new records and their index
+    """
+    last = {}
+    for record in records:
+        ordinal = _ordinal(record["key"]["Year"], record["key"]["Month"])
+        if ordinal is None:
+            continue
+        last.pop(ordinal, None)
+        last[ordinal] = record
+
+    removed = [index[ordinal] for ordinal, record in last.items() if record["op"] == "delete" and ordinal in index]
+    upserts = [record["row"] for record in last.values() if record["op"] == "upsert"]
+    added = None
+    if upserts:
+        rows = compact_frame(pd.DataFrame(upserts))
+        positions = np.array([index.get(ordinal, -1) for ordinal in rows["Month ordinal"].tolist()])
+        updated = positions >= 0
+        if updated.any():
+            if totals is not None:
+                totals.remove(df.iloc[positions[updated]])
+                totals.add(rows[updated])
+            df = df.copy()
+            df.iloc[positions[updated], [df.columns.get_loc(column) for column in AMOUNT_COLUMNS]] = (
+                rows.loc[updated, AMOUNT_COLUMNS].to_numpy()
+            )
+            for column in CURRENCY_COLUMNS:
+                df.iloc[positions[updated], df.columns.get_loc(column)] = rows.loc[updated, column].to_numpy()
+        added = rows[~updated].reset_index(drop=True)
+
+    if totals is not None:
+        if removed:
+            totals.remove(df.iloc[removed])
+        if added is not None:
+            totals.add(added)
+    if removed:
+        keep = np.ones(len(df), dtype=bool)
+        keep[removed] = False
+        df = df[keep].reset_index(drop=True)
+    if added is not None and not added.empty:
+        start = len(df)
+        df = added if df.empty else pd.concat([df, added], ignore_index=True)
+        if not removed:
+            index.update(zip(added["Month ordinal"].tolist(), range(start, len(df))))
+    if removed:
+        index = record_index(df)
+    if totals is not None:
+        totals.refresh_latest(df)
+    return df, index
+
+
+def _plain(value):
+    """Python scalar for a NumPy scalar from a DataFrame row."""
+    return value.item() if hasattr(value, "item") else value
+
+
+def _key(year, month):
+    return int(year), str(month)
+
+
+class WriteBehind:
+    """
+    Background writer that persists queued items in batches.
+
+    Items submitted within `delay` seconds of each other are written by
+    one `flush` call. A failed flush keeps its items queued and is retried.
+
+    Parameters:
+    flush (callable): Durably writes a list of items; runs on the worker thread
+    delay (float): Seconds to wait after an item arrives for others to join it
+    name (str): Worker thread name
+    retry_delay (float): Seconds between attempts after a failed flush
+    shutdown_timeout (float): Longest wait at interpreter exit for queued items
+    """
+
+    def __init__(self, flush, delay, name, retry_delay=1.0, shutdown_timeout=60.0):
+        self._flush = flush
+        self.delay = delay
+        self.retry_delay = retry_delay
+        self._condition = threading.Condition()
+        self._pending = []
+        self._drains = 0
+        self.submitted_version = 0
+        self.durable_version = 0
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.drain, shutdown_timeout)
+
+    def submit(self, version, items):
+        """Queue items that bring the store to version."""
+        with self._condition:
+            self._pending.append((version, items))
+            self.submitted_version = version
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                # Let a burst of edits join this write, unless someone is waiting on it
+                self._condition.wait_for(lambda: self._drains, timeout=self.delay)
+                batch, self._pending = self._pending, []
+            try:
+                self._flush([item for _, items in batch for item in items])
+            except Exception as error:
+                with self._condition:
+                    self._pending = batch + self._pending
+                    self.error = error
+                    self._condition.notify_all()
+                time.sleep(self.retry_delay)
+                continue
+            with self._condition:
+                self.durable_version = batch[-1][0]
+                self.error = None
+                self._condition.notify_all()
+
+    def drain(self, timeout=None):
+        """
+        Wait until everything submitted is durable.
+
+        Returns:
+        bool: False if timeout passed first
+        """
+        with self._condition:
+            self._drains += 1
+            self._condition.notify_all()
+            try:
+                return self._condition.wait_for(
+                    lambda: self.durable_version >= self.submitted_version, timeout
+                )
+            finally:
+                self._drains -= 1
+
+
+def _durability(version, writer):
+    """Durability status of a store at version persisted by writer (None when synchronous)."""
+    if writer is None:
+        return {"version": version, "durable_version": version, "error": None}
+    with writer._condition:
+        return {"version": version, "durable_version": writer.durable_version, "error": writer.error}
+
+
+def _batch_records(upserts, deletes):
+    """Journal records for a batch: deletes first, then upserts."""
+    upserts = list(upserts)
+    if upserts:
+        # Reject invalid rows before anything is journaled
+        compact_frame(pd.DataFrame(upserts))
+    records = [{"op": "delete", "key": {"Year": year, "Month": month}} for year, month in deletes]
+    records += [
+        {"op": "upsert", "key": {column: row[column] for column in KEY_COLUMNS}, "row": dict(row)}
+        for row in upserts
+    ]
+    return records
+
+
+class StaleWriteError(ValueError):
+    """
+    A write was based on records that another writer has changed since.
+
+    Parameters:
+    keys (list): (year, month) pairs changed after expected_version
+    expected_version (int): Store version the write was based on
+    """
+
+    def __init__(self, keys, expected_version):
+        self.keys = keys
+        self.expected_version = expected_version
+        names = ", ".join(f"{month} {year}" for year, month in keys[:5])
+        super().__init__(f"{names} changed since version {expected_version}")
+
+
+def _record_ordinals(records):
+    ordinals = (_ordinal(record["key"]["Year"], record["key"]["Month"]) for record in records)
+    return [ordinal for ordinal in ordinals if ordinal is not None]
+
+
+def _check_stale(key_versions, records, expected_version):
+    """Raise StaleWriteError if a record's key changed after expected_version; None skips the check."""
+    if expected_version is None:
+        return
+    stale = sorted({
+        ordinal for ordinal in _record_ordinals(records) if key_versions.get(ordinal, 0) > expected_version
+    })
+    if stale:
+        raise StaleWriteError([(ordinal // 12, MONTHS[ordinal % 12]) for ordinal in stale], expected_version)
+
+
+def _changed_ordinals(old, old_index, new, new_index, ordinals=None):
+    """Month ordinals whose record was added, removed or changed between two frames, among ordinals if given."""
+    if ordinals is None:
+        ordinals = old_index.keys() | new_index.keys()
+    changed = {ordinal for ordinal in ordinals if (ordinal in old_index) != (ordinal in new_index)}
+    common = [ordinal for ordinal in ordinals if ordinal in old_index and ordinal in new_index]
+    if common:
+        old_positions = [old_index[ordinal] for ordinal in common]
+        new_positions = [new_index[ordinal] for ordinal in common]
+        differs = (
+            old[AMOUNT_COLUMNS].to_numpy()[old_positions] != new[AMOUNT_COLUMNS].to_numpy()[new_positions]
+        ).any(axis=1)
+        for column in CURRENCY_COLUMNS:
+            differs |= old[column].cat.codes.to_numpy()[old_positions] != new[column].cat.codes.to_numpy()[new_positions]
+        changed.update(np.array(common)[differs].tolist())
+    return changed
+
+
+def _stat(path):
+    """(inode, mtime, size) of path, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class FileLock:
+    """
+    Exclusive lock on a lock file, shared by threads and by processes.
+
+    Reentrant within a thread. Processes are serialized with flock where
+    the platform has it, so server processes opening the same records
+    file take turns writing it.
+
+    Parameters:
+    path (str): Lock file, created if missing
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        self._depth += 1
+        if self._depth == 1 and fcntl is not None:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0 and fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+
+class _Unwritten:
+    """Latest record per key that was queued on a WriteBehind thread and is not written yet."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Month ordinal -> [records queued, latest record]
+        self._records = {}
+
+    def add(self, records):
+        with self._lock:
+            for record in records:
+                ordinal = _ordinal(record["key"]["Year"], record["key"]["Month"])
+                if ordinal is None:
+                    continue
+                entry = self._records.setdefault(ordinal, [0, None])
+                entry[0] += 1
+                entry[1] = record
+
+    def remove(self, records):
+        with self._lock:
+            for ordinal in _record_ordinals(records):
+                entry = self._records[ordinal]
+                entry[0] -= 1
+                if not entry[0]:
+                    del self._records[ordinal]
+
+    def records(self):
+        """Month ordinal -> latest unwritten record."""
+        with self._lock:
+            return {ordinal: entry[1] for ordinal, entry in self._records.items()}
+
+
+class JournaledStore:
+    """
+    Snapshot plus append-only journal for the monthly records.
+
+    Parameters:
+    path (str): Snapshot path (.csv, .feather or .arrow); the journal lives next to it
+    compact_after (int): Journal records that trigger a background compaction
+    write_delay (float): Append to the journal on a WriteBehind thread after
+        this many seconds; None appends before each write returns
+    """
+
+    def __init__(self, path, compact_after=256, write_delay=None):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.compacting_path = path + ".journal.compacting"
+        self.compact_after = compact_after
+        self._lock = threading.Lock()
+        # Held while the journal file is read, appended to or renamed
+        self._file_lock = FileLock(path + ".lock")
+        self._compactor = None
+        self._journal_records = 0
+        self.version = 0
+        # Month ordinal -> version of the last write that changed it
+        self._key_versions = {}
+        self._unwritten = _Unwritten()
+        with self._file_lock:
+            self.data, self._index = self._replay()
+        self.totals = RunningTotals.from_frame(self.data)
+        self._writer = None if write_delay is None else WriteBehind(
+            lambda records: self._append(records, queued=True), write_delay, "journal-writer"
+        )
+
+    def _replay(self):
+        df = read_snapshot(self.path)
+
+        # A journal left by an interrupted compaction is replayed first
+        compacting, _ = self._read_journal(self.compacting_path)
+        journal, end = self._read_journal(self.journal_path)
+        self._journal_records = len(compacting) + len(journal)
+        # What was read, so refresh can tell when another process changed the files
+        self._files = (_stat(self.path), _stat(self.compacting_path))
+        journal_stat = _stat(self.journal_path)
+        self._journal = None if journal_stat is None else (journal_stat[0], end)
+        return apply_records(df, record_index(df), compacting + journal)
+
+    @staticmethod
+    def _read_journal(journal_path, offset=0):
+        """Records from offset up to the last complete line, and the offset after it."""
+        if not os.path.exists(journal_path):
+            return [], 0
+
+        records = []
+        valid_bytes = offset
+        with open(journal_path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+                valid_bytes += len(line)
+
+        # Drop a torn tail so later appends start on a clean line
+        if valid_bytes < os.path.getsize(journal_path):
+            with open(journal_path, "r+b") as f:
+                f.truncate(valid_bytes)
+                os.fsync(f.fileno())
+        return records, valid_bytes
+
+    def _append(self, records, queued=False):
+        # One append and one fsync for all the records
+        lines = "".join(json.dumps(record, default=_plain) + "\n" for record in records)
+        with self._file_lock:
+            journal_stat = _stat(self.journal_path)
+            before = None if journal_stat is None else (journal_stat[0], journal_stat[2])
+            with open(self.journal_path, "ab") as f:
+                f.write(lines.encode())
+                f.flush()
+                os.fsync(f.fileno())
+                after = (os.fstat(f.fileno()).st_ino, f.tell())
+            if before == self._journal:
+                self._journal = after
+            # Otherwise another process appended first and refresh reads both
+            if queued:
+                self._unwritten.remove(records)
+
+    def _unchanged(self):
+        """Whether the files are as this store last read or wrote them; a few stat calls."""
+        journal_stat = _stat(self.journal_path)
+        journal = None if journal_stat is None else (journal_stat[0], journal_stat[2])
+        return (_stat(self.path), _stat(self.compacting_path)) == self._files and journal == self._journal
+
+    def _catch_up(self):
+        """Apply what other processes wrote to the files; called with both locks held."""
+        if self._unchanged():
+            return False
+
+        journal_stat = _stat(self.journal_path)
+        unwritten = self._unwritten.records()
+        if (
+            (_stat(self.path), _stat(self.compacting_path)) == self._files
+            and journal_stat is not None and self._journal is not None
+            and journal_stat[0] == self._journal[0] and journal_stat[2] > self._journal[1]
+        ):
+            # Appended to: only the new lines are read
+            records, end = self._read_journal(self.journal_path, self._journal[1])
+            self._journal = (journal_stat[0], end)
+            self._journal_records += len(records)
+            # Queued edits are written after these, so they win
+            records = [
+                record for record in records
+                if _ordinal(record["key"]["Year"], record["key"]["Month"]) not in unwritten
+            ]
+            if not records:
+                return False
+            totals = self.totals.copy()
+            data, index = apply_records(self.data, dict(self._index), records, totals)
+            changed = _changed_ordinals(self.data, self._index, data, index, set(_record_ordinals(records)))
+        else:
+            # Compacted or replaced by another process: replay everything
+            data, index = self._replay()
+            if unwritten:
+                data, index = apply_records(data, index, list(unwritten.values()))
+            totals = None
+            changed = _changed_ordinals(self.data, self._index, data, index)
+
+        if not changed:
+            return False
+        self.data, self._index = data, index
+        self.totals = totals or RunningTotals.from_frame(data)
+        self.version += 1
+        for ordinal in changed:
+            self._key_versions[ordinal] = self.version
+        return True
+
+    def _write(self, records, expected_version):
+        with self._lock:
+            with self._file_lock:
+                # Writes from other processes land first so the check sees them
+                self._catch_up()
+                _check_stale(self._key_versions, records, expected_version)
+                if self._writer is None:
+                    self._append(records)
+            totals = self.totals.copy()
+            self.data, self._index = apply_records(self.data, self._index, records, totals)
+            self.totals = totals
+            self.version += 1
+            for ordinal in _record_ordinals(records):
+                self._key_versions[ordinal] = self.version
+            if self._writer is not None:
+                # Queued under the lock so the journal keeps the order of the versions
+                self._unwritten.add(records)
+                self._writer.submit(self.version, records)
+            self._journal_records += len(records)
+            compact = self._journal_records >= self.compact_after
+        if compact:
+            self.compact(background=True)
+        return self.data
+
+    def refresh(self):
+        """
+        Catch up with writes other processes made to the same files.
+
+        Costs a few stat calls when nothing changed. Appends are read from
+        where this store stopped; a snapshot compacted by another process
+        is replayed in full.
+
+        Returns:
+        bool: Whether the records changed, bumping the version
+        """
+        if self._unchanged():
+            return False
+        with self._lock, self._file_lock:
+            return self._catch_up()
+
+    def snapshot(self):
+        """The current (data, version) pair, read consistently."""
+        with self._lock:
+            return self.data, self.version
+
+    def running_totals(self):
+        """The current (RunningTotals, version) pair, read consistently."""
+        with self._lock:
+            return self.totals, self.version
+
+    def exists(self, year, month):
+        """Whether a record for (year, month) is stored."""
+        return _ordinal(year, month) in self._index
+
+    def durability(self):
+        """
+        How far writes have been persisted.
+
+        Returns:
+        dict: "version" (latest write), "durable_version" (latest write on
+            disk) and "error" (the last failed attempt, cleared once one succeeds)
+        """
+        with self._lock:
+            return _durability(self.version, self._writer)
+
+    def flush(self, timeout=None):
+        """Wait until every write is on disk; returns False on timeout."""
+        return self._writer is None or self._writer.drain(timeout)
+
+    def upsert(self, row, expected_version=None):
+        """Insert or replace the record for row's (Year, Month); returns the updated frame."""
+        return self._write(_batch_records([row], []), expected_version)
+
+    def delete(self, year, month, expected_version=None):
+        """Remove the record for (year, month); returns the updated frame."""
+        return self._write(_batch_records([], [(year, month)]), expected_version)
+
+    def write_batch(self, upserts=(), deletes=(), expected_version=None):
+        """
+        Apply several edits as one journal write and one version bump.
+
+        Parameters:
+        upserts (iterable): Rows to insert or replace, keyed by (Year, Month)
+        deletes (iterable): (year, month) pairs to remove
+        expected_version (int): Version the edits were made against; raises
+            StaleWriteError if any of their months changed after it
+
+        Returns:
+        DataFrame: The updated frame
+        """
+        return self._write(_batch_records(upserts, deletes), expected_version)
+
+    def compact(self, background=False):
+        """
+        Fold the journal into a new snapshot.
+
+        Parameters:
+        background (bool): Run on a daemon thread and return immediately
+        """
+        def replace(temp_path, path):
+            with self._file_lock:
+                if (_stat(self.path), _stat(self.compacting_path)) != set_aside:
+                    # Another process compacted meanwhile, and its snapshot covers this one
+                    os.remove(temp_path)
+                    return
+                os.replace(temp_path, path)
+                if os.path.exists(self.compacting_path):
+                    os.remove(self.compacting_path)
+                _fsync_directory(self.path)
+                self._files = (_stat(self.path), None)
+
+        def run():
+            write_snapshot(snapshot, self.path, replace)
+
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            with self._file_lock:
+                # The snapshot must cover every journaled edit, other processes' included
+                self._catch_up()
+                if os.path.exists(self.journal_path) and not os.path.exists(self.compacting_path):
+                    # New edits go to a fresh journal while the snapshot is written.
+                    # Every journaled edit is already in memory, so the snapshot
+                    # covers the renamed journal; queued ones go to the fresh journal.
+                    os.replace(self.journal_path, self.compacting_path)
+                    _fsync_directory(self.path)
+                    self._journal = None
+                self._files = set_aside = (_stat(self.path), _stat(self.compacting_path))
+            snapshot = self.data
+            self._journal_records = 0
+            if background:
+                self._compactor = threading.Thread(target=run, name="journal-compactor", daemon=True)
+                self._compactor.start()
+                return
+        run()
+
+
+_QUOTED_COLUMNS = ", ".join(f'"{column}"' for column in RECORD_COLUMNS)
+_UPSERT_SQL = (
+    f"INSERT INTO records ({_QUOTED_COLUMNS}) VALUES ({', '.join('?' * len(RECORD_COLUMNS))}) "
+    'ON CONFLICT ("Year", "Month") DO UPDATE SET '
+    + ", ".join(f'"{column}" = excluded."{column}"' for column in AMOUNT_COLUMNS + CURRENCY_COLUMNS)
+)
+
+
+def _record_values(row):
+    """row's values in RECORD_COLUMNS order; a missing currency is BASE_CURRENCY."""
+    currencies = [row.get(column) for column in CURRENCY_COLUMNS]
+    return [row[column] for column in COLUMNS] + [
+        currency if isinstance(currency, str) and currency else BASE_CURRENCY for currency in currencies
+    ]
+
+
+class SQLiteStore:
+    """
+    Monthly records in a SQLite table with a unique (Year, Month) index.
+
+    Parameters:
+    path (str): Database file path
+    write_delay (float): Commit on a WriteBehind thread after this many
+        seconds; None commits before each write returns
+    """
+
+    def __init__(self, path, write_delay=None):
+        self.path = path
+        self._lock = threading.Lock()
+        # Serializes use of the connection across threads
+        self._connection_lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        currency_columns = [f'"{column}" TEXT NOT NULL DEFAULT \'{BASE_CURRENCY}\'' for column in CURRENCY_COLUMNS]
+        columns = ", ".join(
+            ['"Month" TEXT NOT NULL', '"Year" INTEGER NOT NULL']
+            + [f'"{column}" REAL NOT NULL' for column in AMOUNT_COLUMNS]
+            + currency_columns
+        )
+        self._connection.execute(f"CREATE TABLE IF NOT EXISTS records ({columns})")
+        # Tables created before amounts had currencies get them in the base currency
+        existing = {row[1] for row in self._connection.execute("PRAGMA table_info(records)")}
+        for column, definition in zip(CURRENCY_COLUMNS, currency_columns):
+            if column not in existing:
+                self._connection.execute(f"ALTER TABLE records ADD COLUMN {definition}")
+        self._connection.execute(
+            'CREATE UNIQUE INDEX IF NOT EXISTS records_year_month ON records ("Year", "Month")'
+        )
+        self.version = 0
+        # Month ordinal -> version of the last write that changed it
+        self._key_versions = {}
+        self._unwritten = _Unwritten()
+        self.data = self._load()
+        self._index = record_index(self.data)
+        self.totals = RunningTotals.from_frame(self.data)
+        # Changes when another connection commits
+        self._data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+        self._writer = None if write_delay is None else WriteBehind(
+            lambda records: self._execute(records, queued=True), write_delay, "sqlite-writer"
+        )
+
+    def _load(self):
+        rows = self._connection.execute(f"SELECT {_QUOTED_COLUMNS} FROM records ORDER BY rowid").fetchall()
+        return compact_frame(pd.DataFrame(rows, columns=RECORD_COLUMNS)) if rows else empty_frame()
+
+    def _catch_up(self):
+        """Reload after another connection committed; called with both locks held."""
+        data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return False
+        self._data_version = data_version
+
+        data = self._load()
+        index = record_index(data)
+        unwritten = self._unwritten.records()
+        if unwritten:
+            # Queued edits commit after the other connection's, so they win
+            data, index = apply_records(data, index, list(unwritten.values()))
+        changed = _changed_ordinals(self.data, self._index, data, index)
+        if not changed:
+            return False
+        self.data, self._index = data, index
+        self.totals = RunningTotals.from_frame(data)
+        self.version += 1
+        for ordinal in changed:
+            self._key_versions[ordinal] = self.version
+        return True
+
+    def refresh(self):
+        """
+        Catch up with commits other processes made to the same database.
+
+        Costs one PRAGMA when nothing changed; otherwise the table is reloaded.
+
+        Returns:
+        bool: Whether the records changed, bumping the version
+        """
+        with self._lock, self._connection_lock:
+            return self._catch_up()
+
+    def snapshot(self):
+        """The current (data, version) pair, read consistently."""
+        with self._lock:
+            return self.data, self.version
+
+    def running_totals(self):
+        """The current (RunningTotals, version) pair, read consistently."""
+        with self._lock:
+            return self.totals, self.version
+
+    def exists(self, year, month):
+        """Whether a record for (year, month) is stored."""
+        return _ordinal(year, month) in self._index
+
+    def durability(self):
+        """
+        How far writes have been persisted.
+
+        Returns:
+        dict: "version" (latest write), "durable_version" (latest write
+            committed) and "error" (the last failed attempt, cleared once one succeeds)
+        """
+        with self._lock:
+            return _durability(self.version, self._writer)
+
+    def flush(self, timeout=None):
+        """Wait until every write is committed; returns False on timeout."""
+        return self._writer is None or self._writer.drain(timeout)
+
+    def write_frame(self, df):
+        """Upsert every row of df in a single transaction."""
+        rows = _storage_frame(df).itertuples(index=False, name=None)
+        # Queued writes land first so these rows replace them
+        self.flush()
+        with self._lock, self._connection_lock:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(_UPSERT_SQL, rows)
+            self._connection.execute("COMMIT")
+            data = self._load()
+            index = record_index(data)
+            self.version += 1
+            for ordinal in _changed_ordinals(self.data, self._index, data, index):
+                self._key_versions[ordinal] = self.version
+            self.data, self._index = data, index
+            self.totals = RunningTotals.from_frame(self.data)
+        return self.data
+
+    def upsert(self, row, expected_version=None):
+        """Insert or replace the record for row's (Year, Month); returns the updated frame."""
+        return self.write_batch([row], [], expected_version)
+
+    def delete(self, year, month, expected_version=None):
+        """Remove the record for (year, month); returns the updated frame."""
+        return self.write_batch([], [(year, month)], expected_version)
+
+    def write_batch(self, upserts=(), deletes=(), expected_version=None):
+        """
+        Apply several edits in one transaction and one version bump.
+
+        Parameters:
+        upserts (iterable): Rows to insert or replace, keyed by (Year, Month)
+        deletes (iterable): (year, month) pairs to remove
+        expected_version (int): Version the edits were made against; raises
+            StaleWriteError if any of their months changed after it
+
+        Returns:
+        DataFrame: The updated frame
+        """
+        records = _batch_records(upserts, deletes)
+        with self._lock:
+            with self._connection_lock:
+                # Commits from other processes land first so the check sees them
+                self._catch_up()
+            _check_stale(self._key_versions, records, expected_version)
+            if self._writer is None:
+                self._execute(records)
+            totals = self.totals.copy()
+            self.data, self._index = apply_records(self.data, self._index, records, totals)
+            self.totals = totals
+            self.version += 1
+            for ordinal in _record_ordinals(records):
+                self._key_versions[ordinal] = self.version
+            if self._writer is not None:
+                self._unwritten.add(records)
+                self._writer.submit(self.version, records)
+        return self.data
+
+    def _execute(self, records, queued=False):
+        """Apply journal records to the table in one transaction."""
+        with self._connection_lock:
+            self._connection.execute("BEGIN")
+            try:
+                for record in records:
+                    if record["op"] == "delete":
+                        self._connection.execute(
+                            'DELETE FROM records WHERE "Year" = ? AND "Month" = ?',
+                            _key(record["key"]["Year"], record["key"]["Month"])
+                        )
+                    else:
+                        self._connection.execute(
+                            _UPSERT_SQL, [_plain(value) for value in _record_values(record["row"])]
+                        )
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+            if queued:
+                self._unwritten.remove(records)
+
+    def compact(self, background=False):
+        """Checkpoint the write-ahead log into the database file."""
+        with self._connection_lock:
+            self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def open_store(path, write_delay=None):
+    """
+    Open the storage backend matching path's extension.
+
+    Parameters:
+    path (str): Records file
+    write_delay (float): Persist on a background thread after this many
+        seconds instead of before each write returns
+    """
+    if path.endswith((".sqlite", ".db")):
+        return SQLiteStore(path, write_delay)
+    if path.endswith(STORE_EXTENSIONS):
+        return JournaledStore(path, write_delay=write_delay)
+    raise ValueError(f"Unsupported storage file: {path}")
+
+
+def migrate(source, destination):
+    """
+    Copy every record from one storage file to another.
+
+    Parameters:
+    source (str): Existing storage file, any supported backend
+    destination (str): Target file; its backend is chosen by extension
+
+    Returns:
+    int: Number of records written
+    """
+    df = open_store(source).data
+    if destination.endswith((".sqlite", ".db")):
+        SQLiteStore(destination).write_frame(df)
+    else:
+        # A stale journal would otherwise be replayed over the new snapshot
+        for journal_path in (destination + ".journal", destination + ".journal.compacting"):
+            if os.path.exists(journal_path):
+                os.remove(journal_path)
+        write_snapshot(df, destination)
+    return len(df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Finance data storage tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = commands.add_parser("migrate", help="Convert records to another backend")
+    migrate_parser.add_argument("source")
+    migrate_parser.add_argument("destination")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        count = migrate(args.source, args.destination)
+        print(f"Migrated {count} records from {args.source} to {args.destination}")
+
+
+if __name__ == "__main__":
+    main()